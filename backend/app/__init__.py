@@ -20,12 +20,35 @@ def create_app(test_config=None):
     db.init_app(app)
     app.config["SESSION_SQLALCHEMY"] = db
 
+    from .event_log import events
+    events.init_app(app)
+
+    # With more than one worker, emits go through the message queue to reach every process
+    from .message_queue import queue_options
     socketio.init_app(app, cors_allowed_origins=[
         "https://dndtoolbox.com",
         "http://localhost:5173"
-    ])
+    ], **queue_options(app.config.get('SOCKETIO_MESSAGE_QUEUE')))
     migrate.init_app(app, db)
 
+    from .cluster import cluster
+    cluster.init_app(app)
+
+    from .passwords import passwords
+    passwords.init_app(app)
+
+    from .response_cache import responses
+    responses.init_app(app)
+
+    from .reference_data import reference
+    reference.init_app(app)
+
+    from .report_cache import report_results
+    report_results.init_app(app)
+
+    from .report_jobs import report_jobs
+    report_jobs.init_app(app)
+
     from flask_session import Session
     Session(app)
 
@@ -1,13 +1,69 @@
 from uuid import UUID
 from datetime import datetime
 from flask import Blueprint, jsonify, request, session
-from ..models import User, Campaign, Character, campaign_users
-from .. import db
+from sqlalchemy import exists, select
+from sqlalchemy.orm import aliased
+from ..models import User, Campaign, Character, campaign_invites, campaign_users
+from ..campaign_dashboard import campaign_audience, campaign_sorts, load_campaigns, load_invites
+from ..pagination import Page, PageError
+from ..membership import forget, membership
+from ..response_cache import responses
+from ..report_rollups import rollups
+from ..serializers import (
+    CampaignDetail, CampaignSummary, PartyMember, campaign_columns, campaign_summary, party_member_columns,
+    respond, with_race_and_class,
+)
+from ..notifications import (
+    campaign_room, invite_received, member_joined, notify_campaign, notify_user, resubscribe,
+    subscribe_to_campaign, unsubscribe_from_campaign
+)
+from ..bulk_transfer import TransferError, export, import_campaigns, transfer_format
+from ..cluster import cluster
+from .. import db, socketio
 
 ## Campaign routes
 
 campaign_bp = Blueprint('campaign', __name__, url_prefix='/campaign')
 
+# Most usernames one bulk_invite request may carry
+MAX_BULK_INVITES = 100
+
+def invite_usernames(campaign, usernames):
+    """Invite users to a campaign by username, returning {username: status} and the invited users' ids.
+
+    Usernames are resolved, checked against the campaign's members and invites and
+    inserted into campaign_invites as sets, two statements however many there are.
+    Status is one of invited, not_found, already_in_campaign or already_invited.
+    Does not commit.
+    """
+    member = exists().where(campaign_users.c.campaign_id == campaign.id, campaign_users.c.user_id == User.id)
+    invited = exists().where(campaign_invites.c.campaign_id == campaign.id, campaign_invites.c.user_id == User.id)
+    found = (
+        db.session.query(User.id, User.username, member.label('member'), invited.label('invited'))
+        .filter(User.username.in_(usernames))
+        .all()
+    )
+
+    statuses = dict.fromkeys(usernames, 'not_found')
+    new_ids = {}
+    for row in found:
+        if row.member:
+            statuses[row.username] = 'already_in_campaign'
+        elif row.invited:
+            statuses[row.username] = 'already_invited'
+        else:
+            statuses[row.username] = 'invited'
+            # Usernames aren't unique, the first match is invited as the single invite always did
+            new_ids.setdefault(row.username, row.id)
+
+    if new_ids:
+        db.session.execute(campaign_invites.insert().values([
+            {'campaign_id': campaign.id, 'user_id': invited_id} for invited_id in new_ids.values()
+        ]))
+        for invited_id in new_ids.values():
+            forget(campaign.id, invited_id)
+    return statuses, list(new_ids.values())
+
 @campaign_bp.route('/create_campaign', methods=['POST'])
 def create_campaign():
     user_id = UUID(session.get('user_id'))
@@ -59,8 +115,11 @@ def create_campaign():
 
         campaign_user = campaign_users.insert().values(campaign_id=new_campaign.id, user_id=dm_id)
         db.session.execute(campaign_user)
+        rollups.campaigns(Campaign.id == new_campaign.id)
 
         db.session.commit()
+        responses.invalidate([dm_id])
+        subscribe_to_campaign(dm_id, new_campaign.id)
 
         return jsonify({
             "message": f"Campaign {new_campaign.name} created successfully!",
@@ -86,11 +145,12 @@ def edit_campaign(campaign_id):
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
     
-    user = User.query.get(UUID(user_id))
+    user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    campaign = Campaign.query.get(UUID(campaign_id))
+    # Locked until commit, so a concurrent edit or delete can't take the same old values off the rollups
+    campaign = db.session.get(Campaign, UUID(campaign_id), with_for_update=True, populate_existing=True)
     if not campaign:
         return jsonify({"error": "Campaign not found"}), 404
     
@@ -120,6 +180,7 @@ def edit_campaign(campaign_id):
     except ValueError:
         return jsonify({"error": "Invalid date or time format"}), 400
     
+    rollups.campaigns(Campaign.id == campaign.id, -1)
     campaign.name = name
     campaign.description = description
     campaign.start_date = start_date
@@ -129,7 +190,10 @@ def edit_campaign(campaign_id):
     campaign.meeting_frequency = meeting_frequency
 
     try:
+        db.session.flush()
+        rollups.campaigns(Campaign.id == campaign.id)
         db.session.commit()
+        responses.invalidate(campaign_audience([campaign.id]))
 
         return jsonify({
             "message": f"Campaign {campaign.name} updated successfully!",
@@ -161,7 +225,8 @@ def delete_campaign(campaign_id):
     
     campaign_id = UUID(campaign_id)
 
-    campaign = Campaign.query.get(campaign_id)
+    # Locked until commit, as in edit_campaign
+    campaign = db.session.get(Campaign, campaign_id, with_for_update=True, populate_existing=True)
     if not campaign:
         return jsonify({"error": "Campaign not found"}), 404
     
@@ -169,9 +234,13 @@ def delete_campaign(campaign_id):
     if user.id != campaign.dm_id:
         return jsonify({"error": "User is not the DM of the campaign"}), 403
     
+    audience = campaign_audience([campaign.id])
     try:
+        rollups.campaigns(Campaign.id == campaign.id, -1)
         db.session.delete(campaign)
         db.session.commit()
+        responses.invalidate(audience)
+        socketio.close_room(campaign_room(campaign_id))
 
         return jsonify({
             "message": f"Campaign {campaign.name} deleted successfully!"
@@ -186,7 +255,7 @@ def leave_campaign(campaign_id):
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
     
-    user = User.query.get(UUID(user_id))
+    user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
@@ -197,13 +266,23 @@ def leave_campaign(campaign_id):
         return jsonify({"error": "Campaign not found"}), 404
     
     # Check if user is a player in the campaign
-    if user not in campaign.players:
+    if not membership(campaign.id, user.id).is_member:
         return jsonify({"error": "User is not a player in the campaign"}), 403
     
+    audience = campaign_audience([campaign.id])
     try:
         # Remove user from campaign
-        campaign.players.remove(user)
+        rollups.memberships(
+            (campaign_users.c.campaign_id == campaign.id) & (campaign_users.c.user_id == user.id), -1
+        )
+        db.session.execute(campaign_users.delete().where(
+            (campaign_users.c.campaign_id == campaign.id) &
+            (campaign_users.c.user_id == user.id)
+        ))
         db.session.commit()
+        forget(campaign.id, user.id)
+        responses.invalidate(audience)
+        unsubscribe_from_campaign(user.id, campaign.id)
 
         return jsonify({
             "message": f"User {user.username} left campaign {campaign.name}!"
@@ -229,11 +308,12 @@ def remove_character(campaign_id, character_id):
         return jsonify({"error": "Campaign not found"}), 404
     
     # Check if user is a player in the campaign
-    if user not in campaign.players:
+    standing = membership(campaign.id, user.id)
+    if not standing.is_member:
         return jsonify({"error": "User is not a player in the campaign"}), 403
     
     # Check if user is the DM of the campaign
-    if user.id != campaign.dm_id:
+    if not standing.is_dm:
         return jsonify({"error": "User is not the DM of the campaign"}), 403
     
     character_id = UUID(character_id)
@@ -248,11 +328,15 @@ def remove_character(campaign_id, character_id):
     
     try:
         # Remove character from campaign
+        rollups.memberships(
+            (campaign_users.c.campaign_id == campaign.id) & (campaign_users.c.character_id == character.id), -1
+        )
         db.session.execute(campaign_users.delete().where(
             (campaign_users.c.campaign_id == campaign.id) & 
             (campaign_users.c.character_id == character.id)
         ))
         db.session.commit()
+        responses.invalidate(campaign_audience([campaign.id]))
 
         return jsonify({
             "message": f"Character {character.name} removed from campaign {campaign.name}!"
@@ -271,72 +355,18 @@ def get_campaigns():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Get campaigns where the user is a player or DM
-    campaigns = user.player_campaigns + user.dm_campaigns
-
-    # Get DM usernames for each campaign
-    dm_usernames = {dm.id: dm.username for dm in User.query.filter(
-        User.id.in_([campaign.dm_id for campaign in campaigns])
-    ).all()}
-
-    # Get characters for each campaign
-    campaign_characters = (
-        db.session.query(campaign_users.c.campaign_id, Character, User.username)
-        .join(Character, campaign_users.c.character_id == Character.id)
-        .join(User, campaign_users.c.user_id == User.id)
-        .filter(campaign_users.c.campaign_id.in_([campaign.id for campaign in campaigns]))
-        .all()
-    )
+    try:
+        page = Page.from_args(request.args, campaign_sorts)
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Organize character data
-    campaign_character_map = {}
-    for campaign_id, character, username in campaign_characters:
-        if campaign_id not in campaign_character_map:
-            campaign_character_map[campaign_id] = []
-        campaign_character_map[campaign_id].append({
-            "id": character.id,
-            "name": character.name,
-            "gender": character.gender,
-            "race_id": character.race_id,
-            "race": character.race.name,
-            "class_id": character.class_id,
-            "classType": character.class_type.name,
-            "level": character.level,
-            "marker_color": character.marker_color,
-            "size": character.size,
-        })
-
-    
-    campaign_maps = {
-        c.id: [
-            {
-                "id": str(m.id),
-                "name": m.name,
-                "owner_id": str(m.owner_id),
-                "campaign_id": str(m.campaign_id),
-                "is_open": m.is_open
-            } for m in c.maps
-        ] for c in campaigns
-    }
+    # Campaigns where the user is a player or DM, with characters and maps, in a fixed number of queries.
+    # The plain list is what the frontend polls, so only that is cached
+    if not request.args:
+        return responses.respond('campaigns', user.id, lambda: {"campaigns": load_campaigns(user.id)[0]})
 
-    return jsonify({
-        "campaigns": [
-            {
-                "id": str(campaign.id),
-                "name": campaign.name,
-                "description": campaign.description,
-                "dm": dm_usernames.get(campaign.dm_id),
-                "char_count": len(campaign_character_map.get(campaign.id, [])),
-                "characters": campaign_character_map.get(campaign.id, []),  # List of characters
-                "start_date": str(campaign.start_date),
-                "end_date": str(campaign.end_date) if campaign.end_date else None,
-                "meeting_time": campaign.meeting_time.strftime('%H:%M'),
-                "meeting_day": campaign.meeting_day,
-                "meeting_frequency": campaign.meeting_frequency,
-                "maps": campaign_maps.get(campaign.id, [])
-            } for campaign in campaigns
-        ]
-    }), 200
+    campaigns, next_cursor = load_campaigns(user.id, page)
+    return respond(page.body("campaigns", campaigns, next_cursor))
 
 @campaign_bp.route('/get_campaign/<string:campaign_id>', methods=['GET'])
 def get_campaign(campaign_id):
@@ -349,47 +379,28 @@ def get_campaign(campaign_id):
         return jsonify({"error": "User not found"}), 404
     
     campaign_id = UUID(campaign_id)
-    
-    campaign = Campaign.query.get(campaign_id)
-    if not campaign:
-        return jsonify({"error": "Campaign not found"}), 404
-    
+
     # Check if user is a player or DM of the campaign
-    if user not in campaign.players and user.id != campaign.dm_id:
+    standing = membership(campaign_id, user.id)
+    if not standing:
+        return jsonify({"error": "Campaign not found"}), 404
+    if not standing.is_member and not standing.is_dm:
         return jsonify({"error": "User is not a player or DM of the campaign"}), 403
-    
-    # Get DM username
-    dm_username = User.query.get(campaign.dm_id).username
 
-    # Get characters for the campaign
-    characters = db.session.query(Character).join(campaign_users, campaign_users.c.character_id == Character.id).filter(campaign_users.c.campaign_id == campaign.id).all()
+    dm = aliased(User)
+    campaign = db.session.execute(
+        select(*campaign_columns(dm)).join(dm, dm.id == Campaign.dm_id).where(Campaign.id == campaign_id)
+    ).one()
+    characters = db.session.execute(
+        with_race_and_class(
+            select(*party_member_columns)
+            .join_from(campaign_users, Character, campaign_users.c.character_id == Character.id)
+        ).where(campaign_users.c.campaign_id == campaign_id)
+    )
 
-    return jsonify({
-        "campaign": {
-            "id": str(campaign.id),
-            "name": campaign.name,
-            "description": campaign.description,
-            "dm": dm_username,
-            "start_date": str(campaign.start_date),
-            "end_date": str(campaign.end_date) if campaign.end_date else None,
-            "meeting_time": campaign.meeting_time.strftime('%H:%M'),
-            "meeting_day": campaign.meeting_day,
-            "meeting_frequency": campaign.meeting_frequency,
-            "characters": [
-                {
-                    "id": str(character.id),
-                    "name": character.name,
-                    "gender": character.gender,
-                    "race_id": str(character.race_id),
-                    "race": character.race.name,
-                    "class_id": str(character.class_id),
-                    "classType": character.class_type.name,
-                    "level": character.level,
-                    "marker_color": character.marker_color
-                } for character in characters
-            ]
-        }
-    }), 200
+    return respond({
+        "campaign": campaign_summary(campaign, CampaignDetail, characters=[PartyMember(*row) for row in characters])
+    })
 
 @campaign_bp.route('/invite', methods=['POST'])
 def invite():
@@ -420,27 +431,73 @@ def invite():
     if user.id != campaign.dm_id:
         return jsonify({"error": "User is not the DM of the campaign"}), 403
 
-    invited_user = User.query.filter_by(username=username).first()
-    if not invited_user:
-        return jsonify({"error": "User not found"}), 404
-
-    # Check if user is already in the campaign
-    if invited_user in campaign.players:
-        return jsonify({"error": "User is already in the campaign"}), 400
-
-    # Check if user has already been invited to the campaign
-    if invited_user in campaign.invited_users:
-        return jsonify({"error": "User has already been invited to the campaign"}), 400
-    
-    campaign.invited_users.append(invited_user)
     try:
+        statuses, invited_ids = invite_usernames(campaign, [username])
+        status = statuses[username]
+        if status == 'not_found':
+            return jsonify({"error": "User not found"}), 404
+        if status == 'already_in_campaign':
+            return jsonify({"error": "User is already in the campaign"}), 400
+        if status == 'already_invited':
+            return jsonify({"error": "User has already been invited to the campaign"}), 400
+
         db.session.commit()
+        responses.invalidate(invited_ids, kinds=('invites',))
+        notify_user(invited_ids[0], 'invite_received', invite_received(campaign))
         return jsonify({
-            "message": f"User {invited_user.username} invited to campaign {campaign.name}!"
+            "message": f"User {username} invited to campaign {campaign.name}!"
         }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+@campaign_bp.route('/bulk_invite', methods=['POST'])
+def bulk_invite():
+    user_id = UUID(session.get('user_id'))
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    data = request.get_json()
+
+    # Required fields validation
+    required_fields = ['campaign_id', 'usernames']
+    missing_fields = [field for field in required_fields if not data.get(field)]
+    if missing_fields:
+        return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
+
+    usernames = data.get('usernames')
+    if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+        return jsonify({"error": "usernames must be a list of usernames"}), 400
+    # Keep the first occurrence of each, in the order given
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > MAX_BULK_INVITES:
+        return jsonify({"error": f"At most {MAX_BULK_INVITES} usernames per request"}), 400
+
+    campaign = Campaign.query.get(UUID(data.get('campaign_id')))
+    if not campaign:
+        return jsonify({"error": "Campaign not found"}), 404
+
+    # Check if user is the DM of the campaign
+    if user_id != campaign.dm_id:
+        return jsonify({"error": "User is not the DM of the campaign"}), 403
+
+    try:
+        statuses, invited_ids = invite_usernames(campaign, usernames)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    responses.invalidate(invited_ids, kinds=('invites',))
+    if invited_ids:
+        invite = invite_received(campaign)
+        for invited_id in invited_ids:
+            notify_user(invited_id, 'invite_received', invite)
+
+    return jsonify({
+        "message": f"{len(invited_ids)} of {len(usernames)} users invited to campaign {campaign.name}!",
+        "results": [{"username": username, "status": statuses[username]} for username in usernames]
+    }), 200
     
 @campaign_bp.route('/get_invites', methods=['GET'])
 def get_invites():
@@ -452,29 +509,17 @@ def get_invites():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Get campaigns where the user has been invited
-    campaigns = user.invited_campaigns
+    try:
+        page = Page.from_args(request.args, campaign_sorts)
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Get DM usernames for each campaign
-    dm_usernames = {dm.id: dm.username for dm in User.query.filter(
-        User.id.in_([campaign.dm_id for campaign in campaigns])
-    ).all()}
+    # Campaigns where the user has been invited
+    if not request.args:
+        return responses.respond('invites', user.id, lambda: {"invites": load_invites(user.id)[0]})
 
-    return jsonify({
-        "invites": [
-            {
-                "id": str(campaign.id),
-                "name": campaign.name,
-                "description": campaign.description,
-                "dm": dm_usernames.get(campaign.dm_id),
-                "start_date": str(campaign.start_date),
-                "end_date": str(campaign.end_date) if campaign.end_date else None,
-                "meeting_time": campaign.meeting_time.strftime('%H:%M'),
-                "meeting_day": campaign.meeting_day,
-                "meeting_frequency": campaign.meeting_frequency
-            } for campaign in campaigns
-        ]
-    }), 200
+    invites, next_cursor = load_invites(user.id, page)
+    return respond(page.body("invites", invites, next_cursor))
 
 @campaign_bp.route('/accept_invite', methods=['POST'])
 def accept_invite():
@@ -502,7 +547,7 @@ def accept_invite():
         return jsonify({"error": "Campaign not found"}), 404
 
     # Check if user has been invited to the campaign
-    if user not in campaign.invited_users:
+    if not membership(campaign.id, user.id).is_invited:
         return jsonify({"error": "User has not been invited to the campaign"}), 403
 
     character = Character.query.get(character_id)
@@ -513,7 +558,18 @@ def accept_invite():
         db.session.execute(
             campaign_users.insert().values(campaign_id=campaign.id, character_id=character.id, user_id=user.id)
         )
-        campaign.invited_users.remove(user)
+        rollups.memberships(
+            (campaign_users.c.campaign_id == campaign.id) & (campaign_users.c.user_id == user.id)
+        )
+        db.session.execute(campaign_invites.delete().where(
+            (campaign_invites.c.campaign_id == campaign.id) &
+            (campaign_invites.c.user_id == user.id)
+        ))
+        db.session.commit()
+        forget(campaign.id, user.id)
+        responses.invalidate(campaign_audience([campaign.id]))
+        subscribe_to_campaign(user.id, campaign.id)
+        notify_campaign(campaign.id, 'campaign_member_joined', member_joined(campaign, user, character), skip_sid=cluster.user_socket(user.id))
 
         return jsonify({
             "message": f"User {user.username} accepted invite to campaign {campaign.name}!"
@@ -547,16 +603,68 @@ def decline_invite():
         return jsonify({"error": "Campaign not found"}), 404
 
     # Check if user has been invited to the campaign
-    if user not in campaign.invited_users:
+    if not membership(campaign.id, user.id).is_invited:
         return jsonify({"error": "User has not been invited to the campaign"}), 403
     
     try:
-        campaign.invited_users.remove(user)
+        db.session.execute(campaign_invites.delete().where(
+            (campaign_invites.c.campaign_id == campaign.id) &
+            (campaign_invites.c.user_id == user.id)
+        ))
         db.session.commit()
+        forget(campaign.id, user.id)
+        responses.invalidate([user.id], kinds=('invites',))
 
         return jsonify({
             "message": f"User {user.username} declined invite to campaign {campaign.name}!"
         }), 200
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+@campaign_bp.route('/export', methods=['GET'])
+def export_campaigns():
+    user_id = UUID(session.get('user_id'))
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    try:
+        format = transfer_format(request.args)
+    except TransferError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The campaigns the user runs
+    dm = aliased(User)
+    campaigns = select(*campaign_columns(dm)).join(dm, dm.id == Campaign.dm_id).where(Campaign.dm_id == user_id)
+    return export(campaigns, CampaignSummary, format, 'campaigns', serialize=campaign_summary)
+
+@campaign_bp.route('/import', methods=['POST'])
+def import_campaigns_route():
+    user_id = UUID(session.get('user_id'))
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        format = transfer_format(request.args, request.mimetype)
+    except TransferError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Every row becomes a campaign the user runs
+    try:
+        count, errors = import_campaigns(request.stream, format, user.id)
+        if errors:
+            db.session.rollback()
+            return jsonify({"error": "Nothing was imported, some rows are invalid", "errors": errors}), 400
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    responses.invalidate([user.id])
+    resubscribe(user.id)
+
+    return jsonify({"message": f"Imported {count} campaigns", "imported": count}), 201
@@ -1,12 +1,24 @@
 from flask import Blueprint, request, jsonify, session
 from app import db
-from app.models import ClassType, User, Character, Race
+from app.models import User, Character, campaign_users
+from app.campaign_dashboard import campaign_audience, character_campaigns
+from app.response_cache import responses
+from app.pagination import Page, PageError
+from app.reference_data import reference
+from app.report_rollups import rollups
+from app.serializers import CharacterSheet, character_sheets, respond
+from app.bulk_transfer import TransferError, export, import_characters, transfer_format
 from uuid import UUID
 
 ## Character routes
 
 character_bp = Blueprint('character', __name__, url_prefix='/character')
 
+character_sorts = {
+    'name': Character.name,
+    'level': Character.level,
+}
+
 @character_bp.route('/create_character', methods=['POST'])
 def create_character():
     user_id = UUID(session.get('user_id'))
@@ -28,19 +40,19 @@ def create_character():
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    class_type = ClassType.query.filter_by(id=class_id).first()
-    if not class_type:
+    class_name = reference.classes.name(class_id)
+    if not class_name:
         return jsonify({"error": "Class not found"}), 404
     
-    race = Race.query.filter_by(id=race_id).first()
-    if not race:
+    race_name = reference.races.name(race_id)
+    if not race_name:
         return jsonify({"error": "Race not found"}), 404
 
     new_character = Character(
         name=name,
         gender=gender,
-        race_id=race.id,
-        class_id=class_type.id,
+        race_id=UUID(race_id),
+        class_id=UUID(class_id),
         level=level,
         user_id=user.id,
         speed=speed,
@@ -49,6 +61,8 @@ def create_character():
     )
 
     db.session.add(new_character)
+    db.session.flush()
+    rollups.characters(Character.id == new_character.id)
     db.session.commit()
 
     return jsonify({
@@ -57,8 +71,8 @@ def create_character():
             "id": str(new_character.id),
             "name": new_character.name,
             "gender": new_character.gender,
-            "race": new_character.race.name,
-            "class_type": new_character.class_type.name,
+            "race": race_name,
+            "class_type": class_name,
             "level": new_character.level,
             "user_id": str(new_character.user_id),
             "speed": new_character.speed,
@@ -77,26 +91,15 @@ def get_characters():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    characters = Character.query.filter_by(user_id=user.id).all()
+    try:
+        page = Page.from_args(request.args, character_sorts)
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify({
-        "characters": [
-            {
-                "id": str(character.id),
-                "name": character.name,
-                "gender": character.gender,
-                "race_id": character.race_id,
-                "race": character.race.name,
-                "class_id": character.class_id,
-                "classType": character.class_type.name,
-                "level": character.level,
-                "user_id": str(character.user_id),
-                "speed": character.speed,
-                "size": character.size,
-                "marker_color": character.marker_color
-            } for character in characters
-        ]
-    }), 200
+    characters = db.session.execute(page.apply(character_sheets(Character.user_id == user.id), Character.id)).all()
+    characters, next_cursor = page.split(characters, lambda row: (getattr(row, page.sort), row.id))
+
+    return respond(page.body("characters", [CharacterSheet(*row) for row in characters], next_cursor))
 
 @character_bp.route('/get_character/<string:character_id>', methods=['GET'])
 def get_character(character_id):
@@ -110,29 +113,14 @@ def get_character(character_id):
     
     character_id = UUID(character_id)
 
-    character = Character.query.get(character_id)
+    character = db.session.execute(character_sheets(Character.id == character_id)).first()
     if not character:
         return jsonify({"error": "Character not found"}), 404
 
     if character.user_id != user.id:
         return jsonify({"error": "Character does not belong to user"}), 403
 
-    return jsonify({
-        "character": {
-            "id": str(character.id),
-            "name": character.name,
-            "gender": character.gender,
-            "race_id": str(character.race_id),
-            "race": character.race.name,
-            "class_id": str(character.class_id),
-            "classType": character.class_type.name,
-            "level": character.level,
-            "user_id": str(character.user_id),
-            "speed": character.speed,
-            "size": character.size,
-            "marker_color": character.marker_color
-        }
-    }), 200
+    return respond({"character": CharacterSheet(*character)})
 
 @character_bp.route('/edit_character/<string:character_id>', methods=['PUT'])
 def update_character(character_id):
@@ -146,7 +134,8 @@ def update_character(character_id):
     
     character_id = UUID(character_id)
 
-    character = Character.query.get(character_id)
+    # Locked until commit, so a concurrent edit or delete can't take the same old values off the rollups
+    character = db.session.get(Character, character_id, with_for_update=True, populate_existing=True)
     if not character:
         return jsonify({"error": "Character not found"}), 404
 
@@ -164,24 +153,29 @@ def update_character(character_id):
     size = data.get('size', character.size)
     marker_color = data.get('markerColor', character.marker_color)
 
-    class_type = ClassType.query.filter_by(id=class_id).first()
-    if not class_type:
+    class_name = reference.classes.name(class_id)
+    if not class_name:
         return jsonify({"error": "Class not found"}), 404
     
-    race = Race.query.filter_by(id=race_id).first()
-    if not race:
+    race_name = reference.races.name(race_id)
+    if not race_name:
         return jsonify({"error": "Race not found"}), 404
 
+    rollups.characters(Character.id == character.id, -1)
     character.name = name
     character.gender = gender
-    character.race_id = race.id
-    character.class_id = class_type.id
+    character.race_id = UUID(race_id)
+    character.class_id = UUID(class_id)
     character.level = level
     character.speed = speed
     character.size = size
     character.marker_color = marker_color
+    db.session.flush()
+    rollups.characters(Character.id == character.id)
 
     db.session.commit()
+    # Campaign dashboards list the character's name, race, class and level
+    responses.invalidate(campaign_audience(character_campaigns(character.id)))
 
     return jsonify({
         "message": f"Character {character.name} updated successfully!",
@@ -203,15 +197,21 @@ def delete_character(character_id):
     
     character_id = UUID(character_id)
 
-    character = Character.query.get(character_id)
+    # Locked until commit, so a concurrent edit or delete can't take the same old values off the rollups
+    character = db.session.get(Character, character_id, with_for_update=True, populate_existing=True)
     if not character:
         return jsonify({"error": "Character not found"}), 404
 
     if character.user_id != user.id:
         return jsonify({"error": "Character does not belong to user"}), 403
 
+    audience = campaign_audience(character_campaigns(character.id))
+    # Its campaign seats stay, without a character, so they no longer count in the reports
+    rollups.memberships(campaign_users.c.character_id == character.id, -1)
+    rollups.characters(Character.id == character.id, -1)
     db.session.delete(character)
     db.session.commit()
+    responses.invalidate(audience)
 
     return jsonify({
         "message": f"Character {character.name} deleted successfully!"
@@ -219,44 +219,54 @@ def delete_character(character_id):
 
 @character_bp.route('/get_races', methods=['GET'])
 def get_races():
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
+    if not session.get('user_id'):
         return jsonify({"error": "User not logged in"}), 401
-    
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-    
-    races = Race.query.order_by(Race.name).all()
 
-    return jsonify({
-        "races": [
-            {
-                "id": str(race.id),
-                "name": race.name,
-                "description": race.description
-            } for race in races
-        ]
-    }), 200
+    return reference.respond(reference.races)
 
 @character_bp.route('/get_classes', methods=['GET'])
 def get_classes():
+    if not session.get('user_id'):
+        return jsonify({"error": "User not logged in"}), 401
+
+    return reference.respond(reference.classes)
+
+@character_bp.route('/export', methods=['GET'])
+def export_characters():
     user_id = UUID(session.get('user_id'))
     if not user_id:
         return jsonify({"error": "User not logged in"}), 401
-    
+
+    try:
+        format = transfer_format(request.args)
+    except TransferError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return export(character_sheets(Character.user_id == user_id), CharacterSheet, format, 'characters')
+
+@character_bp.route('/import', methods=['POST'])
+def import_characters_route():
+    user_id = UUID(session.get('user_id'))
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
-    
-    classes = ClassType.query.order_by(ClassType.name).all()
 
-    return jsonify({
-        "classes": [
-            {
-                "id": str(class_type.id),
-                "name": class_type.name,
-                "description": class_type.description
-            } for class_type in classes
-        ]
-    }), 200
\ No newline at end of file
+    try:
+        format = transfer_format(request.args, request.mimetype)
+    except TransferError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        count, errors = import_characters(request.stream, format, user.id)
+        if errors:
+            db.session.rollback()
+            return jsonify({"error": "Nothing was imported, some rows are invalid", "errors": errors}), 400
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+    return jsonify({"message": f"Imported {count} characters", "imported": count}), 201
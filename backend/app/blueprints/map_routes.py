@@ -1,6 +1,14 @@
-from ..socket_events import socketio, user_sockets
+from ..socket_events import socketio
 from flask import Blueprint, jsonify, request, session
-from ..models import Map, User
+from sqlalchemy import select
+from ..models import Campaign, Map, User, campaign_users
+from ..campaign_dashboard import campaign_audience
+from ..cluster import cluster
+from ..map_rooms import dispatch
+from ..notifications import map_summary, notify_campaign
+from ..pagination import Page, PageError
+from ..response_cache import responses
+from ..serializers import MapListing, map_listing_columns, respond
 from .. import db
 from uuid import UUID
 
@@ -8,6 +16,10 @@ from uuid import UUID
 
 map_bp = Blueprint('map', __name__, url_prefix='/map')
 
+map_sorts = {
+    'name': Map.name,
+}
+
 @map_bp.route('/get_dm_maps', methods=['GET'])
 def get_dm_maps():
     user_id = UUID(session.get('user_id'))
@@ -18,19 +30,21 @@ def get_dm_maps():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    campaigns = user.dm_campaigns
-    maps = Map.query.filter(Map.campaign_id.in_([campaign.id for campaign in campaigns])).all()
+    try:
+        page = Page.from_args(request.args, map_sorts)
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
 
-    maps_data = [
-        {
-            "id": str(map.id),
-            "name": map.name,
-            "campaign_id": str(map.campaign_id),
-        }
-        for map in maps
-    ]
+    # Maps in the campaigns the user runs
+    maps = db.session.execute(page.apply(
+        select(*map_listing_columns)
+        .join(Campaign, Campaign.id == Map.campaign_id)
+        .where(Campaign.dm_id == user.id),
+        Map.id
+    )).all()
+    maps, next_cursor = page.split(maps, lambda map: (map.name, map.id))
 
-    return jsonify({"maps": maps_data}), 200
+    return respond(page.body("maps", [MapListing(*map) for map in maps], next_cursor))
 
 @map_bp.route('/get_player_maps', methods=['GET'])
 def get_player_maps():
@@ -42,20 +56,14 @@ def get_player_maps():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    campaigns = user.player_campaigns
-    maps = Map.query.filter(Map.campaign_id.in_([campaign.id for campaign in campaigns])).all()
-
-    maps_data = [
-        {
-            "id": str(map.id),
-            "name": map.name,
-            "campaign_id": str(map.campaign_id),
-        }
-        for map in maps
-    ]
-
-    return jsonify({"maps": maps_data}), 200
+    # Maps in the campaigns the user plays in with a character
+    maps = db.session.execute(
+        select(*map_listing_columns)
+        .join(campaign_users, campaign_users.c.campaign_id == Map.campaign_id)
+        .where(campaign_users.c.user_id == user.id, campaign_users.c.character_id != None)
+    )
 
+    return respond({"maps": [MapListing(*map) for map in maps]})
 
 @map_bp.route('/save_state', methods=['POST'])
 def save_map_state():
@@ -80,6 +88,9 @@ def save_map_state():
     map.lines = lines
     db.session.commit()
 
+    # Keep the live room in step so the next flush doesn't overwrite the save
+    dispatch(map_id, 'replace', markers=markers, lines=lines)
+
     return jsonify({"message": "Map state saved successfully."}), 200
 
 @map_bp.route('set_visibility/<string:map_id>', methods=['POST'])
@@ -105,6 +116,7 @@ def set_visibility(map_id):
 
     map.is_open = visible
     db.session.commit()
+    responses.invalidate(campaign_audience([map.campaign_id]))
 
     # If visibility is being turned off, notify all connected players
     if not visible:
@@ -112,8 +124,13 @@ def set_visibility(map_id):
             'map_force_closed',
             {'message': 'The DM has closed the map.'},
             room=f'map_{map.id}',
-            skip_sid=user_sockets.get(user_id, []),
+            skip_sid=cluster.user_socket(user_id),
         )
+        # Closing the map ends the room, so persist and drop its in-memory state
+        dispatch(map.id, 'close', players_only=True)
+        db.session.refresh(map)
+
+    notify_campaign(map.campaign_id, 'map_visibility_changed', map_summary(map), skip_sid=cluster.user_socket(user_id))
 
     return jsonify({
         "message": f"Map {map.name} is now {'open' if visible else 'closed'}.",
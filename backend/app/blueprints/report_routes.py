@@ -1,7 +1,15 @@
-from flask import Blueprint, request, jsonify, session
-from sqlalchemy import text
+from flask import Blueprint, current_app, request, jsonify, session, stream_with_context
+from sqlalchemy import Integer, bindparam, literal_column, text
 from app import db
+from app.models import Campaign, Character, ClassType, Race, User
+from app.pagination import Page, PageError
+from app.report_cache import report_results
+from app.report_jobs import JobQueueFull, report_jobs
+from app.report_rollups import MEETING_DAYS, MEETING_FREQUENCIES, days_between_sql, report_scopes, rollups
+from app.serializers import ReportCampaign, ReportCharacter, ReportPartyMember, encoder, respond
 from datetime import datetime
+import json
+import msgspec
 import pytz
 
 def extract_date(iso_str):
@@ -16,12 +24,76 @@ def extract_time(iso_str):
 
 report_bp = Blueprint('report', __name__, url_prefix='/report')
 
-@report_bp.route('/generate_campaign', methods=['POST'])
-def generate_campaign():
-    data = request.get_json()
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
-
+# Sort keys for the report tables (sort, order, limit and cursor go in the request body,
+# see pagination.py), as SQL over the report queries' aliases
+campaign_report_sorts = {
+    'name': literal_column('c.name', Campaign.name.type),
+    'start_date': literal_column('c.start_date', Campaign.start_date.type),
+    'meeting_time': literal_column('c.meeting_time', Campaign.meeting_time.type),
+    'dm': literal_column('u.username', User.username.type),
+    'char_count': literal_column('COALESCE(cc.char_count, 0)', Integer()),
+}
+
+character_report_sorts = {
+    'name': literal_column('ch.name', Character.name.type),
+    'level': literal_column('ch.level', Character.level.type),
+    'race': literal_column('r.name', Race.name.type),
+    'class_type': literal_column('ct.name', ClassType.name.type),
+    'owner': literal_column('u.username', User.username.type),
+}
+
+# Report body keys holding a date or a time of day, and the defaults of the sort options
+report_dates = {'startDateStart', 'startDateEnd', 'endDateStart', 'endDateEnd'}
+report_times = {'meetingTimeStart', 'meetingTimeEnd'}
+report_defaults = {'sort': 'name', 'order': 'asc'}
+
+def normalized_filters(data):
+    """A report body as the report queries read it, or None if it can't be read.
+
+    Empty filters and default options are left out, list filters are deduplicated and
+    sorted, and dates and times are reduced to the values extract_date and
+    extract_time give, so requests for the same report normalize the same way.
+    """
+    try:
+        filters = {}
+        for key, value in data.items():
+            # Anything but lax search mode is strict
+            if not value or report_defaults.get(key) == value or (key == 'searchMode' and value != 'lax'):
+                continue
+            if key in report_dates:
+                value = extract_date(value).isoformat()
+            elif key in report_times:
+                value = extract_time(value).strftime("%H:%M:%S")
+            elif isinstance(value, list):
+                value = sorted({json.dumps(item, sort_keys=True) for item in value})
+            filters[key] = value
+        return filters
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def keyset_sql(page, id_sql):
+    """SQL and bind params for ordering a report by page's sort key and starting after its cursor."""
+    direction = 'DESC' if page.descending else 'ASC'
+    order_by = f"{page.column} {direction}, {id_sql} {direction}"
+    if not page.after:
+        return "TRUE", order_by, [], {}
+
+    after = f"({page.column}, {id_sql}) {'<' if page.descending else '>'} (:after_key, :after_id)"
+    bindparams = [bindparam('after_key', type_=page.column.type), bindparam('after_id', type_=Campaign.id.type)]
+    return after, order_by, bindparams, {'after_key': page.after[0], 'after_id': page.after[1]}
+
+# Filters the report rollups keep totals for, and their scope prefixes
+campaign_rollup_filters = {'meetingDay': 'day', 'meetingFrequency': 'frequency'}
+character_rollup_filters = {'race': 'race', 'classType': 'class'}
+
+def campaign_report_sql(data, page):
+    """The campaign report's `matched` CTE, with its bind params and params.
+
+    Each campaign's character count is worked out once, by grouping campaign_users
+    on its own, so filtering and sorting on it needs no join that multiplies rows.
+    matched holds one row per campaign that passes the filters, with everything the
+    report shows about the campaign itself, limited to the page when there is one.
+    """
     filters = []
     params = {}
 
@@ -84,31 +156,71 @@ def generate_campaign():
     having_filters = []
 
     if data.get("charCountMin") and data.get("charCountMax"):
-        having_filters.append("COUNT(cu2.character_id) BETWEEN :charCountMin AND :charCountMax")
+        having_filters.append("COALESCE(cc.char_count, 0) BETWEEN :charCountMin AND :charCountMax")
         params["charCountMin"] = data["charCountMin"]
         params["charCountMax"] = data["charCountMax"]
     elif data.get("charCountMin"):
-        having_filters.append("COUNT(cu2.character_id) >= :charCountMin")
+        having_filters.append("COALESCE(cc.char_count, 0) >= :charCountMin")
         params["charCountMin"] = data["charCountMin"]
     elif data.get("charCountMax"):
-        having_filters.append("COUNT(cu2.character_id) <= :charCountMax")
+        having_filters.append("COALESCE(cc.char_count, 0) <= :charCountMax")
         params["charCountMax"] = data["charCountMax"]
 
     having_clause = logic.join(having_filters) if having_filters else "TRUE"
 
-    query_str = f"""
-SELECT 
-    c.id AS campaign_id,
-    c.name AS campaign_name,
-    c.start_date,
-    c.end_date,
-    c.meeting_day,
-    c.meeting_time,
-    c.meeting_frequency,
-    c.description,
-    u.username AS dm_name,
-    COUNT(DISTINCT cu2.character_id) AS char_count,
-    
+    after, order_by, bindparams, keyset_params = keyset_sql(page, "c.id")
+    params.update(keyset_params)
+    # Unpaged, the order is left to the queries over matched
+    limit = ""
+    if page.limit:
+        limit = f"ORDER BY {order_by} LIMIT :limit"
+        params["limit"] = page.limit + 1
+
+    matched = f"""
+WITH char_counts AS (
+    SELECT campaign_id, COUNT(*) AS char_count
+    FROM campaign_users
+    WHERE character_id IS NOT NULL
+    GROUP BY campaign_id
+),
+matched AS (
+    SELECT
+        {page.column} AS sort_key,
+        c.id,
+        c.name,
+        c.description,
+        c.start_date,
+        c.end_date,
+        c.meeting_day,
+        c.meeting_time,
+        c.meeting_frequency,
+        u.username AS dm_name,
+        COALESCE(cc.char_count, 0) AS char_count
+    FROM campaign c
+    JOIN "user" u ON c.dm_id = u.id
+    LEFT JOIN char_counts cc ON cc.campaign_id = c.id
+    WHERE ({where_clause}) AND ({having_clause}) AND {after}
+    {limit}
+)"""
+    return matched, bindparams, params
+
+def campaign_report_rows_sql(matched, page):
+    """One row per matched campaign and character, or per campaign without characters."""
+    direction = 'DESC' if page.descending else 'ASC'
+    return f"""{matched}
+SELECT
+    m.sort_key,
+    m.id AS campaign_id,
+    m.name AS campaign_name,
+    m.start_date,
+    m.end_date,
+    m.meeting_day,
+    m.meeting_time,
+    m.meeting_frequency,
+    m.description,
+    m.dm_name,
+    m.char_count,
+
     ch.id AS character_id,
     ch.name AS character_name,
     ch.gender AS character_gender,
@@ -119,119 +231,228 @@ SELECT
     ch.level AS character_level,
     owner.username AS character_owner_username
 
-FROM campaign c
-JOIN "user" u ON c.dm_id = u.id
-LEFT JOIN campaign_users cu2 ON cu2.campaign_id = c.id AND cu2.character_id IS NOT NULL
-
-LEFT JOIN campaign_users cu ON cu.campaign_id = c.id
+FROM matched m
+LEFT JOIN campaign_users cu ON cu.campaign_id = m.id AND cu.character_id IS NOT NULL
 LEFT JOIN character ch ON cu.character_id = ch.id
 LEFT JOIN "user" owner ON cu.user_id = owner.id
 LEFT JOIN race r ON ch.race_id = r.id
 LEFT JOIN class_type ct ON ch.class_id = ct.id
 
-WHERE {where_clause}
-
-GROUP BY 
-    c.id, u.username,
-    ch.id, ch.name, ch.gender, ch.race_id, r.name, ch.class_id, ct.name, ch.level, owner.username
+ORDER BY m.sort_key {direction}, m.id {direction}, ch.name
+"""
 
-HAVING {having_clause}
+def campaign_report_stats_sql(matched, params):
+    """Summary statistics over every matched campaign, adding the histogram keys to params."""
+    days = []
+    for i, day in enumerate(MEETING_DAYS):
+        params[f"day{i}"] = day
+        days.append(f"SUM(CASE WHEN meeting_day = :day{i} THEN 1 ELSE 0 END) AS day{i}")
+    frequencies = []
+    for i, frequency in enumerate(MEETING_FREQUENCIES):
+        params[f"frequency{i}"] = frequency
+        frequencies.append(f"SUM(CASE WHEN meeting_frequency = :frequency{i} THEN 1 ELSE 0 END) AS frequency{i}")
+
+    return f"""{matched}
+SELECT
+    COUNT(*) AS num_campaigns,
+    COALESCE(CAST(AVG({days_between_sql('start_date', 'end_date')}) AS FLOAT), -1) AS avg_duration,
+    CAST(AVG(char_count) AS FLOAT) AS avg_char_count,
+    {", ".join(days)},
+    {", ".join(frequencies)}
+FROM matched
 """
-    
+
+def campaign_report_summary(data, matched, bindparams, params):
+    """The campaign report's summary, from the rollups where they cover the filters."""
+    summary = rollups.campaign_stats(report_scopes(data, campaign_rollup_filters))
+    if summary is not None:
+        return summary
+
+    stats = db.session.execute(text(campaign_report_stats_sql(matched, params)).bindparams(*bindparams), params).one()
+    return {
+        "num_campaigns": stats.num_campaigns,
+        "avg_duration": stats.avg_duration,
+        "avg_char_count": stats.avg_char_count,
+        "meeting_days": {day: stats._mapping[f"day{i}"] for i, day in enumerate(MEETING_DAYS)},
+        "meeting_frequencies": {frequency: stats._mapping[f"frequency{i}"] for i, frequency in enumerate(MEETING_FREQUENCIES)},
+    }
+
+def stream_batch_size():
+    """Rows per database fetch and per chunk of a streamed report."""
+    return current_app.config.get('REPORT_STREAM_BATCH_SIZE', 1000)
+
+def report_format(args):
+    """json (the default), or ndjson to stream the report a line at a time."""
+    format = args.get('format', 'json')
+    if format not in ('json', 'ndjson'):
+        raise PageError("format must be json or ndjson")
+    return format
+
+def report_campaign(row):
+    return ReportCampaign(
+        id=str(row.campaign_id),
+        name=row.campaign_name,
+        description=row.description,
+        dm=row.dm_name,
+        char_count=row.char_count,
+        start_date=str(row.start_date),
+        end_date=str(row.end_date) if row.end_date else None,
+        meeting_time=str(row.meeting_time),
+        meeting_day=row.meeting_day,
+        meeting_frequency=row.meeting_frequency,
+        characters=[],
+    )
+
+def report_party_member(row):
+    return ReportPartyMember(
+        row.character_id, row.character_name, row.character_gender, row.character_race_id,
+        row.character_race_name, row.character_class_id, row.character_class_type,
+        row.character_level, row.character_owner_username,
+    )
+
+def stream_report(batches, summary):
+    """An NDJSON response: each batch's rows as they are read, then {"summary": summary()}."""
+    def lines():
+        for batch in batches:
+            if batch:
+                yield encoder.encode_lines(batch)
+        yield encoder.encode_lines([{"summary": summary()}])
+
+    return current_app.response_class(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+@report_bp.route('/generate_campaign', methods=['POST'])
+def generate_campaign():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
     try:
-        campaigns = db.session.execute(text(query_str), params).fetchall()
-        if not campaigns:
-            return jsonify({"message": "no results"}), 200
+        format = report_format(request.args)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    if format == 'ndjson':
+        return stream_campaign_report(data)
+    return report_results.respond('campaign', normalized_filters(data), lambda: campaign_report(data))
+
+def campaign_report(data):
+    try:
+        page = Page.from_args(data, campaign_report_sorts)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Just the summary, skipping the rows
+    summary_only = bool(data.get('summaryOnly'))
+    if summary_only and page.limit:
+        return jsonify({'error': 'summaryOnly reports are not paged'}), 400
+
+    matched, bindparams, params = campaign_report_sql(data, page)
+
+    try:
+        campaigns = []
         campaign_map = {}
+        sort_keys = {}
+
+        if not summary_only:
+            campaigns = db.session.execute(text(campaign_report_rows_sql(matched, page)).bindparams(*bindparams), params).fetchall()
+            if not campaigns:
+                return jsonify({"message": "no results"}), 200
 
         for row in campaigns:
             campaign_id = row.campaign_id
             if campaign_id not in campaign_map:
-                campaign_map[campaign_id] = {
-                    "id": str(row.campaign_id),
-                    "name": row.campaign_name,
-                    "description": row.description,
-                    "dm": row.dm_name,
-                    "char_count": row.char_count,
-                    "start_date": str(row.start_date),
-                    "end_date": str(row.end_date) if row.end_date else None,
-                    "meeting_time": str(row.meeting_time),
-                    "meeting_day": row.meeting_day,
-                    "meeting_frequency": row.meeting_frequency,
-                    "characters": []
-                }
+                sort_keys[campaign_id] = row.sort_key
+                campaign_map[campaign_id] = report_campaign(row)
             
             if row.character_id is not None:
-                campaign_map[campaign_id]["characters"].append({
-                    "id": str(row.character_id),
-                    "name": row.character_name,
-                    "gender": row.character_gender,
-                    "race_id": str(row.character_race_id),
-                    "race": row.character_race_name,
-                    "class_id": str(row.character_class_id),
-                    "classType": row.character_class_type,
-                    "level": row.character_level,
-                    "username": row.character_owner_username
-                })
-
-        num_campaigns = len(campaign_map)
-        
-        total_duration = 0
-        count = 0
-        for campaign in campaign_map.values():
-            if campaign["start_date"] and campaign["end_date"]:
-                start_date = datetime.strptime(campaign["start_date"], "%Y-%m-%d")
-                end_date = datetime.strptime(campaign["end_date"], "%Y-%m-%d")
-                total_duration += (end_date - start_date).days
-                count += 1
-
-        avg_duration = total_duration / count if count > 0 else -1
-
-        avg_char_count = sum(campaign["char_count"] for campaign in campaign_map.values()) / num_campaigns if num_campaigns > 0 else -1
-
-        meeting_days = {
-            "Monday": 0,
-            "Tuesday": 0,
-            "Wednesday": 0,
-            "Thursday": 0,
-            "Friday": 0,
-            "Saturday": 0,
-            "Sunday": 0
-        }
-        
-        meeting_frequencies = {
-            "Weekly": 0,
-            "Bi-Weekly": 0,
-            "Monthly": 0,
-            "One-Shot": 0
-        }
+                campaign_map[campaign_id].characters.append(report_party_member(row))
 
-        for campaign in campaign_map.values():
-            if campaign["meeting_day"]:
-                meeting_days[campaign["meeting_day"]] += 1
-            if campaign["meeting_frequency"]:
-                meeting_frequencies[campaign["meeting_frequency"]] += 1
-
-        return jsonify({
-            "num_campaigns": num_campaigns,
-            "avg_duration": avg_duration,
-            "avg_char_count": avg_char_count,
-            "meeting_days": meeting_days,
-            "meeting_frequencies": meeting_frequencies,
-            "campaigns": list(campaign_map.values())
-            }), 200
+        if page.limit:
+            page_ids, next_cursor = page.split(list(campaign_map), lambda campaign_id: (sort_keys[campaign_id], campaign_id))
+            return respond(page.body("campaigns", [campaign_map[campaign_id] for campaign_id in page_ids], next_cursor))
+
+        summary = campaign_report_summary(data, matched, bindparams, params)
+        if not summary["num_campaigns"]:
+            return jsonify({"message": "no results"}), 200
+        if not summary_only:
+            summary["campaigns"] = list(campaign_map.values())
+        return respond(summary)
     except Exception as e:
         print("Error in /report/generate_campaign:", e)
         return jsonify({"error": "Something went wrong while generating the report."}), 500
 
+def whole_report_page(data, sort_keys, mode):
+    """The Page for a report read whole, streamed or as a job. Raises PageError if data asks for a page."""
+    page = Page.from_args(data, sort_keys)
+    if page.limit:
+        raise PageError(f"{mode} reports are not paged")
+    return page
+
+def campaign_report_batches(data, page):
+    """The campaign report's campaigns a batch at a time, and a function giving the summary after.
+
+    Rows come off the database stream_batch_size() at a time (a server-side cursor on
+    PostgreSQL). A campaign's rows are consecutive, so each campaign is done as soon
+    as the next one starts and only the one being read is held.
+    """
+    matched, bindparams, params = campaign_report_sql(data, page)
+
+    def batches():
+        statement = text(campaign_report_rows_sql(matched, page)).bindparams(*bindparams)
+        # yield_per as an execution option only reaches ORM statements, not text()
+        result = db.session.execute(statement.execution_options(stream_results=True), params).yield_per(stream_batch_size())
+        campaign = None
+        for rows in result.partitions():
+            done = []
+            for row in rows:
+                if campaign is None or campaign.id != str(row.campaign_id):
+                    if campaign is not None:
+                        done.append(campaign)
+                    campaign = report_campaign(row)
+                if row.character_id is not None:
+                    campaign.characters.append(report_party_member(row))
+            yield done
+        if campaign is not None:
+            yield [campaign]
+
+    return batches(), lambda: campaign_report_summary(data, matched, bindparams, params)
+
+def stream_campaign_report(data):
+    """The campaign report as NDJSON: a line per campaign in report order, then the summary."""
+    try:
+        page = whole_report_page(data, campaign_report_sorts, 'ndjson')
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    return stream_report(*campaign_report_batches(data, page))
+
+class CharacterTally:
+    """The character report's summary, worked out from its rows as they are read."""
+
+    def __init__(self):
+        self.num_characters = 0
+        self.levels = 0
+        self.gender_counts = {}
+        self.race_counts = {}
+        self.class_counts = {}
+
+    def add(self, characters):
+        for character in characters:
+            self.num_characters += 1
+            self.levels += character.level
+            self.gender_counts[character.gender] = self.gender_counts.get(character.gender, 0) + 1
+            self.race_counts[character.race] = self.race_counts.get(character.race, 0) + 1
+            self.class_counts[character.classType] = self.class_counts.get(character.classType, 0) + 1
+
+    def summary(self):
+        return {
+            "num_characters": self.num_characters,
+            "avg_level": self.levels / self.num_characters if self.num_characters > 0 else -1,
+            "gender_counts": self.gender_counts,
+            "race_counts": self.race_counts,
+            "class_counts": self.class_counts,
+        }
 
-
-@report_bp.route('/generate_character', methods=['POST'])
-def generate_character():
-    data = request.get_json()
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
-
+def character_report_sql(data, page):
+    """The character report's query, with its bind params and params."""
     filters = []
     params = {}
 
@@ -271,8 +492,16 @@ def generate_character():
     logic = " OR " if data.get("searchMode") == "lax" else " AND "
     where_clause = logic.join(filters) if filters else "TRUE"
 
+    after, order_by, bindparams, keyset_params = keyset_sql(page, "ch.id")
+    params.update(keyset_params)
+    limit = ""
+    if page.limit:
+        limit = "LIMIT :limit"
+        params["limit"] = page.limit + 1
+
     query_str = f"""
 SELECT
+    {page.column} AS sort_key,
     ch.id,
     ch.name,
     ch.gender,
@@ -284,52 +513,147 @@ FROM character ch
 JOIN "user" u ON ch.user_id = u.id
 LEFT JOIN race r ON ch.race_id = r.id
 LEFT JOIN class_type ct ON ch.class_id = ct.id
-WHERE {where_clause}
+WHERE ({where_clause}) AND {after}
+ORDER BY {order_by}
+{limit}
 """
+    return query_str, bindparams, params
+
+@report_bp.route('/generate_character', methods=['POST'])
+def generate_character():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    try:
+        format = report_format(request.args)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    if format == 'ndjson':
+        return stream_character_report(data)
+    return report_results.respond('character', normalized_filters(data), lambda: character_report(data))
+
+def character_report(data):
+    try:
+        page = Page.from_args(data, character_report_sorts)
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Just the summary, skipping the rows when the rollups cover the filters
+    summary_only = bool(data.get('summaryOnly'))
+    if summary_only and page.limit:
+        return jsonify({'error': 'summaryOnly reports are not paged'}), 400
+
+    query_str, bindparams, params = character_report_sql(data, page)
 
     try:
-        characters = db.session.execute(text(query_str), params).fetchall()
+        summary = None if page.limit else rollups.character_stats(report_scopes(data, character_rollup_filters))
+        if summary_only and summary is not None:
+            if not summary["num_characters"]:
+                return jsonify({"message": "no results"}), 200
+            return respond(summary)
+
+        characters = db.session.execute(text(query_str).bindparams(*bindparams), params).fetchall()
         if not characters:
             return jsonify({"message": "no results"}), 200
+        characters, next_cursor = page.split(characters, lambda row: (row.sort_key, row.id))
+
+        result = [ReportCharacter(*row[1:]) for row in characters]
+
+        if page.limit:
+            return respond(page.body("characters", result, next_cursor))
 
-        result = []
-        for row in characters:
-            result.append({
-                "id": str(row.id),
-                "name": row.name,
-                "gender": row.gender,
-                "level": row.level,
-                "race": row.race,
-                "classType": row.class_type,
-                "username": row.owner
-            })
-        
-        num_characters = len(result)
-
-        avg_level = sum(character["level"] for character in result) / num_characters if num_characters > 0 else -1
-
-        gender_counts = {}
-        race_counts = {}
-        class_counts = {}
-        for character in result:
-            if character["gender"] not in gender_counts:
-                gender_counts[character["gender"]] = 0
-            gender_counts[character["gender"]] += 1
-            if character["race"] not in race_counts:
-                race_counts[character["race"]] = 0
-            race_counts[character["race"]] += 1
-            if character["classType"] not in class_counts:
-                class_counts[character["classType"]] = 0
-            class_counts[character["classType"]] += 1
-
-        return jsonify({
-            "characters": result,
-            "num_characters": num_characters,
-            "avg_level": avg_level,
-            "gender_counts": gender_counts,
-            "race_counts": race_counts,
-            "class_counts": class_counts
-            }), 200
+        if summary is None:
+            tally = CharacterTally()
+            tally.add(result)
+            summary = tally.summary()
+
+        if summary_only:
+            return respond(summary)
+        return respond({"characters": result, **summary})
     except Exception as e:
         print("Error in /report/generate_character:", e)
-        return jsonify({"error": "Something went wrong while generating the character report."}), 500
\ No newline at end of file
+        return jsonify({"error": "Something went wrong while generating the character report."}), 500
+
+def character_report_batches(data, page):
+    """The character report's characters a batch at a time, and a function giving the summary after."""
+    query_str, bindparams, params = character_report_sql(data, page)
+    summary = rollups.character_stats(report_scopes(data, character_rollup_filters))
+    # Without the rollups, the summary is added up from the rows on the way past
+    tally = CharacterTally() if summary is None else None
+
+    def batches():
+        statement = text(query_str).bindparams(*bindparams)
+        result = db.session.execute(statement.execution_options(stream_results=True), params).yield_per(stream_batch_size())
+        for rows in result.partitions():
+            characters = [ReportCharacter(*row[1:]) for row in rows]
+            if tally is not None:
+                tally.add(characters)
+            yield characters
+
+    return batches(), lambda: tally.summary() if tally is not None else summary
+
+def stream_character_report(data):
+    """The character report as NDJSON: a line per character in report order, then the summary."""
+    try:
+        page = whole_report_page(data, character_report_sorts, 'ndjson')
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+    return stream_report(*character_report_batches(data, page))
+
+## Background report jobs, see report_jobs.py
+
+report_job_kinds = {
+    # kind: (sort keys, batches, name of the rows in a page)
+    'campaign': (campaign_report_sorts, campaign_report_batches, 'campaigns'),
+    'character': (character_report_sorts, character_report_batches, 'characters'),
+}
+
+@report_bp.route('/submit_job/<string:kind>', methods=['POST'])
+def submit_job(kind):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    if kind not in report_job_kinds:
+        return jsonify({"error": "Report not found"}), 404
+    sort_keys, batches, _ = report_job_kinds[kind]
+
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    try:
+        page = whole_report_page(data, sort_keys, 'Background')
+    except PageError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        job = report_jobs.submit(user_id, kind, lambda: batches(data, page))
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job['id'], "status": job['status']}), 202
+
+@report_bp.route('/get_job/<string:job_id>', methods=['GET'])
+def get_job(job_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User not logged in"}), 401
+
+    job = report_jobs.job(job_id, user_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    # ?page=n, counting from 0, once the job is done
+    try:
+        number = int(request.args.get('page', 0))
+    except ValueError:
+        return jsonify({"error": "page must be a number"}), 400
+
+    body = {"job": job}
+    if job['status'] == 'done':
+        rows = report_jobs.page(job_id, number) if 0 <= number < job['pages'] else None
+        body["page"] = number
+        # The page is stored encoded, it goes into the response as is
+        body[report_job_kinds[job['kind']][2]] = msgspec.Raw(rows) if rows is not None else []
+    return respond(body)
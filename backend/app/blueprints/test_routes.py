@@ -1,7 +1,37 @@
-from flask import Blueprint, jsonify, request, session
+import hmac
+from flask import Blueprint, current_app, jsonify, request, session
+from ..move_coalescer import move_coalescer
+from ..db_green import is_green
+from ..passwords import passwords
+from ..event_log import events
+from ..response_cache import responses
+from ..reference_data import reference
+from ..report_rollups import rollups
+from ..report_cache import report_results
+from ..report_jobs import report_jobs
 
 test_bp = Blueprint('test_bp', __name__, url_prefix='/test')
 
 @test_bp.route('/', methods=['GET'])
 def health_check():
-    return "OK", 200
\ No newline at end of file
+    return "OK", 200
+
+@test_bp.route('/metrics', methods=['GET'])
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify({
+        "move_coalescer": move_coalescer.stats(),
+        "database": {"cooperative": is_green()},
+        "passwords": passwords.stats(),
+        "event_log": events.stats(),
+        "response_cache": responses.stats(),
+        "reference_data": reference.stats(),
+        "report_rollups": rollups.stats(),
+        "report_cache": report_results.stats(),
+        "report_jobs": report_jobs.stats(),
+    }), 200
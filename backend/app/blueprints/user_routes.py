@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request, session
 from ..models import User
 from .. import db
-import bcrypt
+from ..passwords import passwords
 from uuid import UUID
 
 ## User routes
@@ -16,6 +16,13 @@ def login():
         return jsonify({'error': 'User not found'}), 404
     if not check_password(data['password'], user.password):
         return jsonify({'error': 'Invalid password'}), 401
+
+    # Only now do we have the plain password, so this is the moment to upgrade an old hash
+    if passwords.needs_rehash(user.password):
+        user.password = hash_password(data['password'])
+        db.session.commit()
+        passwords.rehashed += 1
+
     session.clear()
     session['user_id'] = user.id
     return jsonify({'isLoggedIn': True, 'username': user.username}), 200
@@ -82,9 +89,7 @@ def me():
 ## Helper functions
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return passwords.hash(password)
 
 def check_password(password, hashed):
-    if isinstance(hashed, str):
-        hashed = hashed.encode('utf-8')
-    return bcrypt.checkpw(password.encode('utf-8'), hashed)
\ No newline at end of file
+    return passwords.check(password, hashed)
\ No newline at end of file
@@ -0,0 +1,212 @@
+import codecs
+import csv
+import io
+import uuid
+import msgspec
+from datetime import date, datetime
+from typing import Annotated, Optional
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import insert
+from . import db
+from .models import Campaign, Character, campaign_users
+from .reference_data import reference
+from .report_rollups import rollups
+from .serializers import encoder
+
+## Bulk export and import
+#
+# Exports stream: rows come off the database yield_per at a time (a server-side cursor
+# on PostgreSQL), each batch is encoded and sent as one chunk of the response, and
+# nothing else is held, so memory stays flat however many rows there are.
+#
+# Imports read the upload line by line, validate each row (types and column lengths
+# through the Structs below, race and class against the reference data) and insert
+# valid rows with one executemany per batch. Everything goes in one transaction: if
+# any row is invalid nothing is kept, and the response lists the bad lines.
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Bad lines reported back before giving up on the rest of an import
+MAX_IMPORT_ERRORS = 50
+
+class TransferError(ValueError):
+    pass
+
+def transfer_format(args, mimetype=None):
+    """The format asked for with ?format=, or implied by the upload's content type."""
+    format = args.get('format') or ('csv' if mimetype == FORMATS['csv'] else 'ndjson')
+    if format not in FORMATS:
+        raise TransferError(f"format must be one of: {', '.join(FORMATS)}")
+    return format
+
+## Export
+
+def export(statement, struct, format, filename, serialize=None):
+    """A streamed response with statement's rows as struct, one JSON object per line or CSV."""
+    serialize = serialize or (lambda row: struct(*row))
+    batch_size = current_app.config.get('BULK_EXPORT_BATCH_SIZE', 1000)
+
+    def chunks():
+        result = db.session.execute(statement.execution_options(yield_per=batch_size))
+        if format == 'csv':
+            yield ','.join(struct.__struct_fields__) + '\r\n'
+        for rows in result.partitions():
+            items = [serialize(row) for row in rows]
+            if format == 'ndjson':
+                yield encoder.encode_lines(items)
+            else:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(item.values() for item in msgspec.to_builtins(items))
+                yield buffer.getvalue()
+
+    response = Response(stream_with_context(chunks()), mimetype=FORMATS[format])
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.{format}'
+    return response
+
+## Import
+
+Name = Annotated[str, msgspec.Meta(min_length=1, max_length=50)]
+Label = Annotated[str, msgspec.Meta(max_length=50)]
+
+class CharacterRow(msgspec.Struct, kw_only=True):
+    # Race and class by id, as exported, or by name
+    name: Name
+    gender: Label
+    race_id: Optional[str] = None
+    race: Optional[str] = None
+    class_id: Optional[str] = None
+    classType: Optional[str] = None
+    level: int = 1
+    speed: int = 30
+    size: Label = 'medium'
+    marker_color: Annotated[str, msgspec.Meta(max_length=7)] = '#ff9800'
+
+class CampaignRow(msgspec.Struct, kw_only=True):
+    name: Name
+    description: Annotated[str, msgspec.Meta(max_length=255)] = ''
+    start_date: date
+    end_date: Optional[date] = None
+    meeting_time: str
+    meeting_day: Annotated[str, msgspec.Meta(min_length=1, max_length=50)]
+    meeting_frequency: Annotated[str, msgspec.Meta(min_length=1, max_length=50)]
+
+def read_rows(stream, format, struct):
+    """(line number, struct) for each row of an upload, or (line number, error) where it doesn't fit struct."""
+    if isinstance(stream, io.RawIOBase):
+        # Werkzeug's request stream reads lines a byte at a time otherwise
+        stream = io.BufferedReader(stream, 1 << 16)
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(codecs.iterdecode(stream, 'utf-8')), start=2):
+            try:
+                # Empty cells are missing values, leaving the defaults
+                yield number, msgspec.convert({k: v for k, v in row.items() if k and v != ''}, struct, strict=False)
+            except msgspec.ValidationError as e:
+                yield number, str(e)
+        return
+
+    decoder = msgspec.json.Decoder(struct)
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, decoder.decode(line)
+        except (msgspec.ValidationError, msgspec.DecodeError) as e:
+            yield number, str(e)
+
+def character_values(row, user_id):
+    race_id = reference.races.resolve(row.race_id, row.race)
+    if race_id is None:
+        raise TransferError("Race not found")
+    class_id = reference.classes.resolve(row.class_id, row.classType)
+    if class_id is None:
+        raise TransferError("Class not found")
+    return ({
+        'id': uuid.uuid4(), 'name': row.name, 'gender': row.gender, 'race_id': race_id, 'class_id': class_id,
+        'level': row.level, 'user_id': user_id, 'speed': row.speed, 'size': row.size, 'marker_color': row.marker_color,
+    },)
+
+def campaign_values(row, user_id):
+    for pattern in ('%H:%M', '%H:%M:%S'):
+        try:
+            meeting_time = datetime.strptime(row.meeting_time, pattern).time()
+            break
+        except ValueError:
+            pass
+    else:
+        raise TransferError("Invalid meeting time")
+    campaign_id = uuid.uuid4()
+    # The DM is a member of their own campaign, as create_campaign does it
+    return (
+        {
+            'id': campaign_id, 'name': row.name, 'description': row.description, 'dm_id': user_id,
+            'start_date': row.start_date, 'end_date': row.end_date, 'meeting_time': meeting_time,
+            'meeting_day': row.meeting_day, 'meeting_frequency': row.meeting_frequency,
+        },
+        {'campaign_id': campaign_id, 'user_id': user_id},
+    )
+
+def bulk_import(rows, values, tables, on_batch=None):
+    """Insert rows in batches, values(row) giving one dict per table.
+
+    on_batch is called with the ids of each batch inserted into the first table.
+    Returns the number of rows and the errors found. The caller commits if there are
+    no errors and rolls back otherwise.
+    """
+    batch_size = current_app.config.get('BULK_IMPORT_BATCH_SIZE', 1000)
+    max_rows = current_app.config.get('BULK_IMPORT_MAX_ROWS', 100000)
+    batches = [[] for _ in tables]
+    count, errors = 0, []
+
+    def flush():
+        ids = [value['id'] for value in batches[0]]
+        for table, batch in zip(tables, batches):
+            if batch:
+                db.session.execute(insert(table), batch)
+                batch.clear()
+        if on_batch and ids:
+            on_batch(ids)
+
+    for number, row in rows:
+        try:
+            if isinstance(row, str):
+                raise TransferError(row)
+            if count >= max_rows:
+                raise TransferError(f"More than {max_rows} rows")
+            for batch, value in zip(batches, values(row)):
+                batch.append(value)
+        except TransferError as e:
+            errors.append({"line": number, "error": str(e)})
+            if len(errors) >= MAX_IMPORT_ERRORS or count >= max_rows:
+                break
+            continue
+
+        count += 1
+        if errors:
+            # Keep validating to report more bad lines, there is nothing left to insert
+            for batch in batches:
+                batch.clear()
+        elif len(batches[0]) >= batch_size:
+            flush()
+
+    if not errors:
+        flush()
+    return count, errors
+
+def import_characters(stream, format, user_id):
+    return bulk_import(
+        read_rows(stream, format, CharacterRow),
+        lambda row: character_values(row, user_id),
+        [Character.__table__],
+        on_batch=lambda ids: rollups.characters(Character.id.in_(ids)),
+    )
+
+def import_campaigns(stream, format, user_id):
+    return bulk_import(
+        read_rows(stream, format, CampaignRow),
+        lambda row: campaign_values(row, user_id),
+        [Campaign.__table__, campaign_users],
+        on_batch=lambda ids: rollups.campaigns(Campaign.id.in_(ids)),
+    )
@@ -0,0 +1,100 @@
+from sqlalchemy import or_, select, union
+from sqlalchemy.orm import aliased
+from . import db
+from .models import Campaign, Character, Map, User, campaign_invites, campaign_users
+from .pagination import Page
+from .serializers import (
+    CampaignCard, MapSummary, PartyMember, campaign_columns, campaign_summary, map_summary_columns,
+    party_member_columns, with_race_and_class,
+)
+
+## Campaign dashboard
+#
+# get_campaigns used to walk the user's relationships: one query per relationship,
+# then race, class and maps lazy-loaded per character and per campaign. Here the
+# whole dashboard is three column-only queries no matter how many campaigns,
+# characters or maps there are: campaigns with their DM's name, characters with
+# race and class names, and map summaries (without the markers and lines blobs).
+# Rows go straight into the serializers.py Structs.
+#
+# Both lists can be sorted and paged (see pagination.py).
+
+campaign_sorts = {
+    'name': Campaign.name,
+    'start_date': Campaign.start_date,
+    'meeting_time': Campaign.meeting_time,
+}
+
+def page_key(page):
+    return lambda row: (getattr(row, page.sort), row.id)
+
+def load_invites(user_id, page=None):
+    """Campaigns the user has been invited to, as CampaignSummary Structs, and the next page's cursor."""
+    page = page or Page('name', Campaign.name)
+    dm = aliased(User)
+    invites = page.apply(
+        db.session.query(*campaign_columns(dm))
+        .join(dm, dm.id == Campaign.dm_id)
+        .join(campaign_invites, campaign_invites.c.campaign_id == Campaign.id)
+        .filter(campaign_invites.c.user_id == user_id),
+        Campaign.id
+    ).all()
+    invites, next_cursor = page.split(invites, page_key(page))
+    return [campaign_summary(row) for row in invites], next_cursor
+
+def load_campaigns(user_id, page=None):
+    """Campaigns the user plays in (with a character) or runs, as CampaignCard Structs, and the next page's cursor."""
+    page = page or Page('name', Campaign.name)
+    playing = (
+        db.session.query(campaign_users.c.campaign_id)
+        .filter(campaign_users.c.user_id == user_id, campaign_users.c.character_id != None)
+    )
+    dm = aliased(User)
+    campaigns = page.apply(
+        db.session.query(*campaign_columns(dm))
+        .join(dm, dm.id == Campaign.dm_id)
+        .filter(or_(Campaign.id.in_(playing), Campaign.dm_id == user_id)),
+        Campaign.id
+    ).all()
+    campaigns, next_cursor = page.split(campaigns, page_key(page))
+    if not campaigns:
+        return [], None
+    campaign_ids = [row.id for row in campaigns]
+
+    characters = {campaign_id: [] for campaign_id in campaign_ids}
+    for row in db.session.execute(
+        with_race_and_class(
+            select(campaign_users.c.campaign_id, *party_member_columns)
+            .join_from(campaign_users, Character, campaign_users.c.character_id == Character.id)
+        ).where(campaign_users.c.campaign_id.in_(campaign_ids))
+    ):
+        characters[row[0]].append(PartyMember(*row[1:]))
+
+    maps = {campaign_id: [] for campaign_id in campaign_ids}
+    for row in db.session.execute(select(*map_summary_columns).where(Map.campaign_id.in_(campaign_ids))):
+        maps[row.campaign_id].append(MapSummary(*row))
+
+    return [
+        campaign_summary(
+            row, CampaignCard,
+            char_count=len(characters[row.id]),
+            characters=characters[row.id],
+            maps=maps[row.id],
+        ) for row in campaigns
+    ], next_cursor
+
+def character_campaigns(character_id):
+    return select(campaign_users.c.campaign_id).where(campaign_users.c.character_id == character_id)
+
+def campaign_audience(campaign_ids):
+    """Ids of everyone who sees these campaigns on their dashboard or invite list.
+
+    campaign_ids is a list of ids or a select of them. Read it before the change
+    that is being invalidated, as that change may remove people from the campaign.
+    """
+    audience = union(
+        select(Campaign.dm_id).where(Campaign.id.in_(campaign_ids)),
+        select(campaign_users.c.user_id).where(campaign_users.c.campaign_id.in_(campaign_ids)),
+        select(campaign_invites.c.user_id).where(campaign_invites.c.campaign_id.in_(campaign_ids)),
+    )
+    return set(db.session.execute(audience).scalars())
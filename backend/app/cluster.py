@@ -0,0 +1,172 @@
+import json
+import logging
+import time
+import uuid
+import msgspec
+from . import socketio, db
+from .event_log import log_event
+from .message_queue import connect
+from .serializers import encode
+
+## Shared state between worker processes
+#
+# Anything one worker needs to know about sockets held by another lives in a shared
+# store: which socket each user is on, who is in each map room, and which worker owns
+# each map room's live state. The store is Redis (SHARED_STATE_URL, defaulting to the
+# Socket.IO message queue URL) or, with a single worker, the in-process stand-in.
+#
+# Workers also message each other over one channel per worker plus one for everybody.
+# That is how map events reach the worker that owns the room (see map_rooms.py).
+# Messages are JSON, so handlers get UUIDs in their payload back as strings.
+
+# How long a worker trusts what it last read about a room owned by another worker
+OWNER_CACHE_SECONDS = 1.0
+
+class Cluster:
+    def __init__(self):
+        self.host_id = uuid.uuid4().hex
+        self.client = None
+        self.prefix = 'dndtools:'
+        self.owner_ttl = 15
+        self.handlers = {}
+        self.owners = {}
+        self._refreshed = 0
+        self._listener = None
+
+    def init_app(self, app):
+        url = app.config.get('SHARED_STATE_URL') or app.config.get('SOCKETIO_MESSAGE_QUEUE') or 'local://'
+        self.client = connect(url)
+        self.prefix = app.config.get('SHARED_STATE_PREFIX', 'dndtools:')
+        self.owner_ttl = app.config.get('MAP_OWNER_TTL', 15)
+
+    def key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    ## User sockets
+
+    def set_user_socket(self, user_id, sid):
+        self.client.hset(self.key('user_sockets'), str(user_id), sid)
+
+    def user_socket(self, user_id):
+        sid = self.client.hget(self.key('user_sockets'), str(user_id))
+        return sid.decode() if sid else None
+
+    def clear_user_socket(self, user_id, sid):
+        # Leave it alone if the user has reconnected on another socket since
+        if self.user_socket(user_id) == sid:
+            self.client.hdel(self.key('user_sockets'), str(user_id))
+
+    ## Map room membership
+
+    def add_member(self, map_id, sid, codec='json', is_dm=False, viewport=None):
+        member = {'codec': codec, 'is_dm': is_dm, 'viewport': list(viewport) if viewport else None}
+        self.client.hset(self.key('map_members', map_id), sid, json.dumps(member))
+
+    def remove_member(self, map_id, sid):
+        self.client.hdel(self.key('map_members', map_id), sid)
+
+    def members(self, map_id):
+        members = {}
+        for sid, member in self.client.hgetall(self.key('map_members', map_id)).items():
+            member = json.loads(member)
+            if member['viewport']:
+                member['viewport'] = tuple(member['viewport'])
+            members[sid.decode()] = member
+        return members
+
+    ## Map room ownership
+
+    def owner(self, map_id):
+        cached = self.owners.get(map_id)
+        if cached and time.monotonic() - cached[1] < OWNER_CACHE_SECONDS:
+            return cached[0]
+
+        owner = self.client.get(self.key('map_owner', map_id))
+        owner = owner.decode() if owner else None
+        if owner and owner != self.host_id:
+            self.owners[map_id] = (owner, time.monotonic())
+        else:
+            self.owners.pop(map_id, None)
+        return owner
+
+    def claim(self, map_id):
+        """Return the worker that owns a map room, taking it over if nobody does."""
+        while True:
+            owner = self.owner(map_id)
+            if owner:
+                return owner
+            if self.client.set(self.key('map_owner', map_id), self.host_id, ex=self.owner_ttl, nx=True):
+                return self.host_id
+
+    def keep_alive(self, map_ids):
+        """Extend ownership of the rooms held here. Returns the ones another worker has taken."""
+        now = time.monotonic()
+        if now - self._refreshed < self.owner_ttl / 3:
+            return []
+        self._refreshed = now
+
+        lost = []
+        for map_id in map_ids:
+            key = self.key('map_owner', map_id)
+            # Read then expire isn't atomic, but a worker stalled for a whole TTL has lost the room anyway
+            if self.client.get(key) == self.host_id.encode():
+                self.client.expire(key, self.owner_ttl)
+            else:
+                lost.append(map_id)
+        return lost
+
+    def release(self, map_id):
+        key = self.key('map_owner', map_id)
+        if self.client.get(key) == self.host_id.encode():
+            self.client.delete(key)
+
+    ## Messages between workers
+
+    def on(self, method):
+        def decorator(handler):
+            self.handlers[method] = handler
+            return handler
+        return decorator
+
+    def send(self, host_id, method, **payload):
+        self.client.publish(self.key('host', host_id), encode({'method': method, 'host': self.host_id, 'payload': payload}))
+
+    def broadcast(self, method, **payload):
+        """Send to every other worker. The caller is expected to have handled it locally already."""
+        self.client.publish(self.key('hosts'), encode({'method': method, 'host': self.host_id, 'payload': payload}))
+
+    def ensure_listener(self, app):
+        if self._listener is None:
+            # Subscribe before returning, so nothing sent to us once we've claimed a room is missed
+            self._listener = socketio.start_background_task(self._listen, app, self._subscribe())
+
+    def _subscribe(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.key('host', self.host_id), self.key('hosts'))
+        return pubsub
+
+    def _listen(self, app, pubsub):
+        while True:
+            try:
+                pubsub = pubsub or self._subscribe()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self._handle(app, msgspec.json.decode(message['data']))
+            except Exception as e:
+                log_event('cluster_listener_failed', logging.WARNING, error=str(e))
+                pubsub = None
+                socketio.sleep(1)
+
+    def _handle(self, app, message):
+        handler = self.handlers.get(message['method'])
+        if handler is None or message['host'] == self.host_id:
+            return
+
+        with app.app_context():
+            try:
+                handler(**message['payload'])
+            except Exception as e:
+                db.session.rollback()
+                log_event('cluster_message_failed', logging.WARNING, method=message['method'], error=str(e))
+
+cluster = Cluster()
@@ -24,4 +24,80 @@ class Config:
     SESSION_PERMANENT = True
     SESSION_USE_SIGNER = True
     PERMANENT_SESSION_LIFETIME = 3600
-    SECRET_KEY = secrets.token_hex(16)
\ No newline at end of file
+    # Must be the same in every worker, otherwise sessions signed by one are rejected by the others
+    SECRET_KEY = os.getenv('SECRET_KEY') or secrets.token_hex(16)
+
+    # Map room state write-behind: a dirty room is flushed once it has been quiet
+    # for MAP_STATE_FLUSH_DEBOUNCE seconds, or after MAP_STATE_FLUSH_MAX_DELAY at the latest
+    MAP_STATE_FLUSH_INTERVAL = 0.5
+    MAP_STATE_FLUSH_DEBOUNCE = 1.0
+    MAP_STATE_FLUSH_MAX_DELAY = 10.0
+
+    # Marker moves are coalesced per room and broadcast once per tick (seconds, 0 disables)
+    MAP_MOVE_TICK = 0.05
+
+    # Number of recent ops each map room keeps for resuming reconnecting clients
+    MAP_OP_LOG_SIZE = 500
+
+    # Extra world units around a client's viewport that still count as visible
+    MAP_VIEWPORT_MARGIN = 250
+
+    # Socket.IO message queue shared by all workers (redis://, amqp://, ..., or local:// for a
+    # single process). Unset means one worker only
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+
+    # Redis holding shared socket state: user sockets, room members and room owners. Defaults
+    # to the message queue URL, needs setting if that isn't Redis
+    SHARED_STATE_URL = os.getenv('SHARED_STATE_URL')
+
+    # Token for GET /test/metrics, sent as "Authorization: Bearer <token>". Unset turns the
+    # endpoint off, since it shows internal counters
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Seconds a worker's claim on a map room survives without being renewed
+    MAP_OWNER_TTL = 15
+
+    # bcrypt work factor for new hashes. Stored hashes with a different cost are redone on login
+    BCRYPT_ROUNDS = 12
+
+    # Most bcrypt hashes computed at once, the rest queue
+    BCRYPT_MAX_CONCURRENCY = 4
+
+    # Structured event log (JSON lines on stdout). Sampling keeps that fraction of an event
+    # type, rate limits cap an event type per second. Past EVENT_LOG_QUEUE_SIZE waiting lines,
+    # new ones are dropped
+    EVENT_LOG_LEVEL = 'INFO'
+    EVENT_LOG_SAMPLING = {'marker_moved': 0.01}
+    EVENT_LOG_RATE_LIMITS = {'marker_added': 50, 'line_added': 50, 'client_connected': 100}
+    EVENT_LOG_QUEUE_SIZE = 10000
+
+    # Per-user cache of the get_campaigns and get_invites responses. Write paths invalidate
+    # what they change, the TTL (seconds) is a backstop
+    RESPONSE_CACHE_MAX_ENTRIES = 5000
+    RESPONSE_CACHE_TTL = 60
+
+    # Seconds clients may reuse the get_races / get_classes responses before revalidating
+    # them against their ETag
+    REFERENCE_DATA_MAX_AGE = 3600
+
+    # Report results by normalized filters, least recently used first out past either
+    # limit. Any change to campaigns or characters empties it, the TTL (seconds) is a backstop
+    REPORT_CACHE_MAX_ENTRIES = 500
+    REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    REPORT_CACHE_TTL = 300
+
+    # Rows per database fetch and per response chunk when a report is streamed (?format=ndjson)
+    REPORT_STREAM_BATCH_SIZE = 1000
+
+    # Background report jobs: how many build at once per worker, how many may wait behind
+    # them, rows per page of a finished job's result, and seconds results are kept
+    REPORT_JOB_WORKERS = 2
+    REPORT_JOB_MAX_QUEUED = 20
+    REPORT_JOB_PAGE_SIZE = 200
+    REPORT_JOB_TTL = 600
+
+    # Rows per database fetch and per response chunk when exporting, and per executemany
+    # when importing. Imports of more than BULK_IMPORT_MAX_ROWS rows are refused
+    BULK_EXPORT_BATCH_SIZE = 1000
+    BULK_IMPORT_BATCH_SIZE = 1000
+    BULK_IMPORT_MAX_ROWS = 100000
@@ -0,0 +1,30 @@
+import psycopg2
+from psycopg2 import extensions
+from eventlet.hubs import trampoline
+
+## Cooperative PostgreSQL access
+#
+# psycopg2 talks to the server from C, so under eventlet a query blocks the whole
+# hub until it returns: one slow report stalls every socket on the worker. With a
+# wait callback installed, psycopg2 runs every connection in async mode and hands
+# control back to us whenever it would block. We park the green thread on the
+# connection's socket until it is ready, and the hub serves everyone else meanwhile.
+
+def eventlet_wait_callback(conn, timeout=-1):
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+def make_psycopg_green():
+    """Make psycopg2 yield to the eventlet hub while waiting on the database. Call once, at startup."""
+    extensions.set_wait_callback(eventlet_wait_callback)
+
+def is_green():
+    return extensions.get_wait_callback() is eventlet_wait_callback
@@ -0,0 +1,127 @@
+import atexit
+import json
+import logging
+import random
+import sys
+import time
+from eventlet import patcher
+
+## Structured event log
+#
+# Socket handlers log through log_event() rather than print(). On the handler's side
+# the call only decides whether the event is kept (per-event-type sampling, then a
+# per-second cap) and appends a tuple to a queue. A writer thread turns the queue
+# into JSON lines, writing whatever has piled up in one go. If the writer falls
+# behind, events past EVENT_LOG_QUEUE_SIZE are dropped and counted; the handler
+# never waits for output.
+#
+# The queue and writer thread are the unpatched stdlib ones, so even under eventlet
+# the writing happens on a real OS thread, off the hub.
+
+native_queue = patcher.original('queue')
+native_threading = patcher.original('threading')
+
+def format_line(created, level, event, fields):
+    line = {'ts': round(created, 3), 'level': logging.getLevelName(level).lower(), 'event': event}
+    line.update(fields)
+    return json.dumps(line, default=str)
+
+class EventSampler:
+    """Decides whether an event is logged: a kept fraction per event type, then a per-second cap."""
+
+    def __init__(self, sampling=None, rate_limits=None):
+        self.sampling = sampling or {}
+        self.rate_limits = rate_limits or {}
+        self.windows = {}
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def allow(self, event, now=None):
+        rate = self.sampling.get(event)
+        if rate is not None and random.random() >= rate:
+            self.sampled_out += 1
+            return False
+
+        limit = self.rate_limits.get(event)
+        if limit is not None:
+            second = int(time.monotonic() if now is None else now)
+            window, count = self.windows.get(event, (second, 0))
+            if window != second:
+                count = 0
+            if count >= limit:
+                self.rate_limited += 1
+                return False
+            self.windows[event] = (second, count + 1)
+        return True
+
+class EventLog:
+    def __init__(self):
+        self.level = logging.INFO
+        self.sampler = EventSampler()
+        self.queue = native_queue.SimpleQueue()
+        self.queue_size = 10000
+        self.stream = sys.stdout
+        self.dropped = 0
+        self.written = 0
+        self._writer = None
+
+    def init_app(self, app):
+        config = app.config
+        self.stop()
+
+        level = config.get('EVENT_LOG_LEVEL', 'INFO')
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.sampler = EventSampler(config.get('EVENT_LOG_SAMPLING'), config.get('EVENT_LOG_RATE_LIMITS'))
+        self.queue_size = config.get('EVENT_LOG_QUEUE_SIZE', 10000)
+        self.stream = config.get('EVENT_LOG_STREAM') or sys.stdout
+
+        self._writer = native_threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        """Write out whatever is still queued and stop the writer thread."""
+        if self._writer:
+            self.queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def log(self, event, level=logging.INFO, **fields):
+        if level < self.level or not self.sampler.allow(event):
+            return
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.put((time.time(), level, event, fields))
+
+    def _write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty() and batch[-1] is not None:
+                batch.append(self.queue.get())
+
+            done = batch[-1] is None
+            lines = [format_line(*entry) for entry in batch if entry is not None]
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                    self.written += len(lines)
+                except Exception:
+                    self.dropped += len(lines)
+            if done:
+                return
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'sampled_out': self.sampler.sampled_out,
+            'rate_limited': self.sampler.rate_limited,
+        }
+
+events = EventLog()
+atexit.register(events.stop)
+
+def log_event(event, level=logging.INFO, **fields):
+    events.log(event, level, **fields)
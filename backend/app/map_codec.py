@@ -0,0 +1,118 @@
+import msgspec
+from typing import Optional
+from . import socketio
+from .socket_context import connections
+from .spatial_index import intersects
+
+## Map socket wire encoding
+#
+# Clients opt in to MessagePack per connection by connecting with
+# auth={'codec': 'msgpack'}. Their map events arrive as bytes and are decoded
+# through the typed Structs below; everything sent to them is MessagePack.
+# JSON clients in the same room keep getting plain dicts.
+#
+# Each event is encoded once per codec: JSON members get the usual emit to
+# map_{id}, MessagePack members additionally sit in map_{id}:msgpack.
+
+CODECS = ('json', 'msgpack')
+
+class Point(msgspec.Struct):
+    x: float
+    y: float
+
+class Marker(msgspec.Struct, omit_defaults=True):
+    id: str
+    pos: Point
+    color: str = '#ff9800'
+    size: str = 'medium'
+    characterId: Optional[str] = None
+
+class Line(msgspec.Struct):
+    id: str
+    start: Point
+    end: Point
+    color: str = '#000000'
+
+class Move(msgspec.Struct):
+    marker_id: str
+    new_position: Point
+
+class AddMarker(msgspec.Struct):
+    map_id: str
+    marker: Marker
+
+class RemoveMarker(msgspec.Struct):
+    map_id: str
+    marker_id: str
+
+class MoveMarker(msgspec.Struct):
+    map_id: str
+    marker_id: str
+    new_position: Point
+
+class AddLine(msgspec.Struct):
+    map_id: str
+    line: Line
+
+class RemoveLine(msgspec.Struct):
+    map_id: str
+    line_id: str
+
+class Viewport(msgspec.Struct):
+    x: float
+    y: float
+    width: float
+    height: float
+
+class SetViewport(msgspec.Struct):
+    map_id: str
+    viewport: Optional[Viewport] = None
+
+class JoinMapRoom(msgspec.Struct):
+    map_id: str
+    last_seq: Optional[int] = None
+    epoch: Optional[str] = None
+
+decoders = {
+    'add_marker': msgspec.msgpack.Decoder(AddMarker),
+    'remove_marker': msgspec.msgpack.Decoder(RemoveMarker),
+    'move_marker': msgspec.msgpack.Decoder(MoveMarker),
+    'add_line': msgspec.msgpack.Decoder(AddLine),
+    'remove_line': msgspec.msgpack.Decoder(RemoveLine),
+    'join_map_room': msgspec.msgpack.Decoder(JoinMapRoom),
+    'set_viewport': msgspec.msgpack.Decoder(SetViewport),
+}
+
+encoder = msgspec.msgpack.Encoder()
+
+def binary_room(map_id):
+    """Extra room joined by MessagePack clients so binary frames go out in one emit."""
+    return f'map_{map_id}:msgpack'
+
+def decode_event(event, data):
+    """Turn a binary payload into the same dict a JSON client would have sent."""
+    if not isinstance(data, (bytes, bytearray)):
+        return data
+    return msgspec.to_builtins(decoders[event].decode(data))
+
+def emit_to_map(event, payload, map_id, skip_sid=None, bbox=None):
+    """Broadcast to a map room, encoding once per codec in use by its members.
+
+    When bbox is given, members whose viewport doesn't intersect it are skipped.
+    """
+    skipped = list(skip_sid) if isinstance(skip_sid, (list, tuple, set)) else [skip_sid] if skip_sid else []
+    if bbox is not None:
+        skipped += [sid for sid, viewport in connections.viewports(map_id).items() if not intersects(viewport, bbox)]
+
+    binary_sids = connections.sids_using_codec(map_id, 'msgpack')
+    if not binary_sids:
+        socketio.emit(event, payload, room=f'map_{map_id}', skip_sid=skipped or None)
+        return
+
+    socketio.emit(event, payload, room=f'map_{map_id}', skip_sid=skipped + binary_sids)
+    socketio.emit(event, encoder.encode(payload), room=binary_room(map_id), skip_sid=skipped or None)
+
+def emit_to_connection(event, payload, sid):
+    if connections.codec(sid) == 'msgpack':
+        payload = encoder.encode(payload)
+    socketio.emit(event, payload, to=sid)
@@ -0,0 +1,202 @@
+from uuid import UUID
+from flask import current_app
+from . import socketio
+from .cluster import cluster
+from .map_codec import binary_room, emit_to_map, emit_to_connection
+from .map_state import map_states
+from .models import Map
+from .move_coalescer import move_coalescer
+from .socket_context import connections
+from .spatial_index import intersects, marker_bbox, line_bbox
+
+## Map room ownership
+#
+# A map room's live state (map_state.py) is held by exactly one worker, the room's
+# owner. Socket handlers check permissions against their own connection cache and
+# then dispatch the change as a room op. The owner runs it directly; any other
+# worker forwards it to the owner, which applies it and broadcasts through the
+# message queue. With a single worker every room is owned locally.
+#
+# Ops run outside the sender's request, so they reply with emit_to_connection.
+
+ops = {}
+# Ops that follow a map being edited or deleted, and don't take a room over
+unclaimed_ops = {'replace', 'close'}
+
+def room_op(f):
+    ops[f.__name__] = f
+    return f
+
+def dispatch(map_id, op, **kwargs):
+    """Run a room op on the worker that owns the map room, claiming it if nobody does."""
+    cluster.ensure_listener(current_app._get_current_object())
+    if map_states.get(map_id) is None:
+        # Replacing or closing a room nobody holds needs no owner, they just run here
+        owner = cluster.owner(map_id) if op in unclaimed_ops else cluster.claim(map_id)
+        if owner and owner != cluster.host_id:
+            cluster.send(owner, 'map_op', map_id=map_id, op=op, kwargs=kwargs)
+            return
+    ops[op](map_id, **kwargs)
+
+@cluster.on('map_op')
+def on_map_op(map_id, op, kwargs):
+    # Ownership may have moved on since the sender looked, dispatch passes it along if so
+    dispatch(UUID(map_id), op, **kwargs)
+
+@cluster.on('map_evicted')
+def on_map_evicted(map_id, sids):
+    connections.forget(UUID(map_id), sids)
+
+def room_state(map_id):
+    """Return the live state of a room owned here, loading it if needed."""
+    map_states.ensure_flusher(current_app._get_current_object())
+    state = map_states.get(map_id)
+    if state:
+        return state
+
+    map = Map.query.get(map_id)
+    if not map:
+        return None
+
+    # Taking the room over, pick up the members other workers registered
+    for sid, member in cluster.members(map_id).items():
+        connections.add_member(map_id, sid, member['codec'], member['is_dm'], member['viewport'])
+    return map_states.load(map)
+
+def map_not_found(sid):
+    emit_to_connection('error', {'message': 'Map not found'}, sid)
+
+@room_op
+def join(map_id, sid, codec='json', is_dm=False, last_seq=None, epoch=None):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    connections.add_member(map_id, sid, codec, is_dm)
+    cluster.add_member(map_id, sid, codec, is_dm)
+
+    # A reconnecting client that tells us the last op it saw only needs what it missed
+    missed = state.ops_since(last_seq, epoch)
+    if missed is not None:
+        emit_to_connection('map_ops_replay', {'map_id': str(map_id), 'epoch': state.epoch, 'seq': state.seq, 'ops': missed}, sid)
+        return
+
+    # Otherwise serve the current state straight from the server's copy of the room
+    emit_to_connection('initialize_map_state', state.snapshot(), sid)
+
+@room_op
+def leave(map_id, sid):
+    connections.remove_member(map_id, sid)
+    cluster.remove_member(map_id, sid)
+
+@room_op
+def add_marker(map_id, sid, marker):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    state.add_marker(marker)
+    emit_to_map('marker_added', state.record('marker_added', {'marker': marker}), map_id, skip_sid=sid, bbox=marker_bbox(marker))
+
+@room_op
+def remove_marker(map_id, sid, marker_id):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    removed = state.remove_marker(marker_id)
+    bbox = marker_bbox(removed) if removed else None
+    emit_to_map('marker_removed', state.record('marker_removed', {'marker_id': marker_id}), map_id, skip_sid=sid, bbox=bbox)
+
+@room_op
+def move_marker(map_id, sid, marker_id, new_position):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    # Clients that could see where the marker was need the move too
+    old_bbox = state.bbox('marker', marker_id)
+    state.move_marker(marker_id, new_position)
+    move_coalescer.push(map_id, marker_id, new_position, sid, current_app.config.get('MAP_MOVE_TICK', 0.05), old_bbox)
+
+@room_op
+def add_line(map_id, sid, line):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    state.add_line(line)
+    emit_to_map('line_added', state.record('line_added', {'line': line}), map_id, skip_sid=sid, bbox=line_bbox(line))
+
+@room_op
+def remove_line(map_id, sid, line_id):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    removed = state.remove_line(line_id)
+    bbox = line_bbox(removed) if removed else None
+    emit_to_map('line_removed', state.record('line_removed', {'line_id': line_id}), map_id, skip_sid=sid, bbox=bbox)
+
+@room_op
+def set_viewport(map_id, sid, viewport):
+    state = room_state(map_id)
+    if not state:
+        return map_not_found(sid)
+
+    member = connections.member(map_id, sid)
+    if not member:
+        # Left the room before this got here
+        return
+
+    previous = member.viewport
+    member.viewport = viewport
+    cluster.add_member(map_id, sid, member.codec, member.is_dm, viewport)
+    if viewport is None:
+        # No viewport means the client wants everything again
+        return
+
+    # Objects that were already in view have been kept up to date, only send what just came into view
+    objects = state.objects_in_rect(viewport)
+    if previous is not None:
+        objects = {
+            'markers': [m for m in objects['markers'] if not intersects(previous, marker_bbox(m))],
+            'lines': [l for l in objects['lines'] if not intersects(previous, line_bbox(l))],
+        }
+
+    emit_to_connection('viewport_state', {
+        'map_id': str(map_id),
+        'viewport': list(viewport),
+        'previous': list(previous) if previous else None,
+        'markers': objects['markers'],
+        'lines': objects['lines'],
+        'seq': state.seq,
+    }, sid)
+
+@room_op
+def replace(map_id, markers, lines):
+    # The caller has already written these to the database
+    state = map_states.get(map_id)
+    if state:
+        state.replace(markers, lines)
+        state.mark_clean()
+
+@room_op
+def close(map_id, players_only=False):
+    """Persist and drop a room's live state, then take its members out of the room."""
+    map_states.flush(map_id)
+    map_states.discard(map_id)
+    move_coalescer.discard(map_id)
+
+    sids = set(connections.invalidate_map(map_id, players_only=players_only))
+    for sid, member in cluster.members(map_id).items():
+        if not (players_only and member['is_dm']):
+            sids.add(sid)
+
+    for sid in sids:
+        cluster.remove_member(map_id, sid)
+        socketio.server.leave_room(sid, f'map_{map_id}', namespace='/')
+        socketio.server.leave_room(sid, binary_room(map_id), namespace='/')
+
+    # Other workers drop their cached membership of the evicted sockets
+    cluster.broadcast('map_evicted', map_id=map_id, sids=list(sids))
@@ -0,0 +1,242 @@
+import logging
+import time
+import uuid
+from collections import deque
+from flask import current_app
+from sqlalchemy import update
+from . import socketio, db
+from .cluster import cluster
+from .event_log import log_event
+from .models import Map
+from .spatial_index import GridIndex, marker_bbox, line_bbox
+
+## In-memory map room state
+#
+# The server holds the authoritative copy of every map that has an active room.
+# Socket handlers apply events to it as they arrive, late joiners are served from
+# it directly, and dirty rooms are written back to Map.markers/Map.lines by a
+# background task once they have been quiet for a while (write-behind). With several
+# workers, only the one that owns a room (see map_rooms.py) holds its state.
+#
+# Every broadcast op gets the room's next sequence number and is kept in a
+# bounded log, so a client that reconnects with the last sequence it saw can be
+# sent just the ops it missed. The epoch changes whenever the room is (re)loaded
+# or replaced wholesale, which tells clients their sequence numbers are stale.
+#
+# Markers and lines are also kept in a spatial index so broadcasts and
+# viewport refreshes can be limited to the clients that can actually see them.
+
+class MapRoomState:
+    def __init__(self, map_id, markers=None, lines=None, op_log_size=500):
+        self.map_id = map_id
+        self.markers = {str(marker['id']): marker for marker in markers or [] if marker.get('id')}
+        self.lines = {str(line['id']): line for line in lines or [] if line.get('id')}
+        self.dirty_since = None
+        self.last_change = None
+        # Counts changes, so a write can tell whether the room moved on while it ran
+        self.changes = 0
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.ops = deque(maxlen=op_log_size)
+        self._reindex()
+
+    def _reindex(self):
+        self.index = GridIndex()
+        for marker_id, marker in self.markers.items():
+            self.index.insert(('marker', marker_id), marker_bbox(marker))
+        for line_id, line in self.lines.items():
+            self.index.insert(('line', line_id), line_bbox(line))
+
+    def _touch(self):
+        now = time.monotonic()
+        if self.dirty_since is None:
+            self.dirty_since = now
+        self.last_change = now
+        self.changes += 1
+
+    @property
+    def dirty(self):
+        return self.dirty_since is not None
+
+    def mark_clean(self, changes=None):
+        """Mark the room saved, unless it has changed since changes was read."""
+        if changes is not None and changes != self.changes:
+            return
+        self.dirty_since = None
+        self.last_change = None
+
+    def add_marker(self, marker):
+        self.markers[str(marker['id'])] = marker
+        self.index.insert(('marker', str(marker['id'])), marker_bbox(marker))
+        self._touch()
+
+    def remove_marker(self, marker_id):
+        """Remove a marker, returning it (or None if it wasn't on the map)."""
+        marker = self.markers.pop(str(marker_id), None)
+        if marker is None:
+            return None
+        self.index.remove(('marker', str(marker_id)))
+        self._touch()
+        return marker
+
+    def move_marker(self, marker_id, new_position):
+        marker = self.markers.get(str(marker_id))
+        if marker is None:
+            return False
+        marker['pos'] = new_position
+        self.index.insert(('marker', str(marker_id)), marker_bbox(marker))
+        self._touch()
+        return True
+
+    def add_line(self, line):
+        self.lines[str(line['id'])] = line
+        self.index.insert(('line', str(line['id'])), line_bbox(line))
+        self._touch()
+
+    def remove_line(self, line_id):
+        """Remove a line, returning it (or None if it wasn't on the map)."""
+        line = self.lines.pop(str(line_id), None)
+        if line is None:
+            return None
+        self.index.remove(('line', str(line_id)))
+        self._touch()
+        return line
+
+    def bbox(self, kind, object_id):
+        return self.index.bbox((kind, str(object_id)))
+
+    def objects_in_rect(self, bbox):
+        return self._collect(self.index.query_rect(bbox))
+
+    def objects_in_radius(self, x, y, radius):
+        return self._collect(self.index.query_radius(x, y, radius))
+
+    def _collect(self, keys):
+        return {
+            'markers': [self.markers[object_id] for kind, object_id in keys if kind == 'marker'],
+            'lines': [self.lines[object_id] for kind, object_id in keys if kind == 'line'],
+        }
+
+    def replace(self, markers, lines):
+        self.markers = {str(marker['id']): marker for marker in markers or [] if marker.get('id')}
+        self.lines = {str(line['id']): line for line in lines or [] if line.get('id')}
+        self._reindex()
+        # Nothing in the log leads to this state, so start a new epoch
+        self.epoch = uuid.uuid4().hex
+        self.ops.clear()
+        self._touch()
+
+    def record(self, event, data):
+        """Assign the next sequence number to a broadcast op and keep it for replay."""
+        self.seq += 1
+        data = dict(data, seq=self.seq)
+        self.ops.append({'seq': self.seq, 'event': event, 'data': data})
+        return data
+
+    def ops_since(self, seq, epoch):
+        """Ops after seq, or None when the log can't cover the gap and a snapshot is needed."""
+        if seq is None or epoch != self.epoch or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.ops or self.ops[0]['seq'] > seq + 1:
+            return None
+        return [op for op in self.ops if op['seq'] > seq]
+
+    def snapshot(self):
+        return {
+            'map_id': str(self.map_id),
+            'markers': list(self.markers.values()),
+            'lines': list(self.lines.values()),
+            'epoch': self.epoch,
+            'seq': self.seq,
+        }
+
+    def is_due(self, now, debounce, max_delay):
+        if not self.dirty:
+            return False
+        return now - self.last_change >= debounce or now - self.dirty_since >= max_delay
+
+class MapStateStore:
+    def __init__(self):
+        self.rooms = {}
+        self._flusher = None
+
+    def get(self, map_id):
+        return self.rooms.get(map_id)
+
+    def load(self, map):
+        room = self.rooms.get(map.id)
+        if room is None:
+            room = MapRoomState(map.id, map.markers, map.lines, current_app.config.get('MAP_OP_LOG_SIZE', 500))
+            self.rooms[map.id] = room
+        return room
+
+    def discard(self, map_id):
+        cluster.release(map_id)
+        return self.rooms.pop(map_id, None)
+
+    def flush(self, map_id):
+        """Write one room back to the database immediately, regardless of debounce."""
+        room = self.rooms.get(map_id)
+        if room is None or not room.dirty:
+            return False
+        self._write([room])
+        return True
+
+    def flush_due(self, now=None):
+        config = current_app.config
+        debounce = config.get('MAP_STATE_FLUSH_DEBOUNCE', 1.0)
+        max_delay = config.get('MAP_STATE_FLUSH_MAX_DELAY', 10.0)
+        now = time.monotonic() if now is None else now
+
+        due = [room for room in self.rooms.values() if room.is_due(now, debounce, max_delay)]
+        if due:
+            self._write(due)
+        return len(due)
+
+    def _write(self, rooms):
+        written = []
+        try:
+            for room in rooms:
+                # The UPDATE can yield to the hub, ops landing meanwhile bump changes
+                changes, snapshot = room.changes, room.snapshot()
+                result = db.session.execute(
+                    update(Map)
+                    .where(Map.id == room.map_id)
+                    .values(markers=snapshot['markers'], lines=snapshot['lines'])
+                )
+                written.append((room, changes, result.rowcount))
+            db.session.commit()
+        except Exception:
+            # Nothing was saved, the rooms stay dirty for the next flush
+            db.session.rollback()
+            raise
+
+        for room, changes, rowcount in written:
+            if rowcount == 0:
+                # Map was deleted underneath us, nothing left to persist into
+                self.discard(room.map_id)
+            else:
+                room.mark_clean(changes)
+
+    def ensure_flusher(self, app):
+        if self._flusher is None:
+            self._flusher = socketio.start_background_task(self._flush_loop, app)
+
+    def _flush_loop(self, app):
+        interval = app.config.get('MAP_STATE_FLUSH_INTERVAL', 0.5)
+        while True:
+            socketio.sleep(interval)
+            with app.app_context():
+                try:
+                    for map_id in cluster.keep_alive(list(self.rooms)):
+                        # Another worker took the room over while we weren't looking, its copy wins
+                        self.rooms.pop(map_id, None)
+                        log_event('map_room_lost', logging.WARNING, map_id=map_id)
+                    self.flush_due()
+                except Exception as e:
+                    db.session.rollback()
+                    log_event('map_flush_failed', logging.ERROR, error=str(e))
+
+map_states = MapStateStore()
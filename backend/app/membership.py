@@ -0,0 +1,56 @@
+from flask import g
+from sqlalchemy import exists, select
+from . import db
+from .models import Campaign, campaign_invites, campaign_users
+
+## Campaign membership
+#
+# "Is this user the DM / a member / invited" used to be answered with
+# `user in campaign.players`, which loads every member of the campaign to test one.
+# Here it is a single row: the campaign's dm_id plus EXISTS probes on the
+# (campaign_id, user_id) primary keys of campaign_users and campaign_invites.
+#
+# Answers are kept on flask.g for the rest of the request or socket event, so a
+# handler can ask again without another query. Anything that changes membership
+# within the same request calls forget().
+
+class Membership:
+    def __init__(self, campaign_id, user_id, dm_id, is_member, has_character, is_invited):
+        self.campaign_id = campaign_id
+        self.user_id = user_id
+        self.is_dm = dm_id == user_id
+        # Has a campaign_users row, which the DM has too
+        self.is_member = is_member
+        # Plays in the campaign with a character
+        self.is_player = has_character
+        self.is_invited = is_invited
+
+    def __repr__(self):
+        return f'<Membership: {self.user_id} in {self.campaign_id}, DM: {self.is_dm}>'
+
+def _cache():
+    if 'membership' not in g:
+        g.membership = {}
+    return g.membership
+
+def membership(campaign_id, user_id):
+    """The user's standing in the campaign, or None if there is no such campaign."""
+    cache = _cache()
+    key = (campaign_id, user_id)
+    if key not in cache:
+        row = db.session.execute(
+            select(
+                Campaign.dm_id,
+                exists().where(campaign_users.c.campaign_id == campaign_id, campaign_users.c.user_id == user_id),
+                exists().where(
+                    campaign_users.c.campaign_id == campaign_id, campaign_users.c.user_id == user_id,
+                    campaign_users.c.character_id != None
+                ),
+                exists().where(campaign_invites.c.campaign_id == campaign_id, campaign_invites.c.user_id == user_id),
+            ).where(Campaign.id == campaign_id)
+        ).first()
+        cache[key] = Membership(campaign_id, user_id, *row) if row else None
+    return cache[key]
+
+def forget(campaign_id, user_id):
+    _cache().pop((campaign_id, user_id), None)
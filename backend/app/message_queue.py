@@ -0,0 +1,190 @@
+import time
+import socketio as python_socketio
+from eventlet.queue import LightQueue
+
+## Message queue backends
+#
+# With more than one worker process, an emit to a room has to reach clients that
+# are connected to other workers. SOCKETIO_MESSAGE_QUEUE picks the client manager
+# that carries those emits: any URL Flask-SocketIO understands (redis://, amqp://,
+# kafka://, ...) or local:// for the in-process stand-in below.
+#
+# The stand-in implements the part of the redis-py client that the Redis client
+# manager and the shared state (cluster.py) use, with one store per URL, so tests
+# can run several "workers" against the same broker inside one process.
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+# Seconds between sweeps of the stand-in's expired keys
+SWEEP_INTERVAL = 1.0
+
+class LocalServer:
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.subscribers = {}
+        self.swept = time.monotonic()
+
+    def expired(self, name):
+        expires = self.expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self.values.pop(name, None)
+            self.expires.pop(name, None)
+            return True
+        return False
+
+    def sweep(self):
+        """Drop every expired key. Keys nobody reads again would otherwise be kept forever."""
+        now = time.monotonic()
+        if now - self.swept < SWEEP_INTERVAL:
+            return
+        self.swept = now
+        for name in [name for name, expires in self.expires.items() if expires <= now]:
+            self.values.pop(name, None)
+            self.expires.pop(name, None)
+
+class LocalPubSub:
+    def __init__(self, server, ignore_subscribe_messages=False):
+        # Subscribe confirmations are never generated, so ignore_subscribe_messages is implied
+        self.server = server
+        self.channels = set()
+        self.queue = LightQueue()
+
+    @property
+    def subscribed(self):
+        return bool(self.channels)
+
+    def subscribe(self, *channels):
+        for channel in channels:
+            channel = _encode(channel)
+            self.channels.add(channel)
+            self.server.subscribers.setdefault(channel, set()).add(self)
+
+    def unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            channel = _encode(channel)
+            self.channels.discard(channel)
+            self.server.subscribers.get(channel, set()).discard(self)
+        # Wake up listen() so it notices
+        self.queue.put(None)
+
+    def listen(self):
+        while self.subscribed:
+            message = self.queue.get()
+            if message is not None:
+                yield message
+
+class LocalRedis:
+    servers = {}
+
+    def __init__(self, server):
+        self.server = server
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        return cls(cls.servers.setdefault(url, LocalServer()))
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return LocalPubSub(self.server, ignore_subscribe_messages)
+
+    def publish(self, channel, message):
+        channel = _encode(channel)
+        subscribers = list(self.server.subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub.queue.put({'type': 'message', 'pattern': None, 'channel': channel, 'data': _encode(message)})
+        return len(subscribers)
+
+    def get(self, name):
+        if self.server.expired(name):
+            return None
+        return self.server.values.get(name)
+
+    def set(self, name, value, ex=None, nx=False, xx=False):
+        self.server.sweep()
+        exists = self.get(name) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.server.values[name] = _encode(value)
+        if ex is not None:
+            self.server.expires[name] = time.monotonic() + ex
+        else:
+            self.server.expires.pop(name, None)
+        return True
+
+    def expire(self, name, seconds):
+        if self.get(name) is None:
+            return False
+        self.server.expires[name] = time.monotonic() + seconds
+        return True
+
+    def delete(self, *names):
+        deleted = 0
+        for name in names:
+            if self.get(name) is not None:
+                deleted += 1
+            self.server.values.pop(name, None)
+            self.server.expires.pop(name, None)
+        return deleted
+
+    def hset(self, name, key, value):
+        fields = self.server.values.setdefault(name, {})
+        added = _encode(key) not in fields
+        fields[_encode(key)] = _encode(value)
+        return int(added)
+
+    def hget(self, name, key):
+        return self.server.values.get(name, {}).get(_encode(key))
+
+    def hdel(self, name, *keys):
+        fields = self.server.values.get(name, {})
+        deleted = sum(1 for key in keys if fields.pop(_encode(key), None) is not None)
+        if name in self.server.values and not fields:
+            del self.server.values[name]
+        return deleted
+
+    def hgetall(self, name):
+        return dict(self.server.values.get(name, {}))
+
+    def flushdb(self):
+        self.server.values.clear()
+        self.server.expires.clear()
+        return True
+
+class LocalRedisManager(python_socketio.RedisManager):
+    """The Socket.IO Redis client manager, running against LocalRedis instead of a server."""
+    name = 'local'
+
+    def __init__(self, url='local://', channel='flask-socketio', write_only=False, logger=None):
+        self.redis_url = url
+        self.redis_options = {}
+        self._redis_connect()
+        python_socketio.PubSubManager.__init__(self, channel=channel, write_only=write_only, logger=logger)
+
+    def initialize(self):
+        # Nothing here goes over a real socket, so there is no monkey patching to insist on
+        python_socketio.PubSubManager.initialize(self)
+
+    def _redis_connect(self):
+        self.redis = LocalRedis.from_url(self.redis_url)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+
+def connect(url):
+    """Open a Redis client for url, or a LocalRedis for local:// URLs."""
+    if url.startswith('local://'):
+        return LocalRedis.from_url(url)
+    if not url.startswith(('redis://', 'rediss://', 'unix://')):
+        raise ValueError(f'Shared state needs a Redis URL, got {url}')
+
+    import redis
+    return redis.Redis.from_url(url)
+
+def queue_options(url):
+    """Keyword arguments for SocketIO.init_app selecting the message queue for url."""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalRedisManager(url)}
+    return {'message_queue': url}
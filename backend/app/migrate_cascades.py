@@ -0,0 +1,48 @@
+from sqlalchemy import inspect, text
+from . import create_app, db
+
+## ON DELETE actions for existing databases
+#
+# db.create_all() only creates missing tables, so databases created before the
+# foreign keys in models.py gained their ondelete actions keep their old constraints.
+# This rewrites each of them in place, keeping its name. Safe to run again.
+#
+#   cd backend && python -m app.migrate_cascades
+
+CASCADES = [
+    # (table, column, referenced table, on delete)
+    ('campaign', 'dm_id', 'user', 'CASCADE'),
+    ('character', 'user_id', 'user', 'CASCADE'),
+    ('map', 'owner_id', 'user', 'CASCADE'),
+    ('map', 'campaign_id', 'campaign', 'CASCADE'),
+    ('campaign_users', 'campaign_id', 'campaign', 'CASCADE'),
+    ('campaign_users', 'user_id', 'user', 'CASCADE'),
+    ('campaign_users', 'character_id', 'character', 'SET NULL'),
+    ('campaign_invites', 'campaign_id', 'campaign', 'CASCADE'),
+    ('campaign_invites', 'user_id', 'user', 'CASCADE'),
+]
+
+def migrate(connection):
+    inspector = inspect(connection)
+    for table, column, referred, action in CASCADES:
+        for foreign_key in inspector.get_foreign_keys(table):
+            if foreign_key['constrained_columns'] != [column]:
+                continue
+            if (foreign_key.get('options') or {}).get('ondelete', '').upper() == action:
+                print(f"{table}.{column}: already ON DELETE {action}")
+                continue
+
+            name = foreign_key['name']
+            connection.execute(text(
+                f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}", '
+                f'ADD CONSTRAINT "{name}" FOREIGN KEY ("{column}") REFERENCES "{referred}" (id) ON DELETE {action}'
+            ))
+            print(f"{table}.{column}: now ON DELETE {action}")
+
+if __name__ == '__main__':
+    app, _ = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            raise SystemExit("Only PostgreSQL databases need migrating, SQLite ones are recreated with create_all()")
+        with db.engine.begin() as connection:
+            migrate(connection)
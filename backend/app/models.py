@@ -1,33 +1,51 @@
+import sqlite3
 import uuid
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from . import db
 
+# Deleting a campaign, user or character removes what hangs off it in the database
+# (ON DELETE CASCADE), the ORM is told not to load those rows first (passive_deletes).
+# Existing databases get the cascades from migrate_cascades.py.
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and so only cascades, when asked to
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 # Define a many-to-many relationship between Campaign and Character
 campaign_users = db.Table('campaign_users',
-    db.Column('campaign_id', UUID(as_uuid=True), db.ForeignKey('campaign.id'), primary_key=True),
-    db.Column('user_id', UUID(as_uuid=True), db.ForeignKey('user.id'), primary_key=True),
-    db.Column('character_id', UUID(as_uuid=True), db.ForeignKey('character.id'), nullable=True)
+    db.Column('campaign_id', db.Uuid, db.ForeignKey('campaign.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Uuid, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    # Dropping a character leaves its owner in the campaign, without a character
+    db.Column('character_id', db.Uuid, db.ForeignKey('character.id', ondelete='SET NULL'), nullable=True),
+    # The primary key leads with campaign_id, lookups by user need their own index
+    db.Index('ix_campaign_users_user_id', 'user_id', 'campaign_id')
 )
 
 campaign_invites = db.Table('campaign_invites',
-    db.Column('campaign_id', UUID(as_uuid=True), db.ForeignKey('campaign.id'), primary_key=True),
-    db.Column('user_id', UUID(as_uuid=True), db.ForeignKey('user.id'), primary_key=True)
+    db.Column('campaign_id', db.Uuid, db.ForeignKey('campaign.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Uuid, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_campaign_invites_user_id', 'user_id', 'campaign_id')
 )
 
 class Campaign(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.String(255), nullable=False)
-    dm_id = db.Column(UUID(as_uuid=True), db.ForeignKey("user.id"), nullable=False)
+    dm_id = db.Column(db.Uuid, db.ForeignKey("user.id", ondelete='CASCADE'), nullable=False)
     dm = db.relationship("User", back_populates="dm_campaigns")
-    players = db.relationship("User", secondary=campaign_users, back_populates="player_campaigns")
-    invited_users = db.relationship("User", secondary=campaign_invites, back_populates="invited_campaigns")
+    players = db.relationship("User", secondary=campaign_users, back_populates="player_campaigns", passive_deletes=True)
+    invited_users = db.relationship("User", secondary=campaign_invites, back_populates="invited_campaigns", passive_deletes=True)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=True)
     meeting_time = db.Column(db.Time, nullable=False)
     meeting_day = db.Column(db.String(50), nullable=False)
     meeting_frequency = db.Column(db.String(50), nullable=False)
-    maps = db.relationship("Map", back_populates="campaign", cascade="all, delete-orphan")
+    maps = db.relationship("Map", back_populates="campaign", cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, name, description, dm_id, start_date, end_date, meeting_time, meeting_day, meeting_frequency):
         self.name = name
@@ -45,10 +63,14 @@ class Campaign(db.Model):
     __table_args__ = (
         db.Index('ix_campaign_dm_id', 'dm_id'),
         db.Index('ix_campaign_id', 'id'),
+        # Keyset pagination: (sort key, id) for each sort in campaign_dashboard and the report
+        db.Index('ix_campaign_name_id', 'name', 'id'),
+        db.Index('ix_campaign_start_date_id', 'start_date', 'id'),
+        db.Index('ix_campaign_meeting_time_id', 'meeting_time', 'id'),
     )
     
 class ClassType(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.String(255), nullable=False)
 
@@ -60,7 +82,7 @@ class ClassType(db.Model):
         return f'<ClassType: {self.name}>'
     
 class Race(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.String(255), nullable=False)
 
@@ -72,27 +94,29 @@ class Race(db.Model):
         return f'<Race: {self.name}>'
     
 class User(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     first = db.Column(db.String(50), nullable=False)
     last = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(50), nullable=False)
     password = db.Column(db.String(128), nullable=False)
     username = db.Column(db.String(50), nullable=False)
-    characters = db.relationship("Character", back_populates="user", cascade="all, delete-orphan")
-    dm_campaigns = db.relationship("Campaign", back_populates="dm", cascade="all, delete-orphan")
+    characters = db.relationship("Character", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    dm_campaigns = db.relationship("Campaign", back_populates="dm", cascade="all, delete-orphan", passive_deletes=True)
     invited_campaigns = db.relationship(
         "Campaign", secondary=campaign_invites, 
         primaryjoin=(id==campaign_invites.c.user_id), 
         secondaryjoin=(campaign_invites.c.campaign_id==Campaign.id),
-        back_populates="invited_users"
+        back_populates="invited_users",
+        passive_deletes=True
     )
     player_campaigns = db.relationship(
         "Campaign", secondary=campaign_users, 
         primaryjoin=(id==campaign_users.c.user_id) & (campaign_users.c.character_id != None), 
         secondaryjoin=(campaign_users.c.campaign_id==Campaign.id),
-        back_populates="players"
+        back_populates="players",
+        passive_deletes=True
     )
-    maps = db.relationship("Map", back_populates="owner", cascade="all, delete-orphan")
+    maps = db.relationship("Map", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, first, last, email, password, username):
         self.first = first
@@ -109,15 +133,15 @@ class User(db.Model):
     )
     
 class Character(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
     gender = db.Column(db.String(50), nullable=False)
-    race_id = db.Column(UUID(as_uuid=True), db.ForeignKey("race.id"), nullable=False)
+    race_id = db.Column(db.Uuid, db.ForeignKey("race.id"), nullable=False)
     race = db.relationship("Race")
-    class_id = db.Column(UUID(as_uuid=True), db.ForeignKey("class_type.id"), nullable=False)
+    class_id = db.Column(db.Uuid, db.ForeignKey("class_type.id"), nullable=False)
     class_type = db.relationship("ClassType")
     level = db.Column(db.Integer, default=1)
-    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Uuid, db.ForeignKey("user.id", ondelete='CASCADE'), nullable=False)
     user = db.relationship("User", back_populates="characters")
     speed = db.Column(db.Integer, default=30)
     size = db.Column(db.String(50), default='medium')
@@ -141,13 +165,18 @@ class Character(db.Model):
         db.Index('ix_character_id', 'id'),
         db.Index('ix_race_id', 'race_id'),
         db.Index('ix_class_id', 'class_id'),
+        # Keyset pagination of a user's characters and of the character report
+        db.Index('ix_character_user_id_name_id', 'user_id', 'name', 'id'),
+        db.Index('ix_character_user_id_level_id', 'user_id', 'level', 'id'),
+        db.Index('ix_character_name_id', 'name', 'id'),
+        db.Index('ix_character_level_id', 'level', 'id'),
     )
 
 class Map(db.Model):
-    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = db.Column(db.Uuid, primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
-    owner_id = db.Column(UUID(as_uuid=True), db.ForeignKey("user.id"), nullable=False)
-    campaign_id = db.Column(UUID(as_uuid=True), db.ForeignKey("campaign.id"), nullable=False)
+    owner_id = db.Column(db.Uuid, db.ForeignKey("user.id", ondelete='CASCADE'), nullable=False)
+    campaign_id = db.Column(db.Uuid, db.ForeignKey("campaign.id", ondelete='CASCADE'), nullable=False)
     markers = db.Column(db.JSON, nullable=True, default=[])
     lines = db.Column(db.JSON, nullable=True, default=[])
     is_open = db.Column(db.Boolean, default=False)
@@ -172,4 +201,26 @@ class Map(db.Model):
         }
 
     def __repr__(self):
-        return f'<Map: {self.name}>'
\ No newline at end of file
+        return f'<Map: {self.name}>'
+
+    __table_args__ = (
+        # Keyset pagination of a campaign's maps by name
+        db.Index('ix_map_campaign_id_name_id', 'campaign_id', 'name', 'id'),
+    )
+
+class ReportRollup(db.Model):
+    # Running totals behind the report summaries, kept by report_rollups.py
+    __tablename__ = 'report_rollup'
+    scope = db.Column(db.String(120), primary_key=True)
+    dimension = db.Column(db.String(50), primary_key=True)
+    key = db.Column(db.String(120), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __init__(self, scope, dimension, key, value):
+        self.scope = scope
+        self.dimension = dimension
+        self.key = key
+        self.value = value
+
+    def __repr__(self):
+        return f'<ReportRollup: {self.scope}/{self.dimension}/{self.key} = {self.value}>'
@@ -0,0 +1,106 @@
+from . import socketio
+from .map_state import map_states
+from .map_codec import emit_to_map, emit_to_connection
+from .socket_context import connections
+from .spatial_index import intersects, union
+
+## Coalesced marker movement
+#
+# Dragging a token produces a move_marker event per mouse step. Instead of
+# relaying each one to the whole room, the latest position per marker is kept
+# for one tick and the tick goes out as a single markers_moved frame.
+# Intermediate positions for the same marker are dropped.
+#
+# Members that have set a viewport only get the moves that start or end inside it.
+
+class MoveCoalescer:
+    def __init__(self):
+        self.pending = {}
+        self.ticking = set()
+        self.received = 0
+        self.coalesced = 0
+        self.frames = 0
+        self.moves_sent = 0
+
+    def push(self, map_id, marker_id, new_position, sid, tick, old_bbox=None):
+        """Buffer a move. With a tick of 0 the move is broadcast straight away."""
+        self.received += 1
+        moves = self.pending.setdefault(map_id, {})
+        if marker_id in moves:
+            self.coalesced += 1
+            # Keep where the marker started this tick, that's where viewers last saw it
+            old_bbox = moves[marker_id][2]
+        moves[marker_id] = (new_position, sid, old_bbox)
+
+        if tick <= 0:
+            self.flush(map_id)
+        elif map_id not in self.ticking:
+            self.ticking.add(map_id)
+            socketio.start_background_task(self._tick_loop, map_id, tick)
+
+    def flush(self, map_id):
+        """Broadcast everything buffered for a room as one frame. Returns the number of moves sent."""
+        moves = self.pending.pop(map_id, None)
+        if not moves:
+            return 0
+
+        payload = {
+            'moves': [
+                {'marker_id': marker_id, 'new_position': new_position}
+                for marker_id, (new_position, _, _) in moves.items()
+            ]
+        }
+        room = map_states.get(map_id)
+        if room:
+            payload = room.record('markers_moved', payload)
+
+        senders = {sid for _, sid, _ in moves.values()}
+        sender = senders.pop() if len(senders) == 1 else None
+
+        viewports = connections.viewports(map_id)
+        if not viewports:
+            emit_to_map('markers_moved', payload, map_id, skip_sid=sender)
+        else:
+            # Everyone without a viewport gets the whole frame, the rest get their slice of it
+            emit_to_map('markers_moved', payload, map_id, skip_sid=[sender, *viewports] if sender else list(viewports))
+            bboxes = {
+                marker_id: union(old_bbox, room.bbox('marker', marker_id) if room else None)
+                for marker_id, (_, _, old_bbox) in moves.items()
+            }
+            for sid, viewport in viewports.items():
+                if sid == sender:
+                    continue
+                visible = [
+                    move for move in payload['moves']
+                    if bboxes[move['marker_id']] is None or intersects(viewport, bboxes[move['marker_id']])
+                ]
+                if visible:
+                    emit_to_connection('markers_moved', dict(payload, moves=visible), sid)
+
+        self.frames += 1
+        self.moves_sent += len(moves)
+        return len(moves)
+
+    def discard(self, map_id):
+        self.pending.pop(map_id, None)
+
+    def _tick_loop(self, map_id, tick):
+        try:
+            while True:
+                socketio.sleep(tick)
+                if not self.flush(map_id):
+                    # Room went quiet, stop ticking until the next move arrives
+                    return
+        finally:
+            self.ticking.discard(map_id)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'frames': self.frames,
+            'moves_sent': self.moves_sent,
+            'pending_rooms': len(self.pending),
+        }
+
+move_coalescer = MoveCoalescer()
@@ -0,0 +1,92 @@
+from sqlalchemy import select, union
+from . import db, socketio
+from .serializers import campaign_summary, to_builtins
+from .cluster import cluster
+from .models import Campaign, campaign_users
+
+## Campaign and invite notifications
+#
+# Every socket joins user_{id} for its user and campaign_{id} for each campaign the
+# user runs or plays in. Write paths push small deltas to those rooms, so a client
+# holding a socket can update its campaign list, invites and maps in place instead
+# of polling the HTTP endpoints.
+#
+# Campaign membership can change while a user is connected, possibly to another
+# worker. Their socket is moved in or out of the campaign room through the Socket.IO
+# manager, which passes the change on to whichever worker holds the socket.
+
+def user_room(user_id):
+    return f'user_{user_id}'
+
+def campaign_room(campaign_id):
+    return f'campaign_{campaign_id}'
+
+def user_campaign_ids(user_id):
+    campaigns = union(
+        select(Campaign.id).where(Campaign.dm_id == user_id),
+        select(campaign_users.c.campaign_id).where(campaign_users.c.user_id == user_id),
+    )
+    return db.session.execute(campaigns).scalars().all()
+
+def join_notification_rooms(sid, user_id):
+    socketio.server.enter_room(sid, user_room(user_id), namespace='/')
+    for campaign_id in user_campaign_ids(user_id):
+        socketio.server.enter_room(sid, campaign_room(campaign_id), namespace='/')
+
+def resubscribe(user_id):
+    """Put the user's socket, if any, in the rooms of every campaign they are in now."""
+    sid = cluster.user_socket(user_id)
+    if sid:
+        join_notification_rooms(sid, user_id)
+
+def subscribe_to_campaign(user_id, campaign_id):
+    sid = cluster.user_socket(user_id)
+    if sid:
+        socketio.server.enter_room(sid, campaign_room(campaign_id), namespace='/')
+
+def unsubscribe_from_campaign(user_id, campaign_id):
+    sid = cluster.user_socket(user_id)
+    if sid:
+        socketio.server.leave_room(sid, campaign_room(campaign_id), namespace='/')
+
+def notify_user(user_id, event, payload):
+    socketio.emit(event, payload, to=user_room(user_id))
+
+def notify_campaign(campaign_id, event, payload, skip_sid=None):
+    socketio.emit(event, payload, to=campaign_room(campaign_id), skip_sid=skip_sid)
+
+## Deltas
+
+def invite_received(campaign):
+    # The same shape as an entry of get_invites
+    return to_builtins(campaign_summary(campaign, dm=campaign.dm.username))
+
+def member_joined(campaign, user, character):
+    return {
+        "campaign_id": str(campaign.id),
+        "user_id": str(user.id),
+        "username": user.username,
+        # The same shape as an entry of a get_campaigns campaign's characters
+        "character": {
+            "id": str(character.id),
+            "name": character.name,
+            "gender": character.gender,
+            "race_id": str(character.race_id),
+            "race": character.race.name,
+            "class_id": str(character.class_id),
+            "classType": character.class_type.name,
+            "level": character.level,
+            "marker_color": character.marker_color,
+            "size": character.size,
+        },
+    }
+
+def map_summary(map):
+    # The same shape as an entry of a get_campaigns campaign's maps
+    return {
+        "id": str(map.id),
+        "name": map.name,
+        "owner_id": str(map.owner_id),
+        "campaign_id": str(map.campaign_id),
+        "is_open": map.is_open
+    }
@@ -0,0 +1,118 @@
+import base64
+import json
+import uuid
+from datetime import date, datetime, time
+from sqlalchemy import literal, tuple_
+
+## Keyset pagination
+#
+# List endpoints take optional query args:
+#   sort    one of the endpoint's sort keys
+#   order   asc (default) or desc
+#   limit   page size, up to MAX_PAGE_SIZE. Without it the whole list comes back as before
+#   cursor  next_cursor from the previous page
+#
+# Rows are ordered by (sort key, id), the id making the order total. A page starts
+# right after the last row of the previous one, WHERE (key, id) > (:key, :id), rather
+# than at an OFFSET, so with an index on (..., key, id) fetching page 50 costs the
+# same as fetching page 1. The cursor is that last (key, id) pair, plus the sort it
+# belongs to.
+
+MAX_PAGE_SIZE = 200
+
+class PageError(ValueError):
+    pass
+
+def parse_value(type_, raw):
+    python_type = type_.python_type
+    if python_type in (date, datetime, time):
+        return python_type.fromisoformat(raw)
+    return python_type(raw)
+
+class Page:
+    def __init__(self, sort, column, descending=False, limit=None, after=None):
+        self.sort = sort
+        self.column = column
+        self.descending = descending
+        self.limit = limit
+        # (sort key, id) of the last row of the previous page
+        self.after = after
+
+    @classmethod
+    def from_args(cls, args, sort_keys, default_sort='name'):
+        """Read sort, order, limit and cursor. sort_keys maps each sort name to its column."""
+        sort, order, after = args.get('sort'), args.get('order'), None
+
+        if args.get('cursor'):
+            try:
+                cursor_sort, cursor_order, key, id = json.loads(base64.urlsafe_b64decode(args['cursor']))
+            except (ValueError, TypeError):
+                raise PageError("Invalid cursor")
+            if (sort or cursor_sort) != cursor_sort or (order or cursor_order) != cursor_order:
+                raise PageError("Cursor belongs to a different sort order")
+            sort, order = cursor_sort, cursor_order
+
+        sort = sort or default_sort
+        if sort not in sort_keys:
+            raise PageError(f"Unknown sort key: {sort}. Expected one of: {', '.join(sort_keys)}")
+        order = order or 'asc'
+        if order not in ('asc', 'desc'):
+            raise PageError("order must be asc or desc")
+        column = sort_keys[sort]
+
+        if args.get('cursor'):
+            try:
+                after = (parse_value(column.type, key), uuid.UUID(id))
+            except (ValueError, TypeError, AttributeError):
+                raise PageError("Invalid cursor")
+
+        limit = args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise PageError("limit must be a number")
+            if limit < 1:
+                raise PageError("limit must be at least 1")
+            limit = min(limit, MAX_PAGE_SIZE)
+
+        return cls(sort, column, order == 'desc', limit, after)
+
+    def cursor(self, key, id):
+        value = key.isoformat() if isinstance(key, (date, datetime, time)) else key
+        token = json.dumps([self.sort, 'desc' if self.descending else 'asc', value, str(id)])
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+
+    def apply(self, query, id_column):
+        """Order an ORM query by (sort key, id), start it after the cursor and cap it at limit + 1 rows."""
+        if self.descending:
+            query = query.order_by(self.column.desc(), id_column.desc())
+        else:
+            query = query.order_by(self.column, id_column)
+
+        if self.after:
+            key = tuple_(self.column, id_column)
+            after = tuple_(literal(self.after[0], self.column.type), literal(self.after[1], id_column.type))
+            query = query.filter(key < after if self.descending else key > after)
+
+        # One row more than asked for tells us whether there is a next page
+        if self.limit:
+            query = query.limit(self.limit + 1)
+        return query
+
+    def body(self, name, items, next_cursor):
+        """{name: items}, plus next_cursor when the list was paged."""
+        body = {name: items}
+        if self.limit:
+            body['next_cursor'] = next_cursor
+        return body
+
+    def split(self, rows, key):
+        """The rows of this page and the cursor for the next one (None on the last page).
+
+        key(row) gives a row's (sort key, id).
+        """
+        if not self.limit or len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        return rows, self.cursor(*key(rows[-1]))
@@ -0,0 +1,68 @@
+import bcrypt
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+## Password hashing
+#
+# bcrypt is slow on purpose (a few hundred ms at cost 12) and keeps the calling
+# thread busy the whole time, which under eventlet is the whole worker. Hashes are
+# computed on eventlet's native thread pool instead, where bcrypt releases the GIL,
+# and at most BCRYPT_MAX_CONCURRENCY of them run at once so a burst of logins can't
+# take over the pool or the CPU. Requests over the limit wait their turn, queue_depth
+# counts them.
+
+class PasswordHasher:
+    def __init__(self, rounds=12, max_concurrency=4):
+        self.rounds = rounds
+        self.limit = Semaphore(max_concurrency)
+        self.queue_depth = 0
+        self.running = 0
+        self.hashed = 0
+        self.checked = 0
+        self.rehashed = 0
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', 12)
+        self.limit = Semaphore(app.config.get('BCRYPT_MAX_CONCURRENCY', 4))
+
+    def _run(self, func, *args):
+        self.queue_depth += 1
+        with self.limit:
+            self.queue_depth -= 1
+            self.running += 1
+            try:
+                return tpool.execute(func, *args)
+            finally:
+                self.running -= 1
+
+    def hash(self, password):
+        self.hashed += 1
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def check(self, password, hashed):
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        self.checked += 1
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """True when a stored hash was made with a cost other than BCRYPT_ROUNDS."""
+        if isinstance(hashed, bytes):
+            hashed = hashed.decode('utf-8')
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        return {
+            'rounds': self.rounds,
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'hashed': self.hashed,
+            'checked': self.checked,
+            'rehashed': self.rehashed,
+        }
+
+passwords = PasswordHasher()
@@ -1,5 +1,6 @@
 from .models import ClassType, Race
 from . import db
+from .reference_data import reference
 
 def populate_class_types():
     if not ClassType.query.first():
@@ -24,6 +25,8 @@ def populate_class_types():
                 db.session.add(ClassType(**class_type))
 
         db.session.commit()
+        # The only writer of these tables, so the cached copy is refreshed here
+        reference.reload()
 
 def populate_races():
     if not Race.query.first():
@@ -45,4 +48,5 @@ def populate_races():
             if not existing_race:
                 db.session.add(Race(**race))
 
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        reference.reload()
\ No newline at end of file
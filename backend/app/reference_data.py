@@ -0,0 +1,108 @@
+import hashlib
+from types import MappingProxyType
+from uuid import UUID
+from flask import current_app, request
+from . import db
+from .cluster import cluster
+from .models import ClassType, Race
+
+## Races and classes
+#
+# The race and class tables only change when populate_db.py runs, yet every character
+# form used to read both in full and every character save looked its race and class up
+# again. They are read once into an immutable snapshot instead: id -> name lookups for
+# validating saves, plus the get_races / get_classes bodies already encoded, each with
+# a strong ETag so clients can revalidate for free.
+#
+# The snapshot is loaded at startup (run.py) or on first use, and replaced whole by
+# reload(), which populate_db calls after adding rows. Other workers are told to
+# reload too.
+
+class Table:
+    def __init__(self, key, rows):
+        # id -> name
+        self.names = MappingProxyType({row.id: row.name for row in rows})
+        # name -> id
+        self.ids = MappingProxyType({row.name: row.id for row in rows})
+        self.body = current_app.json.dumps({key: [
+            {"id": str(row.id), "name": row.name, "description": row.description} for row in rows
+        ]}).encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()
+
+    def name(self, id):
+        """The name for an id sent by a client, or None if there is no such row."""
+        try:
+            return self.names.get(id if isinstance(id, UUID) else UUID(id))
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def resolve(self, id=None, name=None):
+        """The id of the row with this id, or failing that this name, or None if there is neither."""
+        if id and self.name(id):
+            return id if isinstance(id, UUID) else UUID(id)
+        return self.ids.get(name)
+
+class ReferenceData:
+    def __init__(self):
+        self.max_age = 3600
+        # (races, classes), swapped in one assignment so readers never see half a reload
+        self.snapshot = None
+        self.reloads = 0
+        self.not_modified = 0
+
+    def init_app(self, app):
+        self.max_age = app.config.get('REFERENCE_DATA_MAX_AGE', 3600)
+        self.snapshot = None
+
+    def reload(self, broadcast=True):
+        races = db.session.execute(db.select(Race.id, Race.name, Race.description).order_by(Race.name)).all()
+        classes = db.session.execute(
+            db.select(ClassType.id, ClassType.name, ClassType.description).order_by(ClassType.name)
+        ).all()
+        self.snapshot = (Table('races', races), Table('classes', classes))
+        self.reloads += 1
+        if broadcast and cluster.client:
+            cluster.broadcast('reference_data_reload')
+
+    def _tables(self):
+        if self.snapshot is None:
+            self.reload(broadcast=False)
+        return self.snapshot
+
+    @property
+    def races(self):
+        return self._tables()[0]
+
+    @property
+    def classes(self):
+        return self._tables()[1]
+
+    def respond(self, table):
+        """table's pre-encoded body, or 304 Not Modified if the client already has it."""
+        app = current_app._get_current_object()
+        # Hear about reloads in other workers
+        cluster.ensure_listener(app)
+        response = app.response_class(table.body, mimetype=app.json.mimetype)
+        response.set_etag(table.etag)
+        response.cache_control.private = True
+        response.cache_control.max_age = self.max_age
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def stats(self):
+        races, classes = self.snapshot or (None, None)
+        return {
+            'loaded': self.snapshot is not None,
+            'races': len(races.names) if races else 0,
+            'classes': len(classes.names) if classes else 0,
+            'reloads': self.reloads,
+            'not_modified': self.not_modified,
+        }
+
+reference = ReferenceData()
+
+@cluster.on('reference_data_reload')
+def on_reference_data_reload():
+    reference.reload(broadcast=False)
@@ -0,0 +1,18 @@
+from . import create_app, db
+from .report_rollups import rollups
+
+## Rebuild the report rollups
+#
+# The write paths keep report_rollup up to date as they go. Rebuild it from the
+# tables after changing rows any other way (raw SQL, a restored backup) or after
+# creating the table on an existing database. Safe to run at any time, it replaces
+# every total in one transaction.
+#
+#   cd backend && python -m app.refresh_rollups
+
+if __name__ == '__main__':
+    app, _ = create_app()
+    with app.app_context():
+        rollups.refresh()
+        db.session.commit()
+        print("✅ Report rollups rebuilt.")
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import db
+from .cluster import cluster
+
+## Report result cache
+#
+# Reports are POSTs, so nothing upstream caches them, yet most people run the same
+# few reports (the default, unfiltered one above all). Each report's encoded body is
+# kept under a hash of its filters as the report queries read them (see
+# normalized_filters in report_routes.py), so the same report asked for with its
+# lists in another order, or its dates at another time of day, is the same entry.
+#
+# Entries are dropped least recently used first past REPORT_CACHE_MAX_ENTRIES or
+# REPORT_CACHE_MAX_BYTES of bodies, and after REPORT_CACHE_TTL seconds. Reports cover
+# every campaign and character, so any change to those starts a new generation and
+# empties the cache: the write paths mark their session through the report rollups
+# (changed()), and the generation moves on once that session commits. A report built
+# while a change commits belongs to the old generation and isn't kept.
+#
+# Every worker has its own cache, so new generations are also broadcast to the others.
+
+class ReportCache:
+    def __init__(self, max_entries=500, max_bytes=64 << 20, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        # key -> (expires, body), oldest use first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('REPORT_CACHE_MAX_ENTRIES', 500)
+        self.max_bytes = app.config.get('REPORT_CACHE_MAX_BYTES', 64 << 20)
+        self.ttl = app.config.get('REPORT_CACHE_TTL', 300)
+        self.clear()
+
+    @staticmethod
+    def key(kind, filters):
+        """A canonical hash of a report kind and its normalized filters."""
+        canonical = json.dumps([kind, filters], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, generation, body, now=None):
+        # Built before the latest change committed, or too big to keep at all
+        if generation != self.generation or self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        now = time.monotonic() if now is None else now
+        self._drop(key)
+        self.entries[key] = (now + self.ttl, body)
+        self.size += len(body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def respond(self, kind, filters, build):
+        """The cached response to this report, or build()'s, kept if it succeeded.
+
+        filters is None when the request can't be normalized, and then skips the cache.
+        """
+        app = current_app._get_current_object()
+        # Hear about new generations from other workers before relying on what is cached here
+        cluster.ensure_listener(app)
+        if filters is None:
+            return app.make_response(build())
+
+        key = self.key(kind, filters)
+        body = self.get(key)
+        if body is not None:
+            return app.response_class(body, status=200, mimetype=app.json.mimetype)
+
+        generation = self.generation
+        response = app.make_response(build())
+        if response.status_code == 200:
+            self.put(key, generation, response.get_data())
+        return response
+
+    def changed(self):
+        """Mark the current transaction as changing what reports show."""
+        db.session.info['reports_changed'] = True
+
+    def next_generation(self, broadcast=True):
+        self.generation += 1
+        self.clear()
+        if broadcast and cluster.client:
+            cluster.broadcast('report_cache_generation')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+        }
+
+report_results = ReportCache()
+
+@event.listens_for(Session, 'after_commit')
+def on_commit(session):
+    if session.info.pop('reports_changed', False):
+        report_results.next_generation()
+
+@event.listens_for(Session, 'after_rollback')
+def on_rollback(session):
+    session.info.pop('reports_changed', None)
+
+@cluster.on('report_cache_generation')
+def on_report_cache_generation():
+    report_results.next_generation(broadcast=False)
@@ -0,0 +1,142 @@
+import logging
+import uuid
+import msgspec
+from eventlet.semaphore import Semaphore
+from flask import current_app
+from . import db, socketio
+from .cluster import cluster
+from .event_log import log_event
+from .notifications import notify_user
+from .serializers import encode
+
+## Background report jobs
+#
+# A big report, a lax search with wide OR filters above all, can take seconds to
+# build. Run as a job it is submitted, answered at once with a job id, and built in
+# a background green thread. At most REPORT_JOB_WORKERS jobs build at once on a
+# worker, the rest wait their turn, and past REPORT_JOB_MAX_QUEUED waiting jobs new
+# ones are turned away. A job reads its report a batch at a time (see the *_batches
+# functions in report_routes.py) and yields to the hub after each batch, so map
+# traffic never waits behind it for longer than one batch.
+#
+# The user's socket hears report_job_progress after each batch, then report_job_done
+# or report_job_failed. The job's record and its result, encoded in pages of
+# REPORT_JOB_PAGE_SIZE rows, go in the shared store for REPORT_JOB_TTL seconds, so
+# any worker can answer for them.
+
+class JobQueueFull(Exception):
+    pass
+
+class ReportJobs:
+    def __init__(self, workers=2, max_queued=20, page_size=200, ttl=600):
+        self.limit = Semaphore(workers)
+        self.max_queued = max_queued
+        self.page_size = page_size
+        self.ttl = ttl
+        self.queue_depth = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.limit = Semaphore(app.config.get('REPORT_JOB_WORKERS', 2))
+        self.max_queued = app.config.get('REPORT_JOB_MAX_QUEUED', 20)
+        self.page_size = app.config.get('REPORT_JOB_PAGE_SIZE', 200)
+        self.ttl = app.config.get('REPORT_JOB_TTL', 600)
+
+    ## Shared store
+
+    def _save(self, job):
+        cluster.client.set(cluster.key('report_job', job['id']), encode(job), ex=self.ttl)
+
+    def _save_page(self, job, items):
+        cluster.client.set(cluster.key('report_job', job['id'], 'page', job['pages']), encode(items), ex=self.ttl)
+        job['pages'] += 1
+
+    def job(self, job_id, user_id):
+        """A job's record, or None if the user has no such job or it has expired."""
+        raw = cluster.client.get(cluster.key('report_job', job_id))
+        if raw is None:
+            return None
+        job = msgspec.json.decode(raw)
+        return job if job['user_id'] == str(user_id) else None
+
+    def page(self, job_id, number):
+        """A finished job's page of rows as encoded JSON, or None."""
+        return cluster.client.get(cluster.key('report_job', job_id, 'page', number))
+
+    ## Running jobs
+
+    def submit(self, user_id, kind, build):
+        """Queue a job. build() is called in the job's app context and gives (batches, summary)."""
+        if self.queue_depth >= self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull("Too many reports are waiting, try again shortly")
+        job = {
+            'id': uuid.uuid4().hex, 'user_id': str(user_id), 'kind': kind, 'status': 'queued',
+            'rows': 0, 'pages': 0, 'summary': None, 'error': None,
+        }
+        self._save(job)
+        self.queue_depth += 1
+        socketio.start_background_task(self._run, current_app._get_current_object(), job, build)
+        return job
+
+    def _run(self, app, job, build):
+        with self.limit:
+            self.queue_depth -= 1
+            self.running += 1
+            try:
+                with app.app_context():
+                    self._build(job, build)
+            finally:
+                self.running -= 1
+
+    def _build(self, job, build):
+        job['status'] = 'running'
+        self._save(job)
+        notify_user(job['user_id'], 'report_job_progress', progress(job))
+        try:
+            batches, summary = build()
+            page = []
+            for batch in batches:
+                page.extend(batch)
+                job['rows'] += len(batch)
+                while len(page) >= self.page_size:
+                    self._save_page(job, page[:self.page_size])
+                    page = page[self.page_size:]
+                self._save(job)
+                notify_user(job['user_id'], 'report_job_progress', progress(job))
+                # Let map traffic and other requests in between batches
+                socketio.sleep(0)
+            if page:
+                self._save_page(job, page)
+            job['summary'] = summary()
+            job['status'] = 'done'
+            self.completed += 1
+        except Exception as e:
+            db.session.rollback()
+            job['status'] = 'failed'
+            job['error'] = "Something went wrong while generating the report."
+            self.failed += 1
+            log_event('report_job_failed', logging.ERROR, job_id=job['id'], error=str(e))
+
+        # Pages written early expire with the record, not before it
+        for number in range(job['pages']):
+            cluster.client.expire(cluster.key('report_job', job['id'], 'page', number), self.ttl)
+        self._save(job)
+        notify_user(job['user_id'], f"report_job_{job['status']}", progress(job))
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+        }
+
+def progress(job):
+    return {'job_id': job['id'], 'kind': job['kind'], 'status': job['status'], 'rows': job['rows'], 'pages': job['pages']}
+
+report_jobs = ReportJobs()
@@ -0,0 +1,232 @@
+from collections import Counter
+from sqlalchemy import BigInteger, cast, delete, func, insert, literal_column, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db
+from .models import Campaign, Character, ClassType, Race, ReportRollup, campaign_users
+from .report_cache import report_results
+
+## Report rollups
+#
+# The report summaries (character counts by gender, race and class, average level,
+# campaign counts by meeting day and frequency, average duration and party size) used
+# to be worked out from every matching row on each request. They are kept as running
+# totals in report_rollup instead, one row per (scope, dimension, key):
+#
+#   scope      '' for everything, 'race:<name>' / 'class:<name>' for the characters of
+#              one race or class, 'day:<day>' / 'frequency:<frequency>' for the
+#              campaigns meeting on that day or that often
+#   dimension  what is counted or summed, e.g. character_gender or campaign_duration
+#   key        the value counted, e.g. 'female', or '' for plain counts and sums
+#
+# An unfiltered report reads the '' scope, one filtered on races, classes, meeting days
+# or meeting frequencies alone adds up one scope per value it asks for. Either way the
+# summary costs a few dozen rows whatever the size of the tables. Other filters still
+# work the summary out from the rows.
+#
+# Each write path that adds, changes or removes characters, campaigns or campaign
+# members calls characters(), campaigns() or memberships() in its own transaction:
+# -1 for the rows it is about to change or delete, +1 once they are written. Those rows
+# are locked (SELECT ... FOR UPDATE) before the -1, by the write path for characters and
+# campaigns and by memberships() itself, so concurrent writes to the same rows take turns
+# rather than both taking off the same old values. The totals are added up with one
+# grouped query over just those rows and applied as upserts, so they commit or roll
+# back with the write. refresh() rebuilds everything from the tables
+# (python -m app.refresh_rollups). Until it has run once, reports don't use the totals.
+
+MEETING_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MEETING_FREQUENCIES = ["Weekly", "Bi-Weekly", "Monthly", "One-Shot"]
+
+# Report body keys that are not filters
+REPORT_OPTIONS = {'sort', 'order', 'limit', 'cursor', 'searchMode', 'summaryOnly'}
+
+def days_between_sql(start, end):
+    """SQL for the number of days from date column start to end."""
+    if db.engine.dialect.name == 'sqlite':
+        return f"(julianday({end}) - julianday({start}))"
+    return f"({end} - {start})"
+
+def report_scopes(data, filters):
+    """The scopes whose totals add up to the rows a report asks for, or None if there are none.
+
+    filters maps the list filters the totals are kept for to their scope prefix.
+    """
+    given = [key for key, value in data.items() if key not in REPORT_OPTIONS and value]
+    if not given:
+        return ['']
+    if len(given) == 1 and given[0] in filters and isinstance(data[given[0]], list):
+        prefix = filters[given[0]]
+        return [f"{prefix}:{value}" for value in dict.fromkeys(data[given[0]])]
+    return None
+
+class ReportRollups:
+    def __init__(self):
+        self.reads = 0
+        self.fallbacks = 0
+
+    ## Keeping the totals
+
+    def characters(self, where, sign=1):
+        """Add (sign=1) or take away (sign=-1) the characters matching where."""
+        rows = db.session.execute(
+            select(Race.name, ClassType.name, Character.gender, func.count(), func.sum(Character.level))
+            .select_from(Character)
+            .join(Race, Character.race_id == Race.id)
+            .join(ClassType, Character.class_id == ClassType.id)
+            .where(where)
+            .group_by(Race.name, ClassType.name, Character.gender)
+        ).all()
+
+        totals = Counter()
+        for race, class_type, gender, count, levels in rows:
+            for scope in ('', f'race:{race}', f'class:{class_type}'):
+                totals[scope, 'characters', ''] += count
+                totals[scope, 'character_levels', ''] += levels or 0
+                totals[scope, 'character_gender', gender] += count
+                totals[scope, 'character_race', race] += count
+                totals[scope, 'character_class', class_type] += count
+        self._apply(totals, sign)
+
+    def campaigns(self, where, sign=1):
+        """Add or take away the campaigns matching where, along with their characters."""
+        characters = (
+            select(func.count())
+            .where(campaign_users.c.campaign_id == Campaign.id, campaign_users.c.character_id.is_not(None))
+            .scalar_subquery()
+        )
+        days = literal_column(days_between_sql('campaign.start_date', 'campaign.end_date'))
+        rows = db.session.execute(
+            select(
+                Campaign.meeting_day, Campaign.meeting_frequency, func.count(), func.count(Campaign.end_date),
+                func.sum(days), func.sum(characters),
+            )
+            .where(where)
+            .group_by(Campaign.meeting_day, Campaign.meeting_frequency)
+        ).all()
+
+        totals = Counter()
+        for day, frequency, count, ended, duration, members in rows:
+            for scope in ('', f'day:{day}', f'frequency:{frequency}'):
+                totals[scope, 'campaigns', ''] += count
+                # Only campaigns with an end date have a duration
+                totals[scope, 'campaign_durations', ''] += ended
+                totals[scope, 'campaign_duration', ''] += round(duration or 0)
+                totals[scope, 'campaign_characters', ''] += members or 0
+                totals[scope, 'campaign_meeting_day', day] += count
+                totals[scope, 'campaign_meeting_frequency', frequency] += count
+        self._apply(totals, sign)
+
+    def memberships(self, where, sign=1):
+        """Add or take away the campaign_users rows matching where that have a character."""
+        if sign < 0:
+            # Two removals of the same row mustn't both count it. Locking its campaign too
+            # keeps campaigns() from counting the party while it changes
+            db.session.execute(
+                select(campaign_users.c.campaign_id)
+                .join(Campaign, campaign_users.c.campaign_id == Campaign.id)
+                .where(where)
+                .with_for_update()
+            )
+        rows = db.session.execute(
+            select(Campaign.meeting_day, Campaign.meeting_frequency, func.count())
+            .select_from(campaign_users)
+            .join(Campaign, campaign_users.c.campaign_id == Campaign.id)
+            .where(campaign_users.c.character_id.is_not(None), where)
+            .group_by(Campaign.meeting_day, Campaign.meeting_frequency)
+        ).all()
+
+        totals = Counter()
+        for day, frequency, count in rows:
+            for scope in ('', f'day:{day}', f'frequency:{frequency}'):
+                totals[scope, 'campaign_characters', ''] += count
+        self._apply(totals, sign)
+
+    def _apply(self, totals, sign):
+        values = [
+            {'scope': scope, 'dimension': dimension, 'key': key, 'value': value * sign}
+            for (scope, dimension, key), value in totals.items() if value
+        ]
+        if not values:
+            return
+        # Whatever moves the totals changes the reports too
+        report_results.changed()
+        table = ReportRollup.__table__
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(table)
+        # Totals that fall to zero are kept, the key space is small and readers skip them
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.dimension, table.c.key],
+            set_={'value': table.c.value + statement.excluded.value},
+        ), values)
+
+    def refresh(self):
+        """Rebuild every total from the tables, in the caller's transaction."""
+        db.session.execute(delete(ReportRollup))
+        report_results.changed()
+        self.characters(true())
+        self.campaigns(true())
+        db.session.execute(insert(ReportRollup), {'scope': '', 'dimension': 'ready', 'key': '', 'value': 1})
+
+    def ready(self):
+        """Whether refresh() has run, so the totals cover every row."""
+        return db.session.scalar(select(ReportRollup.value).where(
+            ReportRollup.scope == '', ReportRollup.dimension == 'ready', ReportRollup.key == ''
+        )) is not None
+
+    ## Reading them
+
+    def _totals(self, scopes):
+        """dimension -> key -> total over scopes, or None if the totals aren't ready."""
+        if scopes is None or not self.ready():
+            self.fallbacks += 1
+            return None
+        total = cast(func.sum(ReportRollup.value), BigInteger)
+        rows = db.session.execute(
+            select(ReportRollup.dimension, ReportRollup.key, total)
+            .where(ReportRollup.scope.in_(scopes))
+            .group_by(ReportRollup.dimension, ReportRollup.key)
+            .having(total != 0)
+        ).all()
+        self.reads += 1
+        totals = {}
+        for dimension, key, value in rows:
+            totals.setdefault(dimension, {})[key] = value
+        return totals
+
+    def character_stats(self, scopes):
+        """The character report's summary from the totals, or None if they can't give it."""
+        totals = self._totals(scopes)
+        if totals is None:
+            return None
+        count = totals.get('characters', {}).get('', 0)
+        return {
+            "num_characters": count,
+            "avg_level": totals.get('character_levels', {}).get('', 0) / count if count else -1,
+            "gender_counts": totals.get('character_gender', {}),
+            "race_counts": totals.get('character_race', {}),
+            "class_counts": totals.get('character_class', {}),
+        }
+
+    def campaign_stats(self, scopes):
+        """The campaign report's summary from the totals, or None if they can't give it."""
+        totals = self._totals(scopes)
+        if totals is None:
+            return None
+        count = totals.get('campaigns', {}).get('', 0)
+        ended = totals.get('campaign_durations', {}).get('', 0)
+        days = totals.get('campaign_meeting_day', {})
+        frequencies = totals.get('campaign_meeting_frequency', {})
+        return {
+            "num_campaigns": count,
+            "avg_duration": totals.get('campaign_duration', {}).get('', 0) / ended if ended else -1,
+            "avg_char_count": totals.get('campaign_characters', {}).get('', 0) / count if count else None,
+            "meeting_days": {day: days.get(day, 0) for day in MEETING_DAYS},
+            "meeting_frequencies": {frequency: frequencies.get(frequency, 0) for frequency in MEETING_FREQUENCIES},
+        }
+
+    def stats(self):
+        return {
+            'reads': self.reads,
+            'fallbacks': self.fallbacks,
+        }
+
+rollups = ReportRollups()
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from uuid import UUID
+from flask import current_app
+from .cluster import cluster
+from .serializers import encode
+
+## Per-user response cache
+#
+# The frontend polls get_campaigns and get_invites, and most polls return what they
+# returned last time. The serialized body of each is kept per user, least recently
+# used first out past RESPONSE_CACHE_MAX_ENTRIES, and for RESPONSE_CACHE_TTL seconds
+# at most. The write paths that change what a user would see call invalidate() with
+# the affected users once their change is committed. The TTL only bounds how stale
+# an entry can get if a write path is missed.
+#
+# Every worker has its own cache, so invalidations are also broadcast to the others.
+
+class ResponseCache:
+    kinds = ('campaigns', 'invites')
+
+    def __init__(self, max_entries=1000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (kind, user_id) -> (expires, body), oldest use first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1000)
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', 30)
+        self.entries.clear()
+
+    def get(self, kind, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        entry = self.entries.get((kind, user_id))
+        if entry is None or entry[0] <= now:
+            self.misses += 1
+            return None
+        self.entries.move_to_end((kind, user_id))
+        self.hits += 1
+        return entry[1]
+
+    def put(self, kind, user_id, body, now=None):
+        if self.max_entries <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        self.entries[(kind, user_id)] = (now + self.ttl, body)
+        self.entries.move_to_end((kind, user_id))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def respond(self, kind, user_id, build):
+        """A JSON response with the cached body for this user, or build()'s payload if there is none."""
+        app = current_app._get_current_object()
+        # Hear about invalidations from other workers before relying on what is cached here
+        cluster.ensure_listener(app)
+        body = self.get(kind, user_id)
+        if body is None:
+            body = encode(build())
+            self.put(kind, user_id, body)
+        return app.response_class(body, status=200, mimetype=app.json.mimetype)
+
+    def invalidate(self, user_ids, kinds=kinds, broadcast=True):
+        user_ids = set(user_ids)
+        for kind in kinds:
+            for user_id in user_ids:
+                if self.entries.pop((kind, user_id), None) is not None:
+                    self.invalidations += 1
+        if broadcast and user_ids and cluster.client:
+            cluster.broadcast('response_cache_invalidate', user_ids=list(user_ids), kinds=list(kinds))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+responses = ResponseCache()
+
+@cluster.on('response_cache_invalidate')
+def on_response_cache_invalidate(user_ids, kinds):
+    responses.invalidate([UUID(user_id) for user_id in user_ids], kinds, broadcast=False)
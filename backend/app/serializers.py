@@ -0,0 +1,171 @@
+import msgspec
+from datetime import date
+from typing import Optional, Union
+from uuid import UUID
+from flask import current_app
+from sqlalchemy import select
+from .models import Campaign, Character, ClassType, Map, Race
+
+## Response serialization
+#
+# List endpoints used to load whole ORM entities (JSON blobs, relationships and all),
+# lazy-load race and class per character, and then copy a few attributes into a dict
+# that jsonify walked again. Here each response shape is a msgspec Struct, filled
+# positionally from a column-only select() whose columns are listed in the Struct's
+# field order, race and class names joined in. The Structs are encoded straight to
+# JSON bytes by one shared encoder, which writes UUIDs and dates itself.
+#
+# The leaf Structs hold no references back to anything, so they are created with
+# gc=False and skip garbage collector tracking.
+
+class CharacterSheet(msgspec.Struct, gc=False):
+    id: UUID
+    name: str
+    gender: str
+    race_id: UUID
+    race: str
+    class_id: UUID
+    classType: str
+    level: int
+    user_id: UUID
+    speed: int
+    size: str
+    marker_color: str
+
+class PartyMember(msgspec.Struct, gc=False):
+    id: UUID
+    name: str
+    gender: str
+    race_id: UUID
+    race: str
+    class_id: UUID
+    classType: str
+    level: int
+    marker_color: str
+    size: str
+
+class MapListing(msgspec.Struct, gc=False):
+    id: UUID
+    name: str
+    campaign_id: UUID
+
+class MapSummary(msgspec.Struct, gc=False):
+    id: UUID
+    name: str
+    owner_id: UUID
+    campaign_id: UUID
+    is_open: bool
+
+class CampaignSummary(msgspec.Struct):
+    id: UUID
+    name: str
+    description: str
+    dm: str
+    start_date: date
+    end_date: Optional[date]
+    meeting_time: str
+    meeting_day: str
+    meeting_frequency: str
+
+class CampaignDetail(CampaignSummary):
+    characters: list[PartyMember]
+
+class CampaignCard(CampaignSummary):
+    char_count: int
+    characters: list[PartyMember]
+    maps: list[MapSummary]
+
+# The report queries are raw SQL, so ids and dates come back however the database
+# driver returns them
+class ReportCharacter(msgspec.Struct, gc=False):
+    id: Union[UUID, str]
+    name: str
+    gender: str
+    level: int
+    race: Optional[str]
+    classType: Optional[str]
+    username: str
+
+class ReportPartyMember(msgspec.Struct, gc=False):
+    id: Union[UUID, str]
+    name: str
+    gender: str
+    race_id: Union[UUID, str]
+    race: Optional[str]
+    class_id: Union[UUID, str]
+    classType: Optional[str]
+    level: int
+    username: str
+
+class ReportCampaign(msgspec.Struct):
+    id: str
+    name: str
+    description: str
+    dm: str
+    char_count: int
+    start_date: str
+    end_date: Optional[str]
+    meeting_time: str
+    meeting_day: str
+    meeting_frequency: str
+    characters: list[ReportPartyMember]
+
+## Projections, in the field order of the Struct they fill
+
+character_sheet_columns = (
+    Character.id, Character.name, Character.gender, Character.race_id, Race.name.label('race'), Character.class_id,
+    ClassType.name.label('class_type'), Character.level, Character.user_id, Character.speed, Character.size, Character.marker_color,
+)
+
+party_member_columns = (
+    Character.id, Character.name, Character.gender, Character.race_id, Race.name.label('race'), Character.class_id,
+    ClassType.name.label('class_type'), Character.level, Character.marker_color, Character.size,
+)
+
+map_listing_columns = (Map.id, Map.name, Map.campaign_id)
+
+map_summary_columns = (Map.id, Map.name, Map.owner_id, Map.campaign_id, Map.is_open)
+
+def with_race_and_class(query):
+    return query.join(Race, Race.id == Character.race_id).join(ClassType, ClassType.id == Character.class_id)
+
+def character_sheets(*where):
+    return with_race_and_class(select(*character_sheet_columns)).where(*where)
+
+def campaign_summary(row, struct=CampaignSummary, **fields):
+    """A campaign row with a dm username as struct, fields filling (or overriding) the rest."""
+    return struct(**{
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "dm": row.dm,
+        "start_date": row.start_date,
+        "end_date": row.end_date,
+        "meeting_time": row.meeting_time.strftime('%H:%M'),
+        "meeting_day": row.meeting_day,
+        "meeting_frequency": row.meeting_frequency,
+        **fields,
+    })
+
+def campaign_columns(dm):
+    """Columns for campaign_summary(), with dm an aliased User."""
+    return (
+        Campaign.id, Campaign.name, Campaign.description, Campaign.start_date, Campaign.end_date,
+        Campaign.meeting_time, Campaign.meeting_day, Campaign.meeting_frequency, dm.username.label('dm')
+    )
+
+## Encoding
+
+encoder = msgspec.json.Encoder()
+
+def encode(payload):
+    """JSON bytes for any mix of dicts, lists, Structs, UUIDs and dates."""
+    return encoder.encode(payload)
+
+def respond(payload, status=200):
+    app = current_app._get_current_object()
+    return app.response_class(encode(payload), status=status, mimetype=app.json.mimetype)
+
+def to_builtins(struct):
+    """The plain dict form of a Struct, for Socket.IO payloads."""
+    return msgspec.to_builtins(struct)
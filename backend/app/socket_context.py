@@ -0,0 +1,142 @@
+## Per-connection socket context
+#
+# Who a socket belongs to and which map rooms it has joined (and in what role) is
+# resolved once, in on_connect/join_map_room, and cached here keyed by request.sid.
+# Hot events (marker drags, line edits) read this instead of hitting the database.
+# Anything that changes the facts behind an entry must invalidate it.
+#
+# members is the broadcast side: for the map rooms this worker owns, every socket in
+# the room (including sockets connected to other workers) with its codec and viewport.
+
+class MapRoomContext:
+    def __init__(self, map_id, map_name, campaign_id, owner_id, is_dm, character_id=None):
+        self.map_id = map_id
+        self.map_name = map_name
+        self.campaign_id = campaign_id
+        self.owner_id = owner_id
+        self.is_dm = is_dm
+        self.character_id = character_id
+
+    def __repr__(self):
+        return f'<MapRoomContext: {self.map_id}, DM: {self.is_dm}>'
+
+class RoomMember:
+    def __init__(self, sid, codec='json', is_dm=False, viewport=None):
+        self.sid = sid
+        self.codec = codec
+        self.is_dm = is_dm
+        self.viewport = viewport
+
+    def __repr__(self):
+        return f'<RoomMember: {self.sid}, DM: {self.is_dm}>'
+
+class ConnectionContext:
+    def __init__(self, sid, user_id, username, codec='json'):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.codec = codec
+        self.rooms = {}
+
+    def __repr__(self):
+        return f'<ConnectionContext: {self.username}, SID: {self.sid}>'
+
+class ConnectionRegistry:
+    def __init__(self):
+        self.connections = {}
+        self.members = {}
+
+    def connect(self, sid, user, codec='json'):
+        connection = ConnectionContext(sid, user.id, user.username, codec)
+        self.connections[sid] = connection
+        return connection
+
+    def disconnect(self, sid):
+        connection = self.connections.pop(sid, None)
+        if connection:
+            for map_id in connection.rooms:
+                self.remove_member(map_id, sid)
+        return connection
+
+    def get(self, sid):
+        return self.connections.get(sid)
+
+    def join(self, sid, map, is_dm, character_id=None):
+        connection = self.connections.get(sid)
+        if connection is None:
+            return None
+        room = MapRoomContext(map.id, map.name, map.campaign_id, map.owner_id, is_dm, character_id)
+        connection.rooms[map.id] = room
+        self.add_member(map.id, sid, connection.codec, is_dm)
+        return room
+
+    def leave(self, sid, map_id):
+        connection = self.connections.get(sid)
+        if connection is None:
+            return None
+        self.remove_member(map_id, sid)
+        return connection.rooms.pop(map_id, None)
+
+    def room(self, sid, map_id):
+        connection = self.connections.get(sid)
+        if connection is None:
+            return None
+        return connection.rooms.get(map_id)
+
+    def add_member(self, map_id, sid, codec='json', is_dm=False, viewport=None):
+        member = RoomMember(sid, codec, is_dm, viewport)
+        self.members.setdefault(map_id, {})[sid] = member
+        return member
+
+    def remove_member(self, map_id, sid):
+        members = self.members.get(map_id)
+        if members is not None:
+            members.pop(sid, None)
+            if not members:
+                del self.members[map_id]
+
+    def member(self, map_id, sid):
+        return self.members.get(map_id, {}).get(sid)
+
+    def sids_in_map(self, map_id):
+        return list(self.members.get(map_id, ()))
+
+    def viewports(self, map_id):
+        """Viewports of the members of a map that have told us what they can see."""
+        return {
+            sid: member.viewport
+            for sid, member in self.members.get(map_id, {}).items()
+            if member.viewport is not None
+        }
+
+    def sids_using_codec(self, map_id, codec):
+        return [sid for sid, member in self.members.get(map_id, {}).items() if member.codec == codec]
+
+    def codec(self, sid):
+        connection = self.connections.get(sid)
+        if connection:
+            return connection.codec
+        # A socket on another worker, we only know it through the rooms it joined
+        for members in self.members.values():
+            if sid in members:
+                return members[sid].codec
+        return 'json'
+
+    def invalidate_map(self, map_id, players_only=False):
+        """Drop cached room membership for a map. Returns the sids that were affected."""
+        affected = [
+            sid for sid, member in self.members.get(map_id, {}).items()
+            if not (players_only and member.is_dm)
+        ]
+        self.forget(map_id, affected)
+        return affected
+
+    def forget(self, map_id, sids):
+        """Drop membership of a map for the given sockets, wherever they are connected."""
+        for sid in sids:
+            self.remove_member(map_id, sid)
+            connection = self.connections.get(sid)
+            if connection:
+                connection.rooms.pop(map_id, None)
+
+connections = ConnectionRegistry()
@@ -1,86 +1,103 @@
-user_sockets = {}
+import logging
 from flask_socketio import join_room, leave_room, emit
-from flask import jsonify, session, request
+from flask import jsonify, session, request, current_app
 from . import socketio, db
-from .models import User, Campaign, Map, campaign_users
+from .models import User, Map, campaign_users
+from .campaign_dashboard import campaign_audience
+from .cluster import cluster
+from .event_log import log_event
+from .map_rooms import dispatch
+from .membership import membership
+from .notifications import join_notification_rooms, map_summary, notify_campaign
+from .response_cache import responses
+from .socket_context import connections
+from .map_codec import CODECS, binary_room, decode_event
 from uuid import UUID
 
 @socketio.on('connect')
-def on_connect():
-    print(f'\033[92mClient {request.sid} connected\033[0m')
-    user_id = UUID(session.get('user_id'))
-    if user_id:
-        user_sockets[user_id] = request.sid
+def on_connect(auth=None):
+    log_event('client_connected', sid=request.sid)
+    if not session.get('user_id'):
+        return
+
+    # Clients may opt in to binary map traffic when they connect
+    codec = (auth or {}).get('codec', 'json')
+    if codec not in CODECS:
+        codec = 'json'
+
+    user_id = UUID(str(session.get('user_id')))
+    user = User.query.get(user_id)
+    if user:
+        cluster.ensure_listener(current_app._get_current_object())
+        cluster.set_user_socket(user_id, request.sid)
+        connections.connect(request.sid, user, codec)
+        join_notification_rooms(request.sid, user_id)
 
 @socketio.on('disconnect')
 def on_disconnect(reason):
-    print(f'\033[91mClient {request.sid} disconnected (reason: {reason})\033[0m')
-    user_id = UUID(session.get('user_id'))
-    if user_id and user_id in user_sockets:
-        del user_sockets[user_id]
+    log_event('client_disconnected', sid=request.sid, reason=reason)
+    connection = connections.disconnect(request.sid)
+    if connection:
+        cluster.clear_user_socket(connection.user_id, request.sid)
+        for map_id in connection.rooms:
+            dispatch(map_id, 'leave', sid=request.sid)
 
 @socketio.on_error_default
 def default_error_handler(e):
-    print(f"⚠️ Socket error: {e}")
+    log_event('socket_error', logging.ERROR, sid=request.sid, error=str(e))
 
 @socketio.on('create_map')
 def handle_create_map(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
-        return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
+    connection = current_connection()
+    if not connection:
         return
 
     name = data.get('name')
     if not name:
         emit('error', {'message': 'Name is required'})
         return
-    
+
     campaign_id = UUID(data.get('campaign_id'))
     if not campaign_id:
         emit('error', {'message': 'Campaign ID is required'})
         return
-    
-    campaign = next((c for c in user.dm_campaigns if c.id == campaign_id), None)
-    if not campaign:
+
+    standing = membership(campaign_id, connection.user_id)
+    if not standing or not standing.is_dm:
         emit('error', {'message': 'Campagin not found or you are not the DM'})
         return
-    
-    if Map.query.filter_by(name=name, owner_id=user_id).first():
+
+    if Map.query.filter_by(name=name, owner_id=connection.user_id).first():
         emit('error', {'message': 'Map with this name already exists'})
         return
 
-    map = Map(name=name, owner_id=user_id, campaign_id=campaign_id)
+    map = Map(name=name, owner_id=connection.user_id, campaign_id=campaign_id)
 
     db.session.add(map)
     db.session.commit()
- 
+    responses.invalidate(campaign_audience([campaign_id]))
+
     emit('map_created', {
         'message': f'Map {map.name} created successfully!',
         'map': map.to_dict()
     }, to=request.sid)
-    print(f'\033[92mMap {map.name} created by user {user.username}\033[0m')
+    notify_campaign(campaign_id, 'map_added', map_summary(map), skip_sid=request.sid)
+    log_event('map_created', map_id=map.id, user=connection.username)
 
     join_room(f'map_{map.id}')
+    if connection.codec == 'msgpack':
+        join_room(binary_room(map.id))
+    connections.join(request.sid, map, is_dm=True)
+    dispatch(map.id, 'join', sid=request.sid, codec=connection.codec, is_dm=True)
     emit('map_connected', {'message': f'Connected to map {map.name}', 'map': map.to_dict(), 'isDM': True}, room=f'map_{map.id}', to=request.sid)
-    print(f'\033[94mUser {user.username} joined map room {map.id} (campaign id: {campaign_id})\033[0m')
+    log_event('map_joined', map_id=map.id, campaign_id=campaign_id, user=connection.username)
 
 @socketio.on('delete_map')
 def handle_delete_map(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+    connection = current_connection()
+    if not connection:
         return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
+
     map_id = UUID(data.get('map_id'))
     if not map_id:
         emit('error', {'message': 'Map ID is required'})
@@ -91,29 +108,25 @@ def handle_delete_map(data):
         emit('error', {'message': 'Map not found'})
         return
 
-    if map.owner_id != user_id:
+    if map.owner_id != connection.user_id:
         emit('error', {'message': 'You are not the owner of this map'})
         return
 
     db.session.delete(map)
     db.session.commit()
+    responses.invalidate(campaign_audience([map.campaign_id]))
 
-    leave_room(f'map_{map.id}')
     emit('map_deleted', {'message': f'Map {map.name} deleted successfully'}, room=f'map_{map.id}', to=request.sid)
-    print(f'\033[91mMap {map.name} deleted by user {user.username}\033[0m')
+    dispatch(map.id, 'close')
+    log_event('map_deleted', map_id=map.id, user=connection.username)
 
 @socketio.on('join_map_room')
 def handle_join_map_room(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+    data = decode_event('join_map_room', data)
+    connection = current_connection()
+    if not connection:
         return
 
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
     map_id = UUID(data.get('map_id'))
     if not map_id:
         emit('error', {'message': 'Map ID is required'})
@@ -123,52 +136,44 @@ def handle_join_map_room(data):
     if not map:
         emit('error', {'message': 'Map not found'})
         return
-    
+
     campaign_id = map.campaign_id
 
-    isDM = user_id == map.owner_id
+    isDM = connection.user_id == map.owner_id
 
     if not isDM and not map.is_open:
         emit('refresh_maps', {'message': 'This map is currently closed by the DM'}, to=request.sid)
         return
 
+    if not isDM and not membership(campaign_id, connection.user_id).is_member:
+        emit('error', {'message': 'You are not a player in this campaign'})
+        return
+
     if not isDM:
         character_id = db.session.query(
             campaign_users.c.character_id
         ).filter_by(
-            user_id=user_id,
+            user_id=connection.user_id,
             campaign_id=campaign_id
         ).scalar()
     else:
         character_id = None
 
     join_room(f'map_{map_id}')
+    if connection.codec == 'msgpack':
+        join_room(binary_room(map_id))
+    connections.join(request.sid, map, is_dm=isDM, character_id=character_id)
     emit('map_connected', {'message': f'Connected to map {map.name}', 'map': map.to_dict(), 'isDM': isDM, 'character_id': str(character_id)}, room=f'map_{map_id}', to=request.sid)
-    print(f'\033[94mUser {user.username} joined map room {map_id} (campaign id: {campaign_id})\033[0m')
-
-    # If the joining user is the map owner (DM), send the saved map state directly to them
-    if isDM or map.is_open:
-        emit('initialize_map_state', {
-            'map_id': str(map_id),
-            'markers': map.markers or [],
-            'lines': map.lines or [],
-        }, to=request.sid)
-    elif map.owner_id in user_sockets:
-        owner_sid = user_sockets[map.owner_id]
-        emit('request_map_state', {'map_id': str(map_id), 'target_sid': request.sid}, to=owner_sid)
+    log_event('map_joined', map_id=map_id, campaign_id=campaign_id, user=connection.username)
+
+    dispatch(map_id, 'join', sid=request.sid, codec=connection.codec, is_dm=isDM, last_seq=data.get('last_seq'), epoch=data.get('epoch'))
 
 @socketio.on('leave_map_room')
 def handle_leave_map_room(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+    connection = current_connection()
+    if not connection:
         return
 
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
     map_id = UUID(data.get('map_id'))
     if not map_id:
         emit('error', {'message': 'Map ID is required'})
@@ -180,30 +185,25 @@ def handle_leave_map_room(data):
         return
 
     # If user is the DM, set map visibility to false and notify others
-    if map.owner_id == user_id:
+    if map.owner_id == connection.user_id:
         map.is_open = False
         db.session.commit()
+        responses.invalidate(campaign_audience([map.campaign_id]))
         emit('map_force_closed', {'message': 'The DM has closed the map.'}, room=f'map_{map_id}', skip_sid=request.sid)
+        dispatch(map_id, 'close', players_only=True)
 
     leave_room(f'map_{map_id}')
+    leave_room(binary_room(map_id))
+    connections.leave(request.sid, map_id)
+    dispatch(map_id, 'leave', sid=request.sid)
     emit('map_disconnected', {'message': f'Disconnected from map {map_id}'}, room=f'map_{map_id}', to=request.sid)
-    print(f'\033[94mUser {user.username} left map room {map_id}\033[0m')
+    log_event('map_left', map_id=map_id, user=connection.username)
 
 @socketio.on('add_marker')
 def handle_add_marker(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
-        return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-
-    map_id = UUID(data.get('map_id'))
-    if not map_id:
-        emit('error', {'message': 'Map ID is required'})
+    data = decode_event('add_marker', data)
+    room = current_map_room(data)
+    if not room:
         return
 
     marker = data.get('marker')
@@ -211,61 +211,35 @@ def handle_add_marker(data):
         emit('error', {'message': 'Marker data is required'})
         return
 
-    map = Map.query.get(map_id)
-    if not map:
-        emit('error', {'message': 'Map not found'})
+    if not marker.get('id'):
+        emit('error', {'message': 'Marker ID is required'})
         return
 
-    emit('marker_added', {'marker': marker}, room=f'map_{map_id}', skip_sid=request.sid)
-    print(f'\033[92mMarker added to map {map.name} by user {user_id}\033[0m')
+    dispatch(room.map_id, 'add_marker', sid=request.sid, marker=marker)
+    log_event('marker_added', map_id=room.map_id, marker_id=marker['id'], user_id=current_user_id())
 
 @socketio.on('remove_marker')
 def handle_remove_marker(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+    data = decode_event('remove_marker', data)
+    room = current_map_room(data)
+    if not room:
         return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
-    map_id = UUID(data.get('map_id'))
-    if not map_id:
-        emit('error', {'message': 'Map ID is required'})
-        return
-    
+
     marker_id = UUID(data.get('marker_id'))
     if not marker_id:
         emit('error', {'message': 'Marker ID is required'})
         return
-    
-    map = Map.query.get(map_id)
-    if not map:
-        emit('error', {'message': 'Map not found'})
-        return
 
-    emit('marker_removed', {'marker_id': str(marker_id)}, room=f'map_{map_id}', skip_sid=request.sid)
-    print(f'\033[92mMarker {marker_id} removed from map {map.name} by user {user_id}\033[0m')
+    dispatch(room.map_id, 'remove_marker', sid=request.sid, marker_id=str(marker_id))
+    log_event('marker_removed', map_id=room.map_id, marker_id=marker_id, user_id=current_user_id())
 
 @socketio.on('move_marker')
 def handle_move_marker(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+    data = decode_event('move_marker', data)
+    room = current_map_room(data)
+    if not room:
         return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
-    map_id = UUID(data.get('map_id'))
-    if not map_id:
-        emit('error', {'message': 'Map ID is required'})
-        return
-    
+
     marker_id = UUID(data.get('marker_id'))
     if not marker_id:
         emit('error', {'message': 'Marker ID is required'})
@@ -276,29 +250,14 @@ def handle_move_marker(data):
         emit('error', {'message': 'New position is required'})
         return
 
-    map = Map.query.get(map_id)
-    if not map:
-        emit('error', {'message': 'Map not found'})
-        return
-
-    emit('marker_moved', {'marker_id': str(marker_id), 'new_position': new_position}, room=f'map_{map_id}', skip_sid=request.sid)
-    print(f'\033[92mMarker {marker_id} moved to {new_position} on map {map.name} by user {user_id}\033[0m')
+    dispatch(room.map_id, 'move_marker', sid=request.sid, marker_id=str(marker_id), new_position=new_position)
+    log_event('marker_moved', map_id=room.map_id, marker_id=marker_id, user_id=current_user_id())
 
 @socketio.on('add_line')
 def handle_add_line(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
-        return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
-        return
-    
-    map_id = UUID(data.get('map_id'))
-    if not map_id:
-        emit('error', {'message': 'Map ID is required'})
+    data = decode_event('add_line', data)
+    room = current_map_room(data)
+    if not room:
         return
 
     line = data.get('line')
@@ -306,78 +265,76 @@ def handle_add_line(data):
         emit('error', {'message': 'Line data is required'})
         return
 
-    map = Map.query.get(map_id)
-    if not map:
-        emit('error', {'message': 'Map not found'})
+    if not line.get('id'):
+        emit('error', {'message': 'Line ID is required'})
         return
 
-    emit('line_added', {'line': line}, room=f'map_{map_id}', skip_sid=request.sid)
-    print(f'\033[92mLine added to map {map.name} by user {user_id}\033[0m')
+    dispatch(room.map_id, 'add_line', sid=request.sid, line=line)
+    log_event('line_added', map_id=room.map_id, line_id=line['id'], user_id=current_user_id())
 
 @socketio.on('remove_line')
 def handle_remove_line(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
-        return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
+    data = decode_event('remove_line', data)
+    room = current_map_room(data)
+    if not room:
         return
-    
-    map_id = UUID(data.get('map_id'))
-    if not map_id:
-        emit('error', {'message': 'Map ID is required'})
-        return
-    
+
     line_id = UUID(data.get('line_id'))
     if not line_id:
         emit('error', {'message': 'Line ID is required'})
         return
 
-    map = Map.query.get(map_id)
-    if not map:
-        emit('error', {'message': 'Map not found'})
-        return
+    dispatch(room.map_id, 'remove_line', sid=request.sid, line_id=str(line_id))
+    log_event('line_removed', map_id=room.map_id, line_id=line_id, user_id=current_user_id())
 
-    emit('line_removed', {'line_id': str(line_id)}, room=f'map_{map_id}', skip_sid=request.sid)
-    print(f'\033[92mLine {line_id} removed from map {map.name} by user {user_id}\033[0m')
-
-@socketio.on('send_map_state')
-def handle_send_map_state(data):
-    user_id = UUID(session.get('user_id'))
-    if not user_id:
-        emit('error', {'message': 'User not logged in'})
+@socketio.on('set_viewport')
+def handle_set_viewport(data):
+    data = decode_event('set_viewport', data)
+    room = current_map_room(data)
+    if not room:
         return
-    
-    user = User.query.get(user_id)
-    if not user:
-        emit('error', {'message': 'User not found'})
+
+    viewport = data.get('viewport')
+    if not viewport:
+        # No viewport means the client wants everything again
+        dispatch(room.map_id, 'set_viewport', sid=request.sid, viewport=None)
         return
-    
-    target_sid = data.get('target_sid')
-    if not target_sid:
-        emit('error', {'message': 'target_sid is required'})
+
+    try:
+        x, y = float(viewport['x']), float(viewport['y'])
+        width, height = float(viewport['width']), float(viewport['height'])
+    except (KeyError, TypeError, ValueError):
+        emit('error', {'message': 'Viewport needs x, y, width and height'})
         return
-    
+
+    margin = current_app.config.get('MAP_VIEWPORT_MARGIN', 250)
+    viewport = (x - margin, y - margin, x + width + margin, y + height + margin)
+    dispatch(room.map_id, 'set_viewport', sid=request.sid, viewport=viewport)
+
+## Helper functions
+
+def current_connection():
+    """Return the cached context for this socket, or emit an error if nobody is logged in on it."""
+    connection = connections.get(request.sid)
+    if not connection:
+        emit('error', {'message': 'User not logged in'})
+    return connection
+
+def current_map_room(data):
+    """Return this socket's cached membership of the map named in data, without touching the database."""
+    connection = current_connection()
+    if not connection:
+        return None
+
     map_id = UUID(data.get('map_id'))
     if not map_id:
-        emit('error', {'message': 'map_id is required'})
-        return
+        emit('error', {'message': 'Map ID is required'})
+        return None
 
-    markers = data.get('markers', [])
-    if not markers:
-        emit('error', {'message': 'markers data is required'})
-        return
-    
-    lines = data.get('lines', [])
-    if not lines:
-        emit('error', {'message': 'lines data is required'})
-        return
+    room = connection.rooms.get(map_id)
+    if not room:
+        emit('error', {'message': 'You have not joined this map'})
+    return room
 
-    emit('initialize_map_state', {
-        'map_id': str(map_id),
-        'markers': markers,
-        'lines': lines
-    }, to=target_sid)
+def current_user_id():
+    return connections.get(request.sid).user_id
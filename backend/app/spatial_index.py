@@ -0,0 +1,117 @@
+import math
+
+## Spatial index over map objects
+#
+# A uniform grid keyed by cell coordinates. Each entry is stored under every
+# cell its bounding box touches, so rectangle and radius queries only look at
+# the cells they overlap. Bounding boxes are (min_x, min_y, max_x, max_y) in
+# world (canvas) units.
+
+GRID_SIZE = 50 # Size of one map square on the canvas
+
+MARKER_SCALES = {
+    'small': 1,
+    'medium': 1,
+    'large': 2,
+    'huge': 3,
+    'gargantuan': 4,
+}
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def union(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def marker_bbox(marker):
+    pos = marker.get('pos')
+    if not pos:
+        return None
+    extent = MARKER_SCALES.get(marker.get('size'), 1) * GRID_SIZE
+    return (pos['x'], pos['y'], pos['x'] + extent, pos['y'] + extent)
+
+def line_bbox(line):
+    start, end = line.get('start'), line.get('end')
+    if not start or not end:
+        return None
+    return (min(start['x'], end['x']), min(start['y'], end['y']), max(start['x'], end['x']), max(start['y'], end['y']))
+
+class GridIndex:
+    # Entries spanning more cells than this (very long walls) are kept aside and always checked
+    MAX_CELLS_PER_ENTRY = 64
+
+    def __init__(self, cell_size=500):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.entries = {}
+        self.oversized = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _cell_range(self, bbox):
+        size = self.cell_size
+        return (
+            range(math.floor(bbox[0] / size), math.floor(bbox[2] / size) + 1),
+            range(math.floor(bbox[1] / size), math.floor(bbox[3] / size) + 1),
+        )
+
+    def insert(self, key, bbox):
+        self.remove(key)
+        if bbox is None:
+            return
+
+        xs, ys = self._cell_range(bbox)
+        if len(xs) * len(ys) > self.MAX_CELLS_PER_ENTRY:
+            self.entries[key] = (bbox, None)
+            self.oversized.add(key)
+            return
+
+        cells = [(x, y) for x in xs for y in ys]
+        self.entries[key] = (bbox, cells)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        _, cells = entry
+        if cells is None:
+            self.oversized.discard(key)
+            return
+        for cell in cells:
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def bbox(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def query_rect(self, bbox):
+        xs, ys = self._cell_range(bbox)
+        if len(xs) * len(ys) > len(self.cells):
+            # Zoomed far out, walking the occupied cells is cheaper than walking the rectangle
+            candidates = self.entries.keys()
+        else:
+            candidates = set(self.oversized)
+            for x in xs:
+                for y in ys:
+                    candidates.update(self.cells.get((x, y), ()))
+        return {key for key in candidates if intersects(self.entries[key][0], bbox)}
+
+    def query_radius(self, x, y, radius):
+        found = set()
+        for key in self.query_rect((x - radius, y - radius, x + radius, y + radius)):
+            min_x, min_y, max_x, max_y = self.entries[key][0]
+            dx = max(min_x - x, 0, x - max_x)
+            dy = max(min_y - y, 0, y - max_y)
+            if dx * dx + dy * dy <= radius * radius:
+                found.add(key)
+        return found
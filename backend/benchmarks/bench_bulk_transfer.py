@@ -0,0 +1,97 @@
+# benchmarks/bench_bulk_transfer.py
+#
+# Throughput of /character/import and /character/export at 100k rows, in both formats,
+# through the test client against a throwaway SQLite file. Each import goes to a fresh
+# user; exports stream one user's characters and are read chunk by chunk, so the peak
+# memory shown is what the server side holds while streaming.
+#
+#   cd backend && python -m benchmarks.bench_bulk_transfer
+
+import csv
+import io
+import json
+import tempfile
+import time
+import tracemalloc
+from app import create_app, db
+from app.models import User
+from app.populate_db import populate_class_types, populate_races
+from app.reference_data import reference
+
+ROWS = 100000
+
+def make_user(name):
+    user = User("Bench", name, f"{name}@example.com", "x", name)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def login(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+def upload(format):
+    races, classes = list(reference.races.names.values()), list(reference.classes.names.values())
+    rows = [
+        {'name': f'Hero {i:06}', 'gender': 'female', 'race': races[i % len(races)],
+         'classType': classes[i % len(classes)], 'level': i % 20 + 1}
+        for i in range(ROWS)
+    ]
+    if format == 'ndjson':
+        return ''.join(json.dumps(row) + '\n' for row in rows).encode()
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+def drain(response):
+    """Read a streamed response chunk by chunk, returning its size."""
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+def report(label, elapsed, size, peak=None):
+    line = f"  {label:<16} {elapsed:>6.2f} s   {ROWS / elapsed:>9,.0f} rows/s   {size / 1e6:>5.1f} MB"
+    if peak is not None:
+        line += f"   peak {peak / 1e6:.1f} MB"
+    print(line)
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+        })
+        with app.app_context():
+            db.create_all()
+            populate_class_types()
+            populate_races()
+
+            print(f"{ROWS} characters")
+            for format in ('ndjson', 'csv'):
+                client = login(app, make_user(f"import_{format}"))
+                body = upload(format)
+                start = time.perf_counter()
+                response = client.post(f'/character/import?format={format}', data=body)
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 201, response.get_json()
+                report(f"import {format}", elapsed, len(body))
+
+            for format in ('ndjson', 'csv'):
+                start = time.perf_counter()
+                size = drain(client.get(f'/character/export?format={format}', buffered=False))
+                elapsed = time.perf_counter() - start
+
+                # Memory separately, tracing slows everything down
+                tracemalloc.start()
+                drain(client.get(f'/character/export?format={format}', buffered=False))
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                report(f"export {format}", elapsed, size, peak)
+
+if __name__ == '__main__':
+    main()
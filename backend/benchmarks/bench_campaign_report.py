@@ -0,0 +1,139 @@
+# benchmarks/bench_campaign_report.py
+#
+# The unfiltered campaign report over 50k campaigns with 0-4 characters each. "group by"
+# is the query the report used to run: campaign_users joined twice, grouped by every
+# character column, COUNT(DISTINCT ...) for the character count and the summary worked
+# out in Python. "cte" is the current plan: character counts grouped once in a CTE, one
+# join for the character rows and the summary from a second, aggregate query. Both
+# fetch every row; building the response is the same for both and not timed. Runs
+# against a throwaway SQLite file.
+#
+#   cd backend && python -m benchmarks.bench_campaign_report
+
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import date, time as time_of_day, timedelta
+from sqlalchemy import text
+from app import create_app, db
+from app.blueprints.report_routes import (
+    campaign_report_rows_sql, campaign_report_sorts, campaign_report_sql, campaign_report_stats_sql,
+)
+from app.models import Campaign, Character, ClassType, Race, User, campaign_users
+from app.pagination import Page
+from app.populate_db import populate_class_types, populate_races
+
+CAMPAIGNS = 50000
+PLAYERS = 5000
+DMS = 1000
+RUNS = 3
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+FREQUENCIES = ["Weekly", "Bi-Weekly", "Monthly", "One-Shot"]
+
+GROUP_BY = """
+SELECT
+    c.name AS sort_key, c.id AS campaign_id, c.name AS campaign_name, c.start_date, c.end_date,
+    c.meeting_day, c.meeting_time, c.meeting_frequency, c.description, u.username AS dm_name,
+    COUNT(DISTINCT cu2.character_id) AS char_count,
+    ch.id AS character_id, ch.name AS character_name, ch.gender AS character_gender,
+    ch.race_id AS character_race_id, r.name AS character_race_name, ch.class_id AS character_class_id,
+    ct.name AS character_class_type, ch.level AS character_level, owner.username AS character_owner_username
+FROM campaign c
+JOIN "user" u ON c.dm_id = u.id
+LEFT JOIN campaign_users cu2 ON cu2.campaign_id = c.id AND cu2.character_id IS NOT NULL
+LEFT JOIN campaign_users cu ON cu.campaign_id = c.id
+LEFT JOIN character ch ON cu.character_id = ch.id
+LEFT JOIN "user" owner ON cu.user_id = owner.id
+LEFT JOIN race r ON ch.race_id = r.id
+LEFT JOIN class_type ct ON ch.class_id = ct.id
+GROUP BY
+    c.id, u.username,
+    ch.id, ch.name, ch.gender, ch.race_id, r.name, ch.class_id, ct.name, ch.level, owner.username
+ORDER BY c.name ASC, c.id ASC, ch.name
+"""
+
+def seed():
+    dms = [{'id': uuid.uuid4(), 'first': 'DM', 'last': str(i), 'email': f'dm{i}@example.com', 'password': 'x',
+            'username': f'dm{i}'} for i in range(DMS)]
+    players = [{'id': uuid.uuid4(), 'first': 'Player', 'last': str(i), 'email': f'p{i}@example.com', 'password': 'x',
+                'username': f'player{i}'} for i in range(PLAYERS)]
+    db.session.execute(User.__table__.insert(), dms + players)
+
+    race_ids, class_ids = [r.id for r in Race.query.all()], [c.id for c in ClassType.query.all()]
+    characters = [{'id': uuid.uuid4(), 'name': f'Hero {i}', 'gender': 'female', 'race_id': race_ids[i % len(race_ids)],
+                   'class_id': class_ids[i % len(class_ids)], 'level': i % 20 + 1, 'user_id': player['id'],
+                   'speed': 30, 'size': 'medium', 'marker_color': '#ff9800'} for i, player in enumerate(players)]
+    db.session.execute(Character.__table__.insert(), characters)
+
+    campaigns, members = [], []
+    for i in range(CAMPAIGNS):
+        dm = dms[i % DMS]
+        start = date(2024, 1, 1) + timedelta(days=i % 365)
+        campaigns.append({
+            'id': uuid.uuid4(), 'name': f'Campaign {i:05}', 'description': '', 'dm_id': dm['id'],
+            'start_date': start, 'end_date': start + timedelta(days=30 + i % 200) if i % 3 else None,
+            'meeting_time': time_of_day(18 + i % 4), 'meeting_day': DAYS[i % 7], 'meeting_frequency': FREQUENCIES[i % 4],
+        })
+        members.append({'campaign_id': campaigns[-1]['id'], 'user_id': dm['id'], 'character_id': None})
+        for j in range(i % 5):
+            character = characters[(i * 7 + j) % PLAYERS]
+            members.append({'campaign_id': campaigns[-1]['id'], 'user_id': character['user_id'], 'character_id': character['id']})
+    db.session.execute(Campaign.__table__.insert(), campaigns)
+    db.session.execute(campaign_users.insert(), members)
+    db.session.commit()
+
+def group_by():
+    rows = db.session.execute(text(GROUP_BY)).fetchall()
+    # The summary as the report used to work it out
+    campaigns = {}
+    for row in rows:
+        campaigns.setdefault(row.campaign_id, row)
+    durations = [
+        (date.fromisoformat(row.end_date) - date.fromisoformat(row.start_date)).days
+        for row in campaigns.values() if row.end_date
+    ]
+    days, frequencies = dict.fromkeys(DAYS, 0), dict.fromkeys(FREQUENCIES, 0)
+    for row in campaigns.values():
+        days[row.meeting_day] += 1
+        frequencies[row.meeting_frequency] += 1
+    return len(rows), len(campaigns), sum(durations) / len(durations), sum(row.char_count for row in campaigns.values()) / len(campaigns)
+
+def cte():
+    page = Page('name', campaign_report_sorts['name'])
+    matched, bindparams, params = campaign_report_sql({}, page)
+    rows = db.session.execute(text(campaign_report_rows_sql(matched, page)).bindparams(*bindparams), params).fetchall()
+    stats = db.session.execute(text(campaign_report_stats_sql(matched, params)).bindparams(*bindparams), params).one()
+    return len(rows), stats.num_campaigns, stats.avg_duration, stats.avg_char_count
+
+def run(label, report):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = report()
+        times.append(time.perf_counter() - start)
+    print(f"  {label:<10} {statistics.median(times) * 1000:>8.1f} ms   {result[0]} rows")
+    return result
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+        })
+        with app.app_context():
+            db.create_all()
+            populate_class_types()
+            populate_races()
+            seed()
+
+            print(f"Unfiltered campaign report, {CAMPAIGNS} campaigns, median of {RUNS}")
+            before = run("group by", group_by)
+            after = run("cte", cte)
+            # The old query also has a row per DM membership, but the summary must match
+            assert before[1:3] == after[1:3] and abs(before[3] - after[3]) < 1e-9, (before, after)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_cascade_delete.py
+#
+# Deleting a campaign with many maps, each holding a large markers/lines payload.
+# "orm cascade" is what delete_campaign used to cost: the ORM loads every map (JSON
+# and all) and deletes them one by one. "on delete cascade" is the single DELETE
+# that now leaves the maps to the database's foreign keys. Runs against a
+# throwaway SQLite file; peak memory is Python allocations during the delete.
+#
+#   cd backend && python -m benchmarks.bench_cascade_delete
+
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import date, time as time_of_day
+from app import create_app, db
+from app.models import Campaign, Map, User
+
+MAPS = 200
+MARKERS_PER_MAP = 2000
+
+def make_campaign(dm_id):
+    campaign = Campaign("Bench", "", dm_id, date(2025, 1, 1), None, time_of_day(18), "Friday", "Weekly")
+    db.session.add(campaign)
+    db.session.commit()
+    campaign_id = campaign.id
+    markers = [{'id': f'm{n}', 'pos': {'x': n, 'y': n}, 'color': '#E57373', 'size': 'medium'} for n in range(MARKERS_PER_MAP)]
+    db.session.execute(Map.__table__.insert(), [
+        {'id': uuid.uuid4(), 'name': f'Map {i}', 'owner_id': dm_id, 'campaign_id': campaign_id,
+         'markers': markers, 'lines': [], 'is_open': False}
+        for i in range(MAPS)
+    ])
+    db.session.commit()
+    db.session.expunge_all()
+    return campaign_id
+
+def orm_cascade(campaign):
+    # The old relationship cascade: load the children, delete each
+    for map in campaign.maps:
+        db.session.delete(map)
+    db.session.delete(campaign)
+
+def run(label, delete):
+    dm = User.query.first()
+    campaign_id = make_campaign(dm.id)
+    campaign = db.session.get(Campaign, campaign_id)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    delete(campaign)
+    db.session.commit()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert Map.query.filter_by(campaign_id=campaign_id).count() == 0
+    print(f"  {label:<18} {elapsed * 1000:>8.1f} ms   peak {peak / 1e6:>7.1f} MB")
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+        })
+        with app.app_context():
+            db.create_all()
+            db.session.add(User("Bench", "DM", "dm@example.com", "x", "dm"))
+            db.session.commit()
+
+            print(f"Deleting a campaign with {MAPS} maps of {MARKERS_PER_MAP} markers each")
+            run("orm cascade", orm_cascade)
+            run("on delete cascade", db.session.delete)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_event_log.py
+#
+# Per-event cost of logging from a socket handler: the old colored print() versus
+# log_event() feeding the queue and writer thread. Each is run against a fast sink
+# (/dev/null) and against a pipe whose reader falls behind, like a container log
+# driver under load. Latency is measured per call, as seen by the handler.
+#
+#   cd backend && python -m benchmarks.bench_event_log
+
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from app.event_log import EventLog
+
+EVENTS = 20000
+
+class SlowPipe:
+    """A line-buffered pipe whose reader drains about bytes_per_second."""
+
+    def __init__(self, bytes_per_second):
+        read_fd, write_fd = os.pipe()
+        self.file = os.fdopen(write_fd, 'w', buffering=1)
+        self.reader = os.fdopen(read_fd, 'rb', buffering=0)
+        self.delay = 4096 / bytes_per_second
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        while self.reader.read(4096):
+            time.sleep(self.delay)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+    return f"p50 {pick(0.5):>7.1f} µs   p99 {pick(0.99):>8.1f} µs   max {samples[-1] / 1e6:>7.1f} ms"
+
+def run(label, sink, log_one):
+    samples = []
+    map_id, user_id = uuid.uuid4(), uuid.uuid4()
+    for i in range(EVENTS):
+        start = time.perf_counter_ns()
+        log_one(sink, map_id, user_id, i)
+        samples.append(time.perf_counter_ns() - start)
+    print(f"  {label:<12} {percentiles(samples)}")
+
+def old_print(sink, map_id, user_id, i):
+    print(f'\033[92mMarker added to map {map_id} by user {user_id}\033[0m', file=sink)
+
+def bench(label, make_sink):
+    print(label)
+    run("print", make_sink(), old_print)
+
+    log = EventLog()
+    log.init_app(SimpleNamespace(config={'EVENT_LOG_STREAM': make_sink(), 'EVENT_LOG_QUEUE_SIZE': 10000}))
+    run("log_event", None, lambda sink, map_id, user_id, i: log.log('marker_added', map_id=map_id, marker_id=i, user_id=user_id))
+    stats = log.stats()
+    log.stop()
+    print(f"  {'':<12} ({stats['dropped']} of {EVENTS} dropped with the writer behind)")
+
+if __name__ == '__main__':
+    bench(f"{EVENTS} marker_added events, fast sink (/dev/null)", lambda: open(os.devnull, 'w', buffering=1))
+    bench(f"{EVENTS} marker_added events, slow sink (pipe drained at 512 KB/s)", lambda: SlowPipe(512 * 1024).file)
@@ -0,0 +1,70 @@
+# benchmarks/bench_map_codec.py
+#
+# Compares the JSON text python-socketio puts on the wire today with the
+# opt-in MessagePack codec for map traffic: payload size and encode/decode time.
+#
+#   cd backend && python -m benchmarks.bench_map_codec
+
+import json
+import random
+import timeit
+import uuid
+import msgspec
+from app.map_codec import Marker, Line, Move
+
+class Snapshot(msgspec.Struct):
+    map_id: str
+    markers: list[Marker]
+    lines: list[Line]
+    epoch: str
+    seq: int
+
+class MarkersMoved(msgspec.Struct):
+    moves: list[Move]
+    seq: int
+
+def point():
+    return {'x': random.randrange(-5000, 5000, 50), 'y': random.randrange(-5000, 5000, 50)}
+
+def make_snapshot(num_markers, num_lines):
+    return {
+        'map_id': str(uuid.uuid4()),
+        'markers': [
+            {'id': str(uuid.uuid4()), 'pos': point(), 'color': '#E57373', 'size': 'medium'}
+            for _ in range(num_markers)
+        ],
+        'lines': [
+            {'id': str(uuid.uuid4()), 'start': point(), 'end': point(), 'color': '#000000'}
+            for _ in range(num_lines)
+        ],
+        'epoch': uuid.uuid4().hex,
+        'seq': 1234,
+    }
+
+def make_moves(num_moves):
+    return {
+        'moves': [{'marker_id': str(uuid.uuid4()), 'new_position': point()} for _ in range(num_moves)],
+        'seq': 1234,
+    }
+
+def bench(label, payload, struct_type, number):
+    encoder = msgspec.msgpack.Encoder()
+    decoder = msgspec.msgpack.Decoder(struct_type)
+
+    as_json = json.dumps(payload, separators=(',', ':'))
+    as_msgpack = encoder.encode(payload)
+
+    json_encode = timeit.timeit(lambda: json.dumps(payload, separators=(',', ':')), number=number) / number
+    json_decode = timeit.timeit(lambda: json.loads(as_json), number=number) / number
+    msgpack_encode = timeit.timeit(lambda: encoder.encode(payload), number=number) / number
+    msgpack_decode = timeit.timeit(lambda: decoder.decode(as_msgpack), number=number) / number
+
+    print(f"{label}")
+    print(f"  bytes      json {len(as_json.encode()):>9}   msgpack {len(as_msgpack):>9}   ({len(as_msgpack) / len(as_json.encode()):.0%})")
+    print(f"  encode µs  json {json_encode * 1e6:>9.1f}   msgpack {msgpack_encode * 1e6:>9.1f}   ({json_encode / msgpack_encode:.1f}x faster)")
+    print(f"  decode µs  json {json_decode * 1e6:>9.1f}   msgpack {msgpack_decode * 1e6:>9.1f}   ({json_decode / msgpack_decode:.1f}x faster)")
+
+if __name__ == '__main__':
+    random.seed(0)
+    bench("initialize_map_state (500 markers, 2000 lines)", make_snapshot(500, 2000), Snapshot, 200)
+    bench("markers_moved (8 moves)", make_moves(8), MarkersMoved, 20000)
@@ -0,0 +1,77 @@
+# benchmarks/bench_report_rollups.py
+#
+# The unfiltered report summaries over the data bench_campaign_report.py seeds (50k
+# campaigns, 5k characters). "scan" works each summary out from the rows as the
+# reports do when their filters aren't kept in the rollups: the campaign summary's
+# aggregate query, the character report's rows and Python loops. "rollup" reads the
+# running totals. Also times a full refresh. Runs against a throwaway SQLite file.
+#
+#   cd backend && python -m benchmarks.bench_report_rollups
+
+import statistics
+import tempfile
+import time
+from sqlalchemy import text
+from app import create_app, db
+from app.blueprints.report_routes import campaign_report_sorts, campaign_report_sql, campaign_report_stats_sql
+from app.pagination import Page
+from app.populate_db import populate_class_types, populate_races
+from app.report_rollups import rollups
+from benchmarks.bench_campaign_report import seed
+
+RUNS = 5
+
+def campaign_scan():
+    page = Page('name', campaign_report_sorts['name'])
+    matched, bindparams, params = campaign_report_sql({}, page)
+    stats = db.session.execute(text(campaign_report_stats_sql(matched, params)).bindparams(*bindparams), params).one()
+    return stats.num_campaigns
+
+def character_scan():
+    rows = db.session.execute(text("""
+SELECT ch.gender, ch.level, r.name AS race, ct.name AS class_type
+FROM character ch
+JOIN "user" u ON ch.user_id = u.id
+LEFT JOIN race r ON ch.race_id = r.id
+LEFT JOIN class_type ct ON ch.class_id = ct.id
+""")).fetchall()
+    genders, races, classes = {}, {}, {}
+    for row in rows:
+        genders[row.gender] = genders.get(row.gender, 0) + 1
+        races[row.race] = races.get(row.race, 0) + 1
+        classes[row.class_type] = classes.get(row.class_type, 0) + 1
+    return len(rows)
+
+def run(label, report):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = report()
+        times.append(time.perf_counter() - start)
+    print(f"  {label:<20} {statistics.median(times) * 1000:>8.2f} ms")
+    return result
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+        })
+        with app.app_context():
+            db.create_all()
+            populate_class_types()
+            populate_races()
+            seed()
+
+            start = time.perf_counter()
+            rollups.refresh()
+            db.session.commit()
+            print(f"Refresh: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+            print(f"Unfiltered report summaries, median of {RUNS}")
+            assert run("campaigns scan", campaign_scan) == run("campaigns rollup", lambda: rollups.campaign_stats(['']))['num_campaigns']
+            assert run("characters scan", character_scan) == run("characters rollup", lambda: rollups.character_stats(['']))['num_characters']
+
+if __name__ == '__main__':
+    main()
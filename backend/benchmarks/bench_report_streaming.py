@@ -0,0 +1,58 @@
+# benchmarks/bench_report_streaming.py
+#
+# The unfiltered campaign report over the data bench_campaign_report.py seeds (50k
+# campaigns, 0-4 characters each), as one JSON body and streamed as NDJSON
+# (?format=ndjson), through the test client against a throwaway SQLite file. Shows the
+# time to the first chunk, the time to the last and, in a separate run since tracing
+# slows everything down, the peak memory the server side held. The report cache is
+# off so every run builds the report.
+#
+#   cd backend && python -m benchmarks.bench_report_streaming
+
+import tempfile
+import time
+import tracemalloc
+from app import create_app, db
+from app.populate_db import populate_class_types, populate_races
+from benchmarks.bench_campaign_report import seed
+
+REPORT = {'sort': 'name'}
+
+def fetch(client, path):
+    """(seconds to the first chunk, seconds to the last, bytes) for one report."""
+    start = time.perf_counter()
+    response = client.post(path, json=REPORT, buffered=False)
+    first, size = None, 0
+    for chunk in response.response:
+        first = first or time.perf_counter() - start
+        size += len(chunk)
+    response.close()
+    return first, time.perf_counter() - start, size
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+            "REPORT_CACHE_MAX_ENTRIES": 0,
+        })
+        with app.app_context():
+            db.create_all()
+            populate_class_types()
+            populate_races()
+            seed()
+
+        client = app.test_client()
+        print("Unfiltered campaign report, 50000 campaigns")
+        for label, path in [("json", '/report/generate_campaign'), ("ndjson", '/report/generate_campaign?format=ndjson')]:
+            first, total, size = fetch(client, path)
+            tracemalloc.start()
+            fetch(client, path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"  {label:<8} first byte {first * 1000:>7.0f} ms   total {total * 1000:>7.0f} ms"
+                  f"   {size / 1e6:>5.1f} MB   peak {peak / 1e6:>6.1f} MB")
+
+if __name__ == '__main__':
+    main()
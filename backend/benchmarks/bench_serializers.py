@@ -0,0 +1,97 @@
+# benchmarks/bench_serializers.py
+#
+# Building the get_characters response for one user with 10k characters. "orm + jsonify"
+# is what the endpoint used to do: load Character entities, lazy-load each one's race
+# and class, copy the fields into dicts and jsonify them. "projection + msgspec" is the
+# serializers.py path: one column-only select with race and class names joined in,
+# rows into CharacterSheet Structs, one msgspec encode. Runs against a throwaway SQLite
+# file; the session is emptied before every run so each starts cold, like a request.
+#
+#   cd backend && python -m benchmarks.bench_serializers
+
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from flask import jsonify
+from app import create_app, db
+from app.models import Character, ClassType, Race, User
+from app.populate_db import populate_class_types, populate_races
+from app.serializers import CharacterSheet, character_sheets, respond
+
+CHARACTERS = 10000
+RUNS = 5
+
+def orm_jsonify(user_id):
+    characters = Character.query.filter_by(user_id=user_id).order_by(Character.name, Character.id).all()
+    return jsonify({"characters": [
+        {
+            "id": str(character.id),
+            "name": character.name,
+            "gender": character.gender,
+            "race_id": character.race_id,
+            "race": character.race.name,
+            "class_id": character.class_id,
+            "classType": character.class_type.name,
+            "level": character.level,
+            "user_id": str(character.user_id),
+            "speed": character.speed,
+            "size": character.size,
+            "marker_color": character.marker_color
+        } for character in characters
+    ]})
+
+def projection_msgspec(user_id):
+    rows = db.session.execute(character_sheets(Character.user_id == user_id).order_by(Character.name, Character.id))
+    return respond({"characters": [CharacterSheet(*row) for row in rows]})
+
+def run(label, build, user_id):
+    times = []
+    for _ in range(RUNS):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        body = build(user_id).get_data()
+        times.append(time.perf_counter() - start)
+
+    # Memory separately, tracing slows everything down
+    db.session.expunge_all()
+    tracemalloc.start()
+    build(user_id).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"  {label:<20} {statistics.median(times) * 1000:>8.1f} ms   peak {peak / 1e6:>6.1f} MB   {len(body) / 1e6:.1f} MB body")
+    return body
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app, _ = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{directory}/bench.db",
+            "SESSION_TYPE": "sqlalchemy",
+            "SHARED_STATE_URL": "local://bench",
+        })
+        with app.test_request_context():
+            db.create_all()
+            populate_class_types()
+            populate_races()
+            user = User("Bench", "Player", "player@example.com", "x", "player")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            races, classes = Race.query.all(), ClassType.query.all()
+            db.session.execute(Character.__table__.insert(), [
+                {'id': uuid.uuid4(), 'name': f'Hero {i:05}', 'gender': 'female', 'race_id': races[i % len(races)].id,
+                 'class_id': classes[i % len(classes)].id, 'level': i % 20 + 1, 'user_id': user_id, 'speed': 30,
+                 'size': 'medium', 'marker_color': '#ff9800'}
+                for i in range(CHARACTERS)
+            ])
+            db.session.commit()
+
+            print(f"get_characters for one user with {CHARACTERS} characters, median of {RUNS}")
+            before = app.json.loads(run("orm + jsonify", orm_jsonify, user_id))
+            after = app.json.loads(run("projection + msgspec", projection_msgspec, user_id))
+            assert before == after
+
+if __name__ == '__main__':
+    main()
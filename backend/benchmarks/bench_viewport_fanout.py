@@ -0,0 +1,62 @@
+# benchmarks/bench_viewport_fanout.py
+#
+# Estimates broadcast bytes for a large battle map with and without viewport
+# filtering: eight clients each looking at a screen-sized part of the map while
+# markers are added, dragged and removed all over it.
+#
+#   cd backend && python -m benchmarks.bench_viewport_fanout
+
+import json
+import random
+import time
+import uuid
+from app.map_state import MapRoomState
+from app.spatial_index import intersects, union
+
+MAP_SIZE = 20000
+NUM_CLIENTS = 8
+NUM_OPS = 20000
+MARGIN = 250
+
+def random_pos():
+    return {'x': random.randrange(0, MAP_SIZE, 50), 'y': random.randrange(0, MAP_SIZE, 50)}
+
+def main():
+    random.seed(0)
+    room = MapRoomState('map', markers=[
+        {'id': str(uuid.uuid4()), 'pos': random_pos(), 'color': '#E57373', 'size': 'medium'}
+        for _ in range(2000)
+    ])
+    viewports = []
+    for _ in range(NUM_CLIENTS):
+        x, y = random.randrange(0, MAP_SIZE - 1920), random.randrange(0, MAP_SIZE - 1080)
+        viewports.append((x - MARGIN, y - MARGIN, x + 1920 + MARGIN, y + 1080 + MARGIN))
+
+    marker_ids = list(room.markers)
+    everyone = filtered = 0
+    start = time.perf_counter()
+    for _ in range(NUM_OPS):
+        marker_id = random.choice(marker_ids)
+        old_bbox = room.bbox('marker', marker_id)
+        pos = room.markers[marker_id]['pos']
+        new_position = {'x': pos['x'] + random.choice((-50, 0, 50)), 'y': pos['y'] + random.choice((-50, 0, 50))}
+        room.move_marker(marker_id, new_position)
+
+        size = len(json.dumps({'moves': [{'marker_id': marker_id, 'new_position': new_position}], 'seq': 1}))
+        bbox = union(old_bbox, room.bbox('marker', marker_id))
+        everyone += size * NUM_CLIENTS
+        filtered += size * sum(1 for viewport in viewports if intersects(viewport, bbox))
+    elapsed = time.perf_counter() - start
+
+    print(f"{NUM_OPS} moves, {len(room.markers)} markers on a {MAP_SIZE}x{MAP_SIZE} map, {NUM_CLIENTS} clients")
+    print(f"  broadcast to room     {everyone / 1024:>10.1f} KiB")
+    print(f"  viewport filtered     {filtered / 1024:>10.1f} KiB  ({filtered / everyone:.1%})")
+    print(f"  index upkeep + filter {elapsed / NUM_OPS * 1e6:>10.1f} µs per move")
+
+    start = time.perf_counter()
+    for viewport in viewports * 100:
+        room.objects_in_rect(viewport)
+    print(f"  viewport query        {(time.perf_counter() - start) / (len(viewports) * 100) * 1e6:>10.1f} µs per query")
+
+if __name__ == '__main__':
+    main()
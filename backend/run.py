@@ -1,12 +1,17 @@
 import eventlet
 eventlet.monkey_patch() # Patch standard library to support async operations
 
+from app.db_green import make_psycopg_green
+make_psycopg_green() # Let other green threads run while a query waits on PostgreSQL
+
 from app import create_app, db, socketio
 import os
 from dotenv import load_dotenv
 from app.models import ClassType, Race
 import app.socket_events  # Import socket events to register them with the app
 from backend.app.populate_db import populate_class_types, populate_races
+from app.reference_data import reference
+from app.report_rollups import rollups
 
 load_dotenv()
 
@@ -17,6 +22,10 @@ if __name__ == '__main__':
         # db.create_all()
         populate_class_types()
         populate_races()
+        reference.reload()
+        if not rollups.ready():
+            rollups.refresh()
+            db.session.commit()
 
     # app.run(debug=True, port=os.getenv('PORT') or 5000)
     # sockio.run() essentially wraps app.run() to enable socket support
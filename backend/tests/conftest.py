@@ -0,0 +1,118 @@
+# tests/conftest.py
+
+import uuid
+from contextlib import contextmanager
+from datetime import date, time
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.populate_db import populate_class_types, populate_races
+
+TEST_CONFIG = {
+    "TESTING": True,
+    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+    "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+    "SESSION_TYPE": "sqlalchemy",
+    "SHARED_STATE_URL": "local://tests",
+    "BCRYPT_ROUNDS": 4,
+    "METRICS_TOKEN": None,
+}
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app, sio = create_app(dict(TEST_CONFIG))
+
+    with flask_app.app_context():
+        import app.models
+        import app.socket_events
+        db.create_all()
+        populate_class_types()
+        populate_races()
+
+    yield flask_app, sio
+
+    with flask_app.app_context():
+        db.drop_all()
+
+@pytest.fixture(autouse=True)
+def reset_map_rooms():
+    yield
+    from app.cluster import cluster
+    from app.map_state import map_states
+    from app.move_coalescer import move_coalescer
+    from app.response_cache import responses
+    from app.report_cache import report_results
+    map_states.rooms.clear()
+    move_coalescer.pending.clear()
+    responses.entries.clear()
+    report_results.clear()
+    if cluster.client:
+        cluster.client.flushdb()
+        cluster.owners.clear()
+
+@pytest.fixture
+def app_ctx(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        yield flask_app
+
+def make_user(username=None):
+    from app.models import User
+    username = username or f"user_{uuid.uuid4().hex[:8]}"
+    user = User(first="Test", last="User", email=f"{username}@example.com", password="x", username=username)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def login(flask_app, user_id):
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+def make_open_map(dm):
+    from app.models import Campaign, Map
+    campaign = Campaign(
+        name="Test Campaign", description="", dm_id=dm.id, start_date=date(2025, 1, 1), end_date=None,
+        meeting_time=time(18, 0), meeting_day="Friday", meeting_frequency="Weekly"
+    )
+    db.session.add(campaign)
+    db.session.commit()
+    map = Map(name=f"Map {campaign.id}", owner_id=dm.id, campaign_id=campaign.id)
+    map.is_open = True
+    db.session.add(map)
+    db.session.commit()
+    return campaign, map
+
+def add_player(campaign, player):
+    from app.models import campaign_users
+    db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=player.id, character_id=None))
+    db.session.commit()
+
+def seed_campaign(name, players, end_date=None, meeting_day="Friday"):
+    from app.models import Character, ClassType, Race, campaign_users
+    dm = make_user()
+    campaign, _ = make_open_map(dm)
+    campaign.name, campaign.end_date, campaign.meeting_day = name, end_date, meeting_day
+    race, class_type = Race.query.first(), ClassType.query.first()
+    for i in range(players):
+        player = make_user()
+        character = Character(f"{name} hero {i}", "male", race.id, class_type.id, 1, player.id, 30, 'medium', '#ff9800')
+        db.session.add(character)
+        db.session.flush()
+        db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=player.id, character_id=character.id))
+    # The DM's own membership row has no character and must not be counted
+    db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=dm.id, character_id=None))
+    db.session.commit()
+
+@contextmanager
+def count_queries():
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,48 @@
+# tests/test_bulk_invite.py
+
+from app import db
+from app.models import campaign_invites
+from conftest import make_user, login, make_open_map, add_player, count_queries
+
+def test_bulk_invite_reports_each_username(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, member, invited = make_user(), make_user(), make_user()
+        fresh = [make_user() for _ in range(3)]
+        campaign, _ = make_open_map(dm)
+        add_player(campaign, member)
+        db.session.execute(campaign_invites.insert().values(campaign_id=campaign.id, user_id=invited.id))
+        db.session.commit()
+        dm_id, campaign_id = dm.id, str(campaign.id)
+        usernames = [member.username, invited.username, 'nobody_by_this_name'] + [user.username for user in fresh]
+
+    client = login(flask_app, dm_id)
+    with flask_app.app_context():
+        with count_queries() as statements:
+            response = client.post('/campaign/bulk_invite', json={'campaign_id': campaign_id, 'usernames': usernames + usernames[:2]})
+    assert response.status_code == 200
+    assert [(r['username'], r['status']) for r in response.get_json()['results']] == list(zip(usernames, [
+        'already_in_campaign', 'already_invited', 'not_found', 'invited', 'invited', 'invited',
+    ]))
+    # One lookup and one insert for the invites, whatever the number of usernames
+    assert sum('campaign_invites' in statement for statement in statements) == 2
+
+    response = client.post('/campaign/bulk_invite', json={'campaign_id': campaign_id, 'usernames': usernames[3:]})
+    assert {r['status'] for r in response.get_json()['results']} == {'already_invited'}
+
+    # The single invite goes through the same checks
+    response = client.post('/campaign/invite', json={'campaign_id': campaign_id, 'username': usernames[1]})
+    assert response.status_code == 400
+
+def test_bulk_invite_is_dm_only(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, other = make_user(), make_user()
+        campaign, _ = make_open_map(dm)
+        other_id, campaign_id = other.id, str(campaign.id)
+
+    client = login(flask_app, other_id)
+    response = client.post('/campaign/bulk_invite', json={'campaign_id': campaign_id, 'usernames': ['someone']})
+    assert response.status_code == 403
+    response = client.post('/campaign/bulk_invite', json={'campaign_id': campaign_id, 'usernames': 'someone'})
+    assert response.status_code == 400
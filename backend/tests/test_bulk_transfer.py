@@ -0,0 +1,83 @@
+# tests/test_bulk_transfer.py
+
+import csv
+import io
+import json
+from app import db
+from app.models import Campaign, Character, Race, campaign_users
+from conftest import make_user, login
+
+def test_characters_round_trip_through_both_formats(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+        race = Race.query.first().name
+    client = login(flask_app, user_id)
+
+    upload = '\n'.join(json.dumps(row) for row in [
+        {'name': 'Ash', 'gender': 'male', 'race': race, 'classType': 'Wizard', 'level': 4},
+        {'name': 'Birch', 'gender': 'female', 'race': race, 'classType': 'Rogue'},
+    ]) + '\n'
+    response = client.post('/character/import', data=upload, content_type='application/x-ndjson')
+    assert response.status_code == 201
+    assert response.get_json()['imported'] == 2
+
+    response = client.get('/character/export')
+    assert response.is_streamed
+    exported = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted((c['name'], c['classType'], c['level']) for c in exported) == [('Ash', 'Wizard', 4), ('Birch', 'Rogue', 1)]
+
+    # The CSV export imports again as is, race and class by id this time
+    exported_csv = client.get('/character/export?format=csv').get_data(as_text=True)
+    assert exported_csv.startswith('id,name,gender,race_id,race,class_id,classType,level')
+    response = client.post('/character/import', data=exported_csv, content_type='text/csv')
+    assert response.get_json()['imported'] == 2
+    rows = list(csv.DictReader(io.StringIO(client.get('/character/export?format=csv').get_data(as_text=True))))
+    assert len(rows) == 4
+
+def test_invalid_rows_import_nothing(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+    client = login(flask_app, user_id)
+
+    upload = (
+        '{"name": "Fine", "gender": "male", "race": "Elf", "classType": "Bard"}\n'
+        '{"name": "Nowhere", "gender": "male", "race": "Merfolk", "classType": "Bard"}\n'
+        '\n'
+        '{"name": "' + 'x' * 60 + '", "gender": "male", "race": "Elf", "classType": "Bard"}\n'
+        'not json\n'
+    )
+    response = client.post('/character/import', data=upload)
+    assert response.status_code == 400
+    assert [error['line'] for error in response.get_json()['errors']] == [2, 4, 5]
+    assert response.get_json()['errors'][0]['error'] == 'Race not found'
+    with flask_app.app_context():
+        assert Character.query.filter_by(user_id=user_id).count() == 0
+
+    assert client.get('/character/export?format=xml').status_code == 400
+
+def test_campaign_import_makes_the_user_dm(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+    client = login(flask_app, user_id)
+
+    upload = (
+        'name,description,start_date,end_date,meeting_time,meeting_day,meeting_frequency\n'
+        'Imported one,,2025-02-01,,19:30,Monday,Weekly\n'
+        'Imported two,Second,2025-03-01,2025-06-01,20:00:00,Friday,Monthly\n'
+    )
+    response = client.post('/campaign/import', data=upload, content_type='text/csv')
+    assert response.status_code == 201
+
+    with flask_app.app_context():
+        campaigns = Campaign.query.filter_by(dm_id=user_id).order_by(Campaign.name).all()
+        assert [c.name for c in campaigns] == ['Imported one', 'Imported two']
+        assert db.session.query(campaign_users).filter_by(user_id=user_id).count() == 2
+
+    dashboard = client.get('/campaign/get_campaigns').get_json()['campaigns']
+    assert [(c['name'], c['meeting_time']) for c in dashboard] == [('Imported one', '19:30'), ('Imported two', '20:00')]
+
+    exported = [json.loads(line) for line in client.get('/campaign/export').get_data(as_text=True).splitlines()]
+    assert sorted(c['end_date'] or '' for c in exported) == ['', '2025-06-01']
@@ -0,0 +1,56 @@
+# tests/test_campaign_dashboard.py
+
+from app import db
+from app.models import Character, ClassType, Map, Race, User, campaign_users
+from app.response_cache import responses
+from conftest import make_user, login, make_open_map, count_queries
+
+def add_campaigns(dm, player, count):
+    race, class_type = Race.query.first(), ClassType.query.first()
+    for _ in range(count):
+        campaign, _ = make_open_map(dm)
+        db.session.add(Map(name="Second map", owner_id=dm.id, campaign_id=campaign.id))
+        character = Character("Hero", "female", race.id, class_type.id, 3, player.id, 30, 'medium', '#ff9800')
+        db.session.add(character)
+        db.session.commit()
+        db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=player.id, character_id=character.id))
+        db.session.commit()
+
+def fetch_dashboard(flask_app, user_id):
+    client = login(flask_app, user_id)
+    with flask_app.app_context():
+        with count_queries() as statements:
+            response = client.get('/campaign/get_campaigns')
+    assert response.status_code == 200
+    return response.get_json()['campaigns'], len(statements)
+
+def test_get_campaigns_query_count_is_constant(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, player = make_user(), make_user()
+        dm_id, player_id, dm_name = dm.id, player.id, dm.username
+        add_campaigns(dm, player, 1)
+
+    campaigns, one_campaign = fetch_dashboard(flask_app, player_id)
+    assert len(campaigns) == 1
+
+    with flask_app.app_context():
+        add_campaigns(db.session.get(User, dm_id), db.session.get(User, player_id), 5)
+    # Written behind the routes' back, so nothing invalidated the cached response
+    responses.invalidate([dm_id, player_id])
+
+    campaigns, six_campaigns = fetch_dashboard(flask_app, player_id)
+    assert len(campaigns) == 6
+    assert six_campaigns == one_campaign
+
+    campaign = campaigns[0]
+    assert campaign['dm'] == dm_name
+    assert campaign['char_count'] == 1
+    assert campaign['characters'][0]['race'] and campaign['characters'][0]['classType']
+    assert [m['name'] for m in campaign['maps']].count("Second map") == 1
+    assert 'markers' not in campaign['maps'][0]
+
+    # The DM sees the same campaigns from the other side
+    campaigns, dm_queries = fetch_dashboard(flask_app, dm_id)
+    assert len(campaigns) == 6
+    assert dm_queries == one_campaign
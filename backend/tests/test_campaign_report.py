@@ -0,0 +1,52 @@
+# tests/test_campaign_report.py
+
+from datetime import date
+from sqlalchemy import text
+from app import db
+from app.blueprints.report_routes import campaign_report_rows_sql, campaign_report_sorts, campaign_report_sql
+from app.pagination import Page
+from conftest import seed_campaign
+
+def test_summary_comes_from_sql(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        seed_campaign("Stats A", 3, end_date=date(2025, 1, 11))
+        seed_campaign("Stats B", 1, end_date=date(2025, 1, 31), meeting_day="Monday")
+        seed_campaign("Stats C", 0)
+
+    client = flask_app.test_client()
+    body = client.post('/report/generate_campaign', json={'campaignName': 'Stats '}).get_json()
+    assert body['num_campaigns'] == 3
+    # Campaigns start on 2025-01-01, only those with an end date count
+    assert body['avg_duration'] == 20
+    assert body['avg_char_count'] == 4 / 3
+    assert body['meeting_days'] == {
+        'Monday': 1, 'Tuesday': 0, 'Wednesday': 0, 'Thursday': 0, 'Friday': 2, 'Saturday': 0, 'Sunday': 0,
+    }
+    assert body['meeting_frequencies'] == {'Weekly': 3, 'Bi-Weekly': 0, 'Monthly': 0, 'One-Shot': 0}
+    assert [(c['name'], c['char_count'], len(c['characters'])) for c in body['campaigns']] == [
+        ("Stats A", 3, 3), ("Stats B", 1, 1), ("Stats C", 0, 0),
+    ]
+    assert [c['name'] for c in body['campaigns'][0]['characters']] == [f"Stats A hero {i}" for i in range(3)]
+
+    body = client.post('/report/generate_campaign', json={
+        'campaignName': 'Stats ', 'charCountMin': 1, 'sort': 'char_count', 'order': 'desc',
+    }).get_json()
+    assert [c['name'] for c in body['campaigns']] == ["Stats A", "Stats B"]
+    assert body['avg_duration'] == 20
+
+def test_report_plan_joins_campaign_users_once(app_ctx):
+    page = Page('name', campaign_report_sorts['name'])
+    matched, bindparams, params = campaign_report_sql({'campaignName': 'x'}, page)
+    plan = db.session.execute(
+        text("EXPLAIN QUERY PLAN " + campaign_report_rows_sql(matched, page)).bindparams(*bindparams), params
+    ).fetchall()
+    details = [row[-1] for row in plan]
+
+    # Character counts: one pass over campaign_users, grouped along its primary key
+    assert [detail for detail in details if detail.startswith(('SCAN', 'SEARCH')) and 'campaign_users_1' in detail] == [
+        'SCAN campaign_users USING INDEX sqlite_autoindex_campaign_users_1',
+        # Character rows: one index lookup per campaign
+        'SEARCH cu USING INDEX sqlite_autoindex_campaign_users_1 (campaign_id=?) LEFT-JOIN',
+    ]
+    assert not [detail for detail in details if 'GROUP BY' in detail or 'DISTINCT' in detail]
@@ -0,0 +1,59 @@
+# tests/test_cascades.py
+
+from sqlalchemy import text
+from app import db
+from app.models import Campaign, Character, ClassType, Map, Race, User, campaign_invites, campaign_users
+from conftest import make_user, login, make_open_map, add_player, count_queries
+
+def test_foreign_keys_are_enforced(app_ctx):
+    assert db.session.execute(text('PRAGMA foreign_keys')).scalar() == 1
+
+def test_deleting_a_campaign_is_one_statement(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, player, invited = make_user(), make_user(), make_user()
+        campaign, _ = make_open_map(dm)
+        for i in range(5):
+            map = Map(name=f"Map {i}", owner_id=dm.id, campaign_id=campaign.id)
+            map.markers = [{'id': f'm{n}', 'pos': {'x': n, 'y': n}} for n in range(500)]
+            db.session.add(map)
+        add_player(campaign, player)
+        db.session.execute(campaign_invites.insert().values(campaign_id=campaign.id, user_id=invited.id))
+        db.session.commit()
+        dm_id, campaign_id = dm.id, campaign.id
+
+    client = login(flask_app, dm_id)
+    with flask_app.app_context():
+        with count_queries() as statements:
+            assert client.delete(f'/campaign/delete_campaign/{campaign_id}').status_code == 200
+        deletes = [statement for statement in statements if statement.startswith('DELETE')]
+        # Sessions table aside, only the campaign row is deleted by the application
+        assert [statement for statement in deletes if 'sessions' not in statement] == ['DELETE FROM campaign WHERE campaign.id = ?']
+        assert not any('FROM map' in statement for statement in statements)
+
+        assert Map.query.filter_by(campaign_id=campaign_id).count() == 0
+        assert db.session.query(campaign_users).filter_by(campaign_id=campaign_id).count() == 0
+        assert db.session.query(campaign_invites).filter_by(campaign_id=campaign_id).count() == 0
+
+def test_deleting_a_user_removes_what_they_own(app_ctx):
+    dm, player = make_user(), make_user()
+    campaign, map = make_open_map(dm)
+    character = Character("Hero", "male", Race.query.first().id, ClassType.query.first().id, 1, player.id, 30, 'medium', '#ff9800')
+    db.session.add(character)
+    db.session.commit()
+    db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=player.id, character_id=character.id))
+    db.session.commit()
+    campaign_id, map_id, player_id = campaign.id, map.id, player.id
+
+    # A character going leaves its owner in the campaign
+    db.session.delete(character)
+    db.session.commit()
+    [seat] = db.session.query(campaign_users).filter_by(campaign_id=campaign_id, user_id=player_id).all()
+    assert seat.character_id is None
+
+    db.session.delete(dm)
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Campaign, campaign_id) is None
+    assert db.session.get(Map, map_id) is None
+    assert db.session.get(User, player_id) is not None
@@ -0,0 +1,119 @@
+# tests/test_cluster.py
+
+import msgspec
+import socketio as python_socketio
+from app.cluster import Cluster, cluster
+from app.map_rooms import dispatch
+from app.map_state import map_states
+from app.message_queue import LocalRedis, LocalRedisManager
+from conftest import make_user, login, make_open_map
+
+def make_worker(url):
+    server = python_socketio.Server(client_manager=LocalRedisManager(url), async_mode='eventlet')
+    server.manager.initialize()
+    return server
+
+def other_worker():
+    """A second worker sharing the test store, listening on its own channel."""
+    other = Cluster()
+    other.client = LocalRedis.from_url('local://tests')
+    other.prefix = cluster.prefix
+    inbox = other.client.pubsub()
+    inbox.subscribe(other.key('host', other.host_id))
+    return other, inbox
+
+def received(inbox):
+    messages = []
+    while not inbox.queue.empty():
+        message = inbox.queue.get()
+        if message:
+            messages.append(msgspec.json.decode(message['data']))
+    return messages
+
+def test_room_emits_reach_other_workers():
+    worker_a = make_worker('local://queue')
+    worker_b = make_worker('local://queue')
+
+    sent = []
+    worker_b._send_eio_packet = lambda eio_sid, pkt: sent.append((eio_sid, pkt.encode()))
+    sid = worker_b.manager.connect('eio_b', '/')
+    worker_b.manager.enter_room(sid, '/', 'map_1')
+
+    worker_a.sleep(0)
+    worker_a.emit('marker_added', {'marker': {'id': 'm1'}}, room='map_1')
+    worker_a.emit('marker_added', {'marker': {'id': 'm2'}}, room='map_2')
+    worker_a.sleep(0)
+
+    assert sent == [('eio_b', '42["marker_added",{"marker":{"id":"m1"}}]')]
+
+def test_map_events_are_forwarded_to_the_room_owner(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        _, map = make_open_map(dm)
+        dm_id, map_id = dm.id, map.id
+
+    other, inbox = other_worker()
+    assert other.claim(map_id) == other.host_id
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': str(map_id)})
+    dm_socket.emit('add_marker', {'map_id': str(map_id), 'marker': {'id': 'm1', 'pos': {'x': 0, 'y': 0}}})
+
+    # Nothing was loaded here, both ops went to the owner
+    assert map_states.get(map_id) is None
+    messages = received(inbox)
+    assert [m['payload']['op'] for m in messages] == ['join', 'add_marker']
+    assert messages[1]['payload']['kwargs']['marker']['id'] == 'm1'
+
+    sid = sio.server.manager.sid_from_eio_sid(dm_socket.eio_sid, '/')
+    assert cluster.user_socket(dm_id) == sid
+    dm_socket.disconnect()
+    assert cluster.user_socket(dm_id) is None
+    assert [m['payload']['op'] for m in received(inbox)] == ['leave']
+
+def test_owner_applies_ops_from_other_workers(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        _, map = make_open_map(dm)
+        dm_id, map_id = dm.id, map.id
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': str(map_id)})
+    dm_socket.get_received()
+    assert cluster.owner(map_id) == cluster.host_id
+    assert list(cluster.members(map_id)) == [sio.server.manager.sid_from_eio_sid(dm_socket.eio_sid, '/')]
+
+    # A player on another worker joins and places a marker
+    other, _ = other_worker()
+    other.send(cluster.host_id, 'map_op', map_id=map_id, op='join', kwargs={'sid': 'remote_sid', 'codec': 'json', 'is_dm': False})
+    other.send(cluster.host_id, 'map_op', map_id=map_id, op='add_marker', kwargs={'sid': 'remote_sid', 'marker': {'id': 'm1', 'pos': {'x': 0, 'y': 0}}})
+    for _ in range(3):
+        sio.sleep(0)
+
+    assert 'm1' in map_states.get(map_id).markers
+    assert 'remote_sid' in cluster.members(map_id)
+    added = [r for r in dm_socket.get_received() if r['name'] == 'marker_added']
+    assert added[0]['args'][0]['marker']['id'] == 'm1'
+
+    dm_socket.disconnect()
+
+def test_replacing_or_closing_a_room_does_not_claim_it(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm = make_user()
+        _, map = make_open_map(dm)
+        map_id = map.id
+
+        dispatch(map_id, 'replace', markers=[], lines=[])
+        dispatch(map_id, 'close', players_only=True)
+        assert cluster.owner(map_id) is None
+        assert map_states.get(map_id) is None
+
+        # A room another worker holds still hears about it
+        other, inbox = other_worker()
+        assert other.claim(map_id) == other.host_id
+        dispatch(map_id, 'close')
+        assert [m['payload']['op'] for m in received(inbox)] == ['close']
+        other.release(map_id)
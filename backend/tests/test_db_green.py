@@ -0,0 +1,92 @@
+# tests/test_db_green.py
+
+import os
+import socket
+import eventlet
+import pytest
+from psycopg2 import extensions
+from app.db_green import eventlet_wait_callback, make_psycopg_green
+from conftest import make_user, login, make_open_map, add_player
+
+class SlowQuery:
+    """Stands in for a psycopg2 connection whose query result arrives when finish() is called."""
+
+    def __init__(self):
+        self.client, self.server = socket.socketpair()
+        self.client.setblocking(False)
+        self.polls = 0
+
+    def fileno(self):
+        return self.client.fileno()
+
+    def poll(self):
+        self.polls += 1
+        try:
+            self.client.recv(1)
+        except BlockingIOError:
+            return extensions.POLL_READ
+        return extensions.POLL_OK
+
+    def finish(self):
+        self.server.send(b'x')
+
+def test_socket_events_flow_during_a_long_query(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    player_socket.emit('join_map_room', {'map_id': map_id})
+    marker_id = 'c0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b63'
+    dm_socket.emit('add_marker', {'map_id': map_id, 'marker': {'id': marker_id, 'pos': {'x': 0, 'y': 0}}})
+    player_socket.get_received()
+
+    query = SlowQuery()
+    waiting = eventlet.spawn(eventlet_wait_callback, query)
+    eventlet.sleep(0)
+    assert query.polls == 1
+
+    # Moves go out from the coalescer's background tick, which needs the hub while the query waits
+    for x in range(50, 550, 50):
+        dm_socket.emit('move_marker', {'map_id': map_id, 'marker_id': marker_id, 'new_position': {'x': x, 'y': 0}})
+    eventlet.sleep(0.2)
+
+    assert not waiting.dead
+    moved = [r for r in player_socket.get_received() if r['name'] == 'markers_moved']
+    assert moved[-1]['args'][0]['moves'] == [{'marker_id': marker_id, 'new_position': {'x': 500, 'y': 0}}]
+
+    query.finish()
+    waiting.wait()
+    assert query.polls == 2
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
+
+@pytest.mark.skipif(not os.getenv('TEST_POSTGRES_URL'), reason='TEST_POSTGRES_URL not set')
+def test_pg_sleep_does_not_block_the_hub():
+    import psycopg2
+
+    ticks = []
+    def tick():
+        while True:
+            ticks.append(1)
+            eventlet.sleep(0.01)
+
+    make_psycopg_green()
+    ticker = eventlet.spawn(tick)
+    try:
+        conn = psycopg2.connect(os.getenv('TEST_POSTGRES_URL'))
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_sleep(0.5)')
+        conn.close()
+    finally:
+        ticker.kill()
+        extensions.set_wait_callback(None)
+
+    assert len(ticks) > 10
@@ -0,0 +1,59 @@
+# tests/test_event_log.py
+
+import io
+import json
+import logging
+from types import SimpleNamespace
+from app.event_log import EventLog, EventSampler, events
+from conftest import make_user, login, make_open_map
+
+def test_events_are_written_as_json_lines():
+    stream = io.StringIO()
+    log = EventLog()
+    log.init_app(SimpleNamespace(config={'EVENT_LOG_STREAM': stream, 'EVENT_LOG_LEVEL': 'INFO'}))
+    log.log('map_joined', map_id='m1', user='dm')
+    log.log('socket_error', logging.ERROR, error='boom')
+    log.log('chatter', logging.DEBUG)
+    log.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line['event'], line['level']) for line in lines] == [('map_joined', 'info'), ('socket_error', 'error')]
+    assert lines[0]['map_id'] == 'm1'
+    assert lines[0]['user'] == 'dm'
+
+def test_sampling_and_rate_limits():
+    sampler = EventSampler(sampling={'marker_moved': 0.0, 'map_joined': 1.0}, rate_limits={'line_added': 2})
+    assert not sampler.allow('marker_moved')
+    assert sampler.allow('map_joined')
+    assert [sampler.allow('line_added', now=10.2) for _ in range(3)] == [True, True, False]
+    # A new second, a new allowance
+    assert sampler.allow('line_added', now=11.0)
+    assert sampler.sampled_out == 1
+    assert sampler.rate_limited == 1
+
+def test_full_queue_drops_instead_of_blocking():
+    # No writer running, so nothing drains the queue
+    log = EventLog()
+    log.queue_size = 1
+    log.log('marker_added')
+    log.log('marker_added')
+    assert log.stats()['queued'] == 1
+    assert log.dropped == 1
+
+def test_socket_handlers_log_events(app, monkeypatch):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        _, map = make_open_map(dm)
+        dm_id, map_id = dm.id, map.id
+
+    logged = []
+    monkeypatch.setattr(events, 'log', lambda event, level=logging.INFO, **fields: logged.append((event, fields)))
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': str(map_id)})
+    dm_socket.emit('add_marker', {'map_id': str(map_id), 'marker': {'id': 'm1', 'pos': {'x': 0, 'y': 0}}})
+    dm_socket.disconnect()
+
+    assert [event for event, _ in logged] == ['client_connected', 'map_joined', 'marker_added', 'client_disconnected']
+    assert logged[2][1] == {'map_id': map_id, 'marker_id': 'm1', 'user_id': dm_id}
@@ -1,39 +1,5 @@
 # tests/test_healthy.py
 
-import pytest
-from sqlalchemy.orm import clear_mappers
-from app import create_app, db, socketio
-from app.populate_db import populate_class_types, populate_races
-
-@pytest.fixture(autouse=True)
-def reset_sqlalchemy_state():
-    yield
-    clear_mappers()
-    db.metadata.clear()
-
-@pytest.fixture(scope='module')
-def app():
-    config = {
-        "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
-        "SESSION_TYPE": "sqlalchemy",
-    }
-    flask_app, sio = create_app(config)
-
-    with flask_app.app_context():
-        import app.models
-        db.create_all()
-        populate_class_types()
-        populate_races()
-
-    yield flask_app, sio
-
-    # teardown: drop everything under app context
-    with flask_app.app_context():
-        db.drop_all()
-
-
 def test_http_get(app):
     flask_app, _ = app
     client = flask_app.test_client()
@@ -46,3 +12,18 @@ def test_socket_connection(app):
     client = sio.test_client(flask_app)
     assert client.is_connected()
     client.disconnect()
+
+
+def test_metrics_need_the_token(app):
+    flask_app, _ = app
+    client = flask_app.test_client()
+    # Off unless a token is configured
+    assert client.get("/test/metrics").status_code == 404
+
+    flask_app.config['METRICS_TOKEN'] = 'metrics-secret'
+    try:
+        assert client.get("/test/metrics").status_code == 401
+        assert client.get("/test/metrics", headers={'Authorization': 'Bearer guess'}).status_code == 401
+        assert client.get("/test/metrics", headers={'Authorization': 'Bearer metrics-secret'}).status_code == 200
+    finally:
+        flask_app.config['METRICS_TOKEN'] = None
@@ -0,0 +1,51 @@
+# tests/test_map_codec.py
+
+import msgspec
+import pytest
+from app.map_codec import decode_event
+from conftest import make_user, login, make_open_map, add_player
+
+def test_decode_event_passes_dicts_through():
+    data = {'map_id': 'map', 'marker_id': 'm1', 'new_position': {'x': 1, 'y': 2}}
+    assert decode_event('move_marker', data) is data
+
+def test_decode_event_validates_binary_payloads():
+    encoded = msgspec.msgpack.encode({'map_id': 'map', 'marker_id': 'm1', 'new_position': {'x': 1, 'y': 2}})
+    assert decode_event('move_marker', encoded) == {'map_id': 'map', 'marker_id': 'm1', 'new_position': {'x': 1.0, 'y': 2.0}}
+
+    bad = msgspec.msgpack.encode({'map_id': 'map', 'marker_id': 'm1'})
+    with pytest.raises(msgspec.ValidationError):
+        decode_event('move_marker', bad)
+
+def test_mixed_codec_room(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, auth={'codec': 'msgpack'}, flask_test_client=login(flask_app, dm_id))
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    dm_socket.emit('join_map_room', msgspec.msgpack.encode({'map_id': map_id}))
+    player_socket.emit('join_map_room', {'map_id': map_id})
+
+    snapshot = next(r['args'][0] for r in dm_socket.get_received() if r['name'] == 'initialize_map_state')
+    assert msgspec.msgpack.decode(snapshot)['markers'] == []
+    player_socket.get_received()
+
+    marker = {'id': 'c0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b63', 'pos': {'x': 50.0, 'y': 50.0}, 'color': '#E57373', 'size': 'medium'}
+    dm_socket.emit('add_marker', msgspec.msgpack.encode({'map_id': map_id, 'marker': marker}))
+    added = player_socket.get_received()[-1]
+    assert added['name'] == 'marker_added'
+    assert added['args'][0]['marker'] == marker
+
+    player_socket.emit('add_line', {'map_id': map_id, 'line': {'id': 'l1', 'start': {'x': 0, 'y': 0}, 'end': {'x': 50, 'y': 0}, 'color': '#000000'}})
+    line_added = dm_socket.get_received()[-1]
+    assert line_added['name'] == 'line_added'
+    assert msgspec.msgpack.decode(line_added['args'][0])['line']['id'] == 'l1'
+    assert player_socket.get_received() == []
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
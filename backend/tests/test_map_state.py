@@ -0,0 +1,171 @@
+# tests/test_map_state.py
+
+import pytest
+from app import db
+from app.map_state import MapRoomState, map_states
+from app.models import Map
+from conftest import make_user, login, make_open_map, add_player
+
+def test_room_state_applies_events_in_order():
+    room = MapRoomState("map", markers=[{'id': 'm1', 'pos': {'x': 0, 'y': 0}}])
+    assert not room.dirty
+
+    room.add_marker({'id': 'm2', 'pos': {'x': 50, 'y': 50}})
+    room.move_marker('m1', {'x': 100, 'y': 0})
+    room.add_line({'id': 'l1', 'start': {'x': 0, 'y': 0}, 'end': {'x': 50, 'y': 0}})
+    assert room.remove_line('l1')
+    assert not room.remove_marker('missing')
+
+    snapshot = room.snapshot()
+    assert [m['id'] for m in snapshot['markers']] == ['m1', 'm2']
+    assert snapshot['markers'][0]['pos'] == {'x': 100, 'y': 0}
+    assert snapshot['lines'] == []
+    assert room.dirty
+
+def test_room_state_debounce():
+    room = MapRoomState("map")
+    room.add_marker({'id': 'm1', 'pos': {'x': 0, 'y': 0}})
+    start = room.dirty_since
+
+    assert not room.is_due(start + 0.5, debounce=1.0, max_delay=10.0)
+    assert room.is_due(start + 1.0, debounce=1.0, max_delay=10.0)
+
+    # Continuous edits keep pushing the flush back until max_delay is reached
+    room.last_change = start + 9.5
+    assert not room.is_due(start + 9.9, debounce=1.0, max_delay=10.0)
+    assert room.is_due(start + 10.0, debounce=1.0, max_delay=10.0)
+
+def test_flush_due_writes_dirty_rooms(app_ctx):
+    dm = make_user()
+    _, map = make_open_map(dm)
+
+    room = map_states.load(map)
+    room.add_marker({'id': 'm1', 'pos': {'x': 0, 'y': 0}})
+    room.add_line({'id': 'l1', 'start': {'x': 0, 'y': 0}, 'end': {'x': 50, 'y': 0}})
+
+    assert map_states.flush_due(now=room.last_change + 60) == 1
+    assert not room.dirty
+
+    db.session.expire_all()
+    saved = db.session.get(Map, map.id)
+    assert saved.markers == [{'id': 'm1', 'pos': {'x': 0, 'y': 0}}]
+    assert [line['id'] for line in saved.lines] == ['l1']
+    map_states.discard(map.id)
+
+def test_a_failed_write_leaves_rooms_dirty(app_ctx, monkeypatch):
+    dm = make_user()
+    _, map = make_open_map(dm)
+    room = map_states.load(map)
+    room.add_marker({'id': 'm1', 'pos': {'x': 0, 'y': 0}})
+
+    def fail():
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(db.session, 'commit', fail)
+    with pytest.raises(RuntimeError):
+        map_states.flush(map.id)
+    monkeypatch.undo()
+    assert room.dirty
+
+    assert map_states.flush(map.id)
+    assert not room.dirty
+    db.session.expire_all()
+    assert db.session.get(Map, map.id).markers == [{'id': 'm1', 'pos': {'x': 0, 'y': 0}}]
+    map_states.discard(map.id)
+
+def test_an_op_during_a_write_keeps_the_room_dirty(app_ctx, monkeypatch):
+    dm = make_user()
+    _, map = make_open_map(dm)
+    room = map_states.load(map)
+    room.add_marker({'id': 'm1', 'pos': {'x': 0, 'y': 0}})
+
+    # Stands in for another green thread running while the UPDATE waits on the database
+    execute = db.session.execute
+    def execute_then_edit(*args, **kwargs):
+        result = execute(*args, **kwargs)
+        room.add_marker({'id': 'm2', 'pos': {'x': 50, 'y': 50}})
+        return result
+    monkeypatch.setattr(db.session, 'execute', execute_then_edit)
+    assert map_states.flush(map.id)
+    monkeypatch.undo()
+    assert room.dirty
+
+    assert map_states.flush(map.id)
+    assert not room.dirty
+    db.session.expire_all()
+    assert [marker['id'] for marker in db.session.get(Map, map.id).markers] == ['m1', 'm2']
+    map_states.discard(map.id)
+
+def test_late_joiner_is_served_from_memory(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    marker = {'id': 'a2a0b8a4-6f1f-4a53-8d1f-3a4f1b1a0c01', 'pos': {'x': 50, 'y': 50}, 'color': '#fff', 'size': 'medium'}
+    dm_socket.emit('add_marker', {'map_id': map_id, 'marker': marker})
+    dm_socket.emit('move_marker', {'map_id': map_id, 'marker_id': marker['id'], 'new_position': {'x': 100, 'y': 50}})
+
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    player_socket.emit('join_map_room', {'map_id': map_id})
+    received = player_socket.get_received()
+
+    state = next(r['args'][0] for r in received if r['name'] == 'initialize_map_state')
+    assert state['markers'] == [dict(marker, pos={'x': 100, 'y': 50})]
+    assert not any(r['name'] == 'request_map_state' for r in dm_socket.get_received())
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
+
+def test_ops_since_covers_gaps_within_the_log():
+    room = MapRoomState("map", op_log_size=3)
+    for i in range(5):
+        room.record('marker_removed', {'marker_id': f'm{i}'})
+
+    assert room.seq == 5
+    assert [op['seq'] for op in room.ops_since(3, room.epoch)] == [4, 5]
+    assert room.ops_since(5, room.epoch) == []
+    # Older than the ring buffer, from another epoch, or from the future: snapshot instead
+    assert room.ops_since(1, room.epoch) is None
+    assert room.ops_since(3, 'stale') is None
+    assert room.ops_since(9, room.epoch) is None
+
+def test_reconnect_resumes_from_last_seq(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    player_client = login(flask_app, player_id)
+    player_socket = sio.test_client(flask_app, flask_test_client=player_client)
+    player_socket.emit('join_map_room', {'map_id': map_id})
+    state = next(r['args'][0] for r in player_socket.get_received() if r['name'] == 'initialize_map_state')
+
+    dm_socket.emit('add_line', {'map_id': map_id, 'line': {'id': 'l1', 'start': {'x': 0, 'y': 0}, 'end': {'x': 50, 'y': 0}}})
+    last_seen = player_socket.get_received()[-1]['args'][0]['seq']
+    player_socket.disconnect()
+
+    # Missed while offline
+    dm_socket.emit('add_line', {'map_id': map_id, 'line': {'id': 'l2', 'start': {'x': 0, 'y': 0}, 'end': {'x': 0, 'y': 50}}})
+    dm_socket.emit('remove_line', {'map_id': map_id, 'line_id': '0f9a1c7e-2b3d-4e5f-8a9b-0c1d2e3f4a5b'})
+
+    player_socket = sio.test_client(flask_app, flask_test_client=player_client)
+    player_socket.emit('join_map_room', {'map_id': map_id, 'last_seq': last_seen, 'epoch': state['epoch']})
+    received = player_socket.get_received()
+
+    assert 'initialize_map_state' not in [r['name'] for r in received]
+    replay = next(r['args'][0] for r in received if r['name'] == 'map_ops_replay')
+    assert [op['event'] for op in replay['ops']] == ['line_added', 'line_removed']
+    assert [op['seq'] for op in replay['ops']] == [last_seen + 1, last_seen + 2]
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
@@ -0,0 +1,51 @@
+# tests/test_membership.py
+
+from app import db
+from app.membership import forget, membership
+from app.models import campaign_invites
+from conftest import make_user, login, make_open_map, add_player, count_queries
+
+def test_membership_flags_and_request_cache(app):
+    flask_app, _ = app
+    with flask_app.test_request_context():
+        dm, player, invited, stranger = make_user(), make_user(), make_user(), make_user()
+        campaign, _ = make_open_map(dm)
+        add_player(campaign, player)
+        db.session.execute(campaign_invites.insert().values(campaign_id=campaign.id, user_id=invited.id))
+        db.session.commit()
+
+        assert membership(campaign.id, dm.id).is_dm
+        assert membership(campaign.id, player.id).is_member
+        assert not membership(campaign.id, player.id).is_player
+        assert membership(campaign.id, invited.id).is_invited
+        standing = membership(campaign.id, stranger.id)
+        assert not (standing.is_dm or standing.is_member or standing.is_invited)
+        assert membership(dm.id, dm.id) is None
+
+        # Asked again within the request, answered from the cache
+        with count_queries() as statements:
+            assert membership(campaign.id, player.id).is_member
+        assert statements == []
+
+        forget(campaign.id, player.id)
+        with count_queries() as statements:
+            membership(campaign.id, player.id)
+        assert len(statements) == 1
+
+def test_leave_campaign_and_map_access(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm, player, stranger = make_user(), make_user(), make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        player_id, stranger_id, campaign_id, map_id = player.id, stranger.id, str(campaign.id), str(map.id)
+
+    # Only campaign members get into an open map
+    stranger_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, stranger_id))
+    stranger_socket.emit('join_map_room', {'map_id': map_id})
+    assert [event['name'] for event in stranger_socket.get_received()] == ['error']
+    stranger_socket.disconnect()
+
+    client = login(flask_app, player_id)
+    assert client.delete(f'/campaign/leave_campaign/{campaign_id}').status_code == 200
+    assert client.delete(f'/campaign/leave_campaign/{campaign_id}').status_code == 403
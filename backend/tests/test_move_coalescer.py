@@ -0,0 +1,59 @@
+# tests/test_move_coalescer.py
+
+from app.move_coalescer import move_coalescer
+from conftest import make_user, login, make_open_map, add_player
+
+def test_moves_are_coalesced_per_tick(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    player_socket.emit('join_map_room', {'map_id': map_id})
+
+    first, second = 'a0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b61', 'b0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b62'
+    for marker_id in (first, second):
+        dm_socket.emit('add_marker', {'map_id': map_id, 'marker': {'id': marker_id, 'pos': {'x': 0, 'y': 0}}})
+    player_socket.get_received()
+
+    before = move_coalescer.stats()
+    for x in range(50, 550, 50):
+        dm_socket.emit('move_marker', {'map_id': map_id, 'marker_id': first, 'new_position': {'x': x, 'y': 0}})
+    dm_socket.emit('move_marker', {'map_id': map_id, 'marker_id': second, 'new_position': {'x': 0, 'y': 50}})
+
+    # Nothing goes out until the tick fires
+    assert player_socket.get_received() == []
+    assert move_coalescer.flush(map.id) == 2
+
+    received = player_socket.get_received()
+    assert [r['name'] for r in received] == ['markers_moved']
+    assert received[0]['args'][0]['moves'] == [
+        {'marker_id': first, 'new_position': {'x': 500, 'y': 0}},
+        {'marker_id': second, 'new_position': {'x': 0, 'y': 50}},
+    ]
+    # The sender doesn't get its own moves echoed back
+    assert not any(r['name'] == 'markers_moved' for r in dm_socket.get_received())
+
+    after = move_coalescer.stats()
+    assert after['received'] - before['received'] == 11
+    assert after['coalesced'] - before['coalesced'] == 9
+    assert after['frames'] - before['frames'] == 1
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
+
+def test_metrics_endpoint(app):
+    flask_app, _ = app
+    flask_app.config['METRICS_TOKEN'] = 'metrics-secret'
+    try:
+        resp = flask_app.test_client().get('/test/metrics', headers={'Authorization': 'Bearer metrics-secret'})
+    finally:
+        flask_app.config['METRICS_TOKEN'] = None
+    assert resp.status_code == 200
+    assert 'coalesced' in resp.get_json()['move_coalescer']
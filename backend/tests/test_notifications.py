@@ -0,0 +1,47 @@
+# tests/test_notifications.py
+
+from app import db
+from app.models import Character, ClassType, Race
+from conftest import make_user, login, make_open_map
+
+def received(socket, name):
+    return [event['args'][0] for event in socket.get_received() if event['name'] == name]
+
+def test_invites_members_and_maps_are_pushed(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm, player = make_user(), make_user()
+        campaign, map = make_open_map(dm)
+        character = Character("Hero", "male", Race.query.first().id, ClassType.query.first().id, 2, player.id, 30, 'medium', '#ff9800')
+        db.session.add(character)
+        db.session.commit()
+        dm_id, player_id, player_name = dm.id, player.id, player.username
+        campaign_id, map_id, character_id = str(campaign.id), str(map.id), str(character.id)
+
+    dm_http, player_http = login(flask_app, dm_id), login(flask_app, player_id)
+    dm_socket = sio.test_client(flask_app, flask_test_client=dm_http)
+    player_socket = sio.test_client(flask_app, flask_test_client=player_http)
+
+    dm_http.post('/campaign/invite', json={'campaign_id': campaign_id, 'username': player_name})
+    [invite] = received(player_socket, 'invite_received')
+    assert (invite['id'], invite['meeting_time']) == (campaign_id, '18:00')
+
+    player_http.post('/campaign/accept_invite', json={'campaign_id': campaign_id, 'character_id': character_id})
+    [joined] = received(dm_socket, 'campaign_member_joined')
+    assert joined['username'] == player_name
+    assert joined['character']['id'] == character_id and joined['character']['level'] == 2
+    # Only the other members hear about it
+    assert received(player_socket, 'campaign_member_joined') == []
+
+    # Having joined, the player's socket is in the campaign room
+    dm_http.post(f'/map/set_visibility/{map_id}', json={'map_visibility': True})
+    [visibility] = received(player_socket, 'map_visibility_changed')
+    assert visibility == {'id': map_id, 'name': f'Map {campaign_id}', 'owner_id': str(dm_id), 'campaign_id': campaign_id, 'is_open': True}
+
+    dm_socket.emit('create_map', {'campaign_id': campaign_id, 'name': 'Dungeon'})
+    [added] = received(player_socket, 'map_added')
+    assert (added['name'], added['campaign_id']) == ('Dungeon', campaign_id)
+    assert received(dm_socket, 'map_added') == []
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
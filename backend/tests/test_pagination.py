@@ -0,0 +1,97 @@
+# tests/test_pagination.py
+
+from sqlalchemy import text
+from app import db
+from app.models import Character, ClassType, Race, User
+from conftest import make_user, login, make_open_map
+
+def make_characters(user, levels):
+    race, class_type = Race.query.first(), ClassType.query.first()
+    for i, level in enumerate(levels):
+        db.session.add(Character(f"Hero {i:02}", "female", race.id, class_type.id, level, user.id, 30, 'medium', '#ff9800'))
+    db.session.commit()
+
+def walk(client, url, name, **args):
+    """Follow next_cursor through every page, returning the pages."""
+    pages, cursor = [], None
+    while True:
+        query = dict(args, **({'cursor': cursor} if cursor else {}))
+        body = client.get(url, query_string=query).get_json()
+        pages.append(body[name])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+def test_characters_page_through_in_sort_order(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user = make_user()
+        make_characters(user, [3, 1, 3, 2, 3, 1, 5])
+        user_id = user.id
+    client = login(flask_app, user_id)
+
+    everything = client.get('/character/get_characters').get_json()
+    assert 'next_cursor' not in everything
+    assert [c['name'] for c in everything['characters']] == [f"Hero {i:02}" for i in range(7)]
+
+    pages = walk(client, '/character/get_characters', 'characters', limit=3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [c['name'] for page in pages for c in page] == [f"Hero {i:02}" for i in range(7)]
+
+    # Ties on level are broken by id, so nothing is skipped or repeated across pages
+    pages = walk(client, '/character/get_characters', 'characters', limit=2, sort='level', order='desc')
+    levels = [c['level'] for page in pages for c in page]
+    assert levels == [5, 3, 3, 3, 2, 1, 1]
+    assert len({c['id'] for page in pages for c in page}) == 7
+
+def test_bad_page_args_are_rejected(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+    client = login(flask_app, user_id)
+
+    assert client.get('/character/get_characters?sort=speed').status_code == 400
+    assert client.get('/character/get_characters?limit=0').status_code == 400
+    assert client.get('/campaign/get_campaigns?cursor=nonsense').status_code == 400
+
+    first = client.get('/character/get_characters?limit=1').get_json()
+    assert first['next_cursor'] is None
+    # A cursor only continues the sort it came from
+    with flask_app.app_context():
+        make_characters(db.session.get(User, user_id), [1, 2])
+    cursor = client.get('/character/get_characters?limit=1').get_json()['next_cursor']
+    assert client.get(f'/character/get_characters?limit=1&sort=level&cursor={cursor}').status_code == 400
+
+def test_campaign_report_pages(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm = make_user()
+        campaigns = [make_open_map(dm)[0] for _ in range(5)]
+        for i, campaign in enumerate(campaigns):
+            campaign.name = f"Report campaign {i}"
+        db.session.commit()
+
+    client = flask_app.test_client()
+    filters = {'campaignName': 'Report campaign'}
+    pages, cursor = [], None
+    while True:
+        body = client.post('/report/generate_campaign', json=dict(filters, limit=2, order='desc', cursor=cursor)).get_json()
+        pages.append([c['name'] for c in body['campaigns']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert pages == [["Report campaign 4", "Report campaign 3"], ["Report campaign 2", "Report campaign 1"], ["Report campaign 0"]]
+
+    # Unpaged, the summary covers every match
+    body = client.post('/report/generate_campaign', json=dict(filters, sort='name')).get_json()
+    assert body['num_campaigns'] == 5
+    assert [c['name'] for c in body['campaigns']] == [f"Report campaign {i}" for i in range(5)]
+
+def test_character_page_uses_index(app_ctx):
+    plan = db.session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM character WHERE user_id = :user_id AND (name, id) > (:name, :id) "
+        "ORDER BY name, id LIMIT 20"
+    ), {'user_id': 'x', 'name': 'Hero', 'id': 'y'}).fetchall()
+    detail = ' '.join(row[-1] for row in plan)
+    assert 'ix_character_user_id_name_id' in detail
+    assert 'TEMP B-TREE' not in detail
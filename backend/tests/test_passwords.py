@@ -0,0 +1,66 @@
+# tests/test_passwords.py
+
+import time
+import bcrypt
+import eventlet
+from app import db
+from app.models import User
+from app.passwords import PasswordHasher, passwords
+from conftest import make_user
+
+def test_hashing_runs_off_the_hub():
+    hasher = PasswordHasher(rounds=11)
+    ticks = []
+    def tick():
+        while True:
+            ticks.append(1)
+            eventlet.sleep(0.01)
+
+    ticker = eventlet.spawn(tick)
+    try:
+        hashed = hasher.hash('hunter2')
+    finally:
+        ticker.kill()
+
+    assert hasher.check('hunter2', hashed)
+    # Other green threads kept running for the whole hash
+    assert len(ticks) > 3
+
+def test_concurrency_limit_and_queue_depth():
+    hasher = PasswordHasher(max_concurrency=1)
+    pool = eventlet.GreenPool()
+    for _ in range(3):
+        pool.spawn(hasher._run, time.sleep, 0.05)
+
+    eventlet.sleep(0.01)
+    assert hasher.running == 1
+    assert hasher.queue_depth == 2
+
+    pool.waitall()
+    assert hasher.stats()['queue_depth'] == 0
+    assert hasher.running == 0
+
+def test_login_rehashes_outdated_cost(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user = make_user()
+        user.password = bcrypt.hashpw(b'hunter2', bcrypt.gensalt(5)).decode('utf-8')
+        db.session.commit()
+        user_id, email = user.id, user.email
+
+    client = flask_app.test_client()
+    assert client.post('/user/login', json={'email': email, 'password': 'wrong'}).status_code == 401
+    with flask_app.app_context():
+        assert db.session.get(User, user_id).password.startswith('$2b$05$')
+
+    rehashed = passwords.rehashed
+    assert client.post('/user/login', json={'email': email, 'password': 'hunter2'}).status_code == 200
+    with flask_app.app_context():
+        stored = db.session.get(User, user_id).password
+    assert stored.startswith('$2b$04$')
+    assert passwords.check('hunter2', stored)
+    assert passwords.rehashed == rehashed + 1
+
+    # Already at the configured cost, nothing to do
+    assert client.post('/user/login', json={'email': email, 'password': 'hunter2'}).status_code == 200
+    assert passwords.rehashed == rehashed + 1
@@ -0,0 +1,65 @@
+# tests/test_reference_data.py
+
+from app import db
+from app.models import ClassType, Race
+from app.reference_data import reference
+from conftest import make_user, login, count_queries
+
+def test_races_and_classes_are_served_without_queries(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+        races = [race.name for race in Race.query.order_by(Race.name)]
+    client = login(flask_app, user_id)
+
+    with flask_app.app_context():
+        with count_queries() as statements:
+            response = client.get('/character/get_races')
+            classes = client.get('/character/get_classes')
+    # Only the session lookup reaches the database
+    assert not [statement for statement in statements if 'race' in statement or 'class_type' in statement]
+    assert [race['name'] for race in response.get_json()['races']] == races
+    assert len(classes.get_json()['classes']) == 12
+    assert 'max-age' in response.headers['Cache-Control']
+
+    etag = response.headers['ETag']
+    again = client.get('/character/get_races', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert client.get('/character/get_classes', headers={'If-None-Match': etag}).status_code == 200
+
+    assert flask_app.test_client().get('/character/get_races').status_code == 401
+
+def test_character_saves_validate_against_the_cache(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+        race_id, class_id = str(Race.query.first().id), str(ClassType.query.first().id)
+    client = login(flask_app, user_id)
+
+    character = {'name': 'Vex', 'gender': 'female', 'race': race_id, 'classType': class_id}
+    with flask_app.app_context():
+        with count_queries() as statements:
+            response = client.post('/character/create_character', json=character)
+    assert response.status_code == 201
+    assert not [statement for statement in statements if 'FROM race' in statement or 'FROM class_type' in statement]
+
+    assert client.post('/character/create_character', json=dict(character, race=class_id)).status_code == 404
+    assert client.post('/character/create_character', json=dict(character, classType='nonsense')).status_code == 404
+    assert client.post('/character/create_character', json=dict(character, classType=None)).status_code == 404
+
+def test_reload_picks_up_new_rows(app_ctx):
+    before = reference.races.etag
+    race = Race(name="Zz Test Race", description="Only here for this test.")
+    db.session.add(race)
+    db.session.commit()
+    try:
+        assert reference.races.name(race.id) is None
+        reference.reload()
+        assert reference.races.name(str(race.id)) == "Zz Test Race"
+        assert reference.races.etag != before
+    finally:
+        db.session.delete(race)
+        db.session.commit()
+        reference.reload()
+    assert reference.races.etag == before
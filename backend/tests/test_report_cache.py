@@ -0,0 +1,60 @@
+# tests/test_report_cache.py
+
+from app.blueprints.report_routes import normalized_filters
+from app.models import ClassType, Race
+from app.report_cache import ReportCache, report_results
+from conftest import make_user, login
+
+def test_equivalent_filters_share_a_key():
+    first = normalized_filters({
+        'meetingDay': ['Friday', 'Monday'], 'startDateStart': '2025-01-01T05:00:00Z',
+        'campaignName': '', 'sort': 'name', 'searchMode': 'strict',
+    })
+    second = normalized_filters({'meetingDay': ['Monday', 'Friday', 'Monday'], 'startDateStart': '2025-01-01T20:00:00Z'})
+    assert first == second
+    assert ReportCache.key('campaign', first) == ReportCache.key('campaign', second)
+    assert ReportCache.key('campaign', first) != ReportCache.key('character', first)
+    assert normalized_filters({'searchMode': 'lax', 'meetingDay': ['Monday']}) != second
+    # Unreadable dates skip the cache, the report answers as it would have
+    assert normalized_filters({'startDateStart': 'soon'}) is None
+
+def test_entries_leave_oldest_use_first_after_their_ttl_or_a_new_generation():
+    cache = ReportCache(max_entries=2, max_bytes=9, ttl=60)
+    cache.put('a', 0, b'aaaa', now=0)
+    cache.put('b', 0, b'bbbb', now=0)
+    assert cache.get('a', now=1) == b'aaaa'
+    cache.put('c', 0, b'cccc', now=1)
+    assert list(cache.entries) == ['a', 'c']
+    # Over max_bytes evicts too
+    cache.put('d', 0, b'dddddd', now=1)
+    assert list(cache.entries) == ['d'] and cache.size == 6
+    assert cache.get('d', now=61) is None and cache.size == 0
+
+    cache.put('a', 0, b'aaaa', now=0)
+    cache.next_generation(broadcast=False)
+    assert not cache.entries
+    # Built before the change committed
+    cache.put('a', 0, b'aaaa', now=0)
+    assert not cache.entries
+
+def test_a_character_change_starts_a_new_generation(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+        race_id, class_id = str(Race.query.first().id), str(ClassType.query.first().id)
+    client = login(flask_app, user_id)
+    report = {'characterName': 'Cached Wren', 'race': []}
+
+    assert client.post('/report/generate_character', json=report).get_json() == {"message": "no results"}
+    hits = report_results.hits
+    assert client.post('/report/generate_character', json={'characterName': 'Cached Wren'}).get_json() == {"message": "no results"}
+    assert report_results.hits == hits + 1
+
+    generation = report_results.generation
+    client.post('/character/create_character', json={
+        'name': 'Cached Wren', 'gender': 'female', 'race': race_id, 'classType': class_id, 'level': 2,
+    })
+    assert report_results.generation == generation + 1
+    body = client.post('/report/generate_character', json=report).get_json()
+    assert [character['name'] for character in body['characters']] == ['Cached Wren']
+    assert report_results.stats()['hit_ratio'] is not None
@@ -0,0 +1,102 @@
+# tests/test_report_jobs.py
+
+import time
+import pytest
+from app import socketio
+from app.cluster import cluster
+from app.report_jobs import report_jobs
+from conftest import make_user, login, seed_campaign
+
+@pytest.fixture
+def small_pages(app):
+    flask_app, _ = app
+    flask_app.config['REPORT_STREAM_BATCH_SIZE'] = 2
+    page_size, report_jobs.page_size = report_jobs.page_size, 2
+    yield flask_app
+    flask_app.config.pop('REPORT_STREAM_BATCH_SIZE')
+    report_jobs.page_size = page_size
+
+def finished(client, job_id):
+    for _ in range(200):
+        body = client.get(f'/report/get_job/{job_id}').get_json()
+        if body['job']['status'] not in ('queued', 'running'):
+            return body
+        socketio.sleep(0.01)
+    raise AssertionError("the report job never finished")
+
+def test_a_job_reports_progress_and_pages_its_result(small_pages, app):
+    _, sio = app
+    with small_pages.app_context():
+        user_id = make_user().id
+        seed_campaign("Job A", 3)
+        seed_campaign("Job B", 0)
+        seed_campaign("Job C", 2)
+    client = login(small_pages, user_id)
+    socket = sio.test_client(small_pages, flask_test_client=client)
+
+    report = {'campaignName': 'Job ', 'sort': 'name'}
+    expected = client.post('/report/generate_campaign', json=report).get_json()
+    response = client.post('/report/submit_job/campaign', json=report)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    body = finished(client, job_id)
+    assert body['job']['status'] == 'done'
+    assert (body['job']['rows'], body['job']['pages']) == (3, 2)
+    assert body['job']['summary'] == {key: value for key, value in expected.items() if key != 'campaigns'}
+    campaigns = body['campaigns'] + client.get(f'/report/get_job/{job_id}?page=1').get_json()['campaigns']
+    assert campaigns == expected['campaigns']
+    assert client.get(f'/report/get_job/{job_id}?page=2').get_json()['campaigns'] == []
+
+    events = [(event['name'], event['args'][0]) for event in socket.get_received()]
+    assert [name for name, _ in events][-1] == 'report_job_done'
+    assert all(payload['job_id'] == job_id for _, payload in events)
+    # One as it starts, then one after each batch of rows read
+    rows = [payload['rows'] for name, payload in events if name == 'report_job_progress']
+    assert len(rows) > 2 and rows == sorted(rows) and rows[-1] == 3
+    socket.disconnect()
+
+    # Only its owner can see a job
+    with small_pages.app_context():
+        other_id = make_user().id
+    assert login(small_pages, other_id).get(f'/report/get_job/{job_id}').status_code == 404
+
+def test_jobs_past_the_queue_limit_are_turned_away(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        user_id = make_user().id
+    client = login(flask_app, user_id)
+
+    assert client.post('/report/submit_job/nothing', json={'sort': 'name'}).status_code == 404
+    assert client.post('/report/submit_job/character', json={'limit': 10}).status_code == 400
+
+    max_queued, report_jobs.max_queued = report_jobs.max_queued, 0
+    try:
+        response = client.post('/report/submit_job/character', json={'characterName': 'Nobody at all'})
+    finally:
+        report_jobs.max_queued = max_queued
+    assert response.status_code == 503
+    assert report_jobs.stats()['rejected'] >= 1
+
+def test_expired_results_leave_the_local_store(small_pages, monkeypatch):
+    with small_pages.app_context():
+        user_id = make_user().id
+        for name in ("Expiring A", "Expiring B", "Expiring C"):
+            seed_campaign(name, 1)
+    client = login(small_pages, user_id)
+    ttl, report_jobs.ttl = report_jobs.ttl, 5
+    try:
+        job_id = client.post('/report/submit_job/campaign', json={'campaignName': 'Expiring '}).get_json()['job_id']
+        assert finished(client, job_id)['job']['pages'] == 2
+    finally:
+        report_jobs.ttl = ttl
+
+    server = cluster.client.server
+    keys = [cluster.key('report_job', job_id), cluster.key('report_job', job_id, 'page', 0), cluster.key('report_job', job_id, 'page', 1)]
+    assert all(key in server.values for key in keys)
+
+    # Nobody reads them again, the next write sweeps them out
+    later = time.monotonic() + 60
+    monkeypatch.setattr(time, 'monotonic', lambda: later)
+    cluster.client.set(cluster.key('unrelated'), 'x')
+    assert not any(key in server.values or key in server.expires for key in keys)
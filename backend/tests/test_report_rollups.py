@@ -0,0 +1,111 @@
+# tests/test_report_rollups.py
+
+import json
+import pytest
+from sqlalchemy import delete, select
+from app import db
+from app.models import ClassType, Race, ReportRollup
+from app.report_rollups import rollups
+from conftest import make_user, login, count_queries
+
+@pytest.fixture
+def rolled_up(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        rollups.refresh()
+        db.session.commit()
+    yield flask_app
+    # Other tests write rows directly, leave the reports working them out
+    with flask_app.app_context():
+        db.session.execute(delete(ReportRollup).where(ReportRollup.dimension == 'ready'))
+        db.session.commit()
+
+def snapshot():
+    # Totals that fell to zero are kept, refresh() doesn't write them
+    return db.session.execute(
+        select(ReportRollup.scope, ReportRollup.dimension, ReportRollup.key, ReportRollup.value)
+        .where(ReportRollup.value != 0)
+        .order_by(ReportRollup.scope, ReportRollup.dimension, ReportRollup.key)
+    ).all()
+
+def assert_matches_refresh():
+    kept = snapshot()
+    rollups.refresh()
+    db.session.commit()
+    assert kept == snapshot()
+
+def campaign_form(name, **fields):
+    return dict({'name': name, 'description': '', 'startDate': '2025-01-01', 'endDate': '2025-02-01',
+                 'meetingTime': '18:00', 'meetingDay': 'Friday', 'meetingFrequency': 'Weekly'}, **fields)
+
+def test_write_paths_keep_the_rollups_in_step(rolled_up):
+    with rolled_up.app_context():
+        dm, player = make_user(), make_user()
+        dm_id, player_id, player_name = dm.id, player.id, player.username
+        races, classes = Race.query.order_by(Race.name).all(), ClassType.query.order_by(ClassType.name).all()
+        race_ids, class_ids = [str(race.id) for race in races], [str(class_type.id) for class_type in classes]
+    dm_client, player_client = login(rolled_up, dm_id), login(rolled_up, player_id)
+
+    response = dm_client.post('/campaign/create_campaign', json=campaign_form("Rollup Keep"))
+    campaign_id = response.get_json()['campaign']['id']
+    character = {'name': 'Rollup Hero', 'gender': 'female', 'race': race_ids[0], 'classType': class_ids[0], 'level': 3}
+    character_id = player_client.post('/character/create_character', json=character).get_json()['character']['id']
+    spare_id = player_client.post('/character/create_character', json=dict(character, name='Rollup Spare')).get_json()['character']['id']
+    player_client.put(f'/character/edit_character/{character_id}',
+                      json=dict(character, race=race_ids[1], classType=class_ids[1], level=7))
+
+    dm_client.post('/campaign/invite', json={'campaign_id': campaign_id, 'username': player_name})
+    assert player_client.post('/campaign/accept_invite', json={'campaign_id': campaign_id, 'character_id': character_id}).status_code == 200
+    with rolled_up.app_context():
+        assert_matches_refresh()
+
+    # Moving the campaign to another day moves its party with it
+    form = campaign_form("Rollup Keep", meetingDay='Monday', endDate='2025-03-01')
+    assert dm_client.put(f'/campaign/edit_campaign/{campaign_id}', json=form).status_code == 200
+    upload = '\n'.join(json.dumps(row) for row in [
+        {'name': 'Rollup Import', 'gender': 'male', 'race_id': race_ids[2], 'classType': 'Wizard', 'level': 5},
+    ]) + '\n'
+    assert player_client.post('/character/import', data=upload, content_type='application/x-ndjson').status_code == 201
+    upload = json.dumps({'name': 'Rollup Import', 'start_date': '2025-03-01', 'end_date': '2025-03-15',
+                         'meeting_time': '19:00', 'meeting_day': 'Sunday', 'meeting_frequency': 'Monthly'}) + '\n'
+    assert dm_client.post('/campaign/import', data=upload, content_type='application/x-ndjson').status_code == 201
+    with rolled_up.app_context():
+        assert_matches_refresh()
+
+    # Deleting a character in a campaign takes it out of the party too
+    player_client.delete(f'/character/delete_character/{character_id}')
+    player_client.delete(f'/character/delete_character/{spare_id}')
+    dm_client.delete(f'/campaign/delete_campaign/{campaign_id}')
+    with rolled_up.app_context():
+        assert_matches_refresh()
+
+def test_summaries_match_working_them_out(rolled_up):
+    with rolled_up.app_context():
+        user_id = make_user().id
+        race = Race.query.order_by(Race.name).first().name
+    client = login(rolled_up, user_id)
+    client.post('/character/import', data=''.join(json.dumps(row) + '\n' for row in [
+        {'name': 'Rollup Sum A', 'gender': 'female', 'race': race, 'classType': 'Bard', 'level': 2},
+        {'name': 'Rollup Sum B', 'gender': 'male', 'race': race, 'classType': 'Rogue', 'level': 9},
+    ]), content_type='application/x-ndjson')
+    client.post('/campaign/create_campaign', json=campaign_form("Rollup Sum", meetingDay='Tuesday'))
+
+    # levelMin and startDateStart match everything but aren't kept in the rollups
+    for report, rolled, worked_out in [
+        ('character', {}, {'levelMin': 1}),
+        ('character', {'race': [race]}, {'race': [race], 'levelMin': 1}),
+        ('campaign', {}, {'startDateStart': '1900-01-01T00:00:00Z'}),
+        ('campaign', {'meetingDay': ['Tuesday', 'Friday']}, {'meetingDay': ['Tuesday', 'Friday'], 'startDateStart': '1900-01-01T00:00:00Z'}),
+    ]:
+        reads = rollups.reads
+        summary = client.post(f'/report/generate_{report}', json=dict(rolled, summaryOnly=True)).get_json()
+        assert rollups.reads == reads + 1
+        expected = client.post(f'/report/generate_{report}', json=dict(worked_out, summaryOnly=True)).get_json()
+        assert summary == expected
+
+    # Unfiltered, the summary reads the rollups and nothing else
+    with rolled_up.app_context(), count_queries() as statements:
+        client.post('/report/generate_character', json={'summaryOnly': True})
+    assert not [statement for statement in statements if 'character' in statement and 'report_rollup' not in statement]
+
+    assert client.post('/report/generate_character', json={'summaryOnly': True, 'limit': 10}).status_code == 400
@@ -0,0 +1,49 @@
+# tests/test_report_streaming.py
+
+import json
+import pytest
+from conftest import seed_campaign
+
+@pytest.fixture
+def small_batches(app):
+    flask_app, _ = app
+    flask_app.config['REPORT_STREAM_BATCH_SIZE'] = 2
+    yield flask_app
+    flask_app.config.pop('REPORT_STREAM_BATCH_SIZE')
+
+def read_lines(response):
+    assert response.is_streamed and response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_streamed_reports_match_the_json_ones(small_batches):
+    with small_batches.app_context():
+        seed_campaign("Stream A", 3)
+        seed_campaign("Stream B", 0)
+        seed_campaign("Stream C", 2)
+    client = small_batches.test_client()
+
+    # Campaign A's rows span two batches, it still comes out whole
+    report = {'campaignName': 'Stream ', 'sort': 'name', 'order': 'desc'}
+    expected = client.post('/report/generate_campaign', json=report).get_json()
+    *campaigns, summary = read_lines(client.post('/report/generate_campaign?format=ndjson', json=report, buffered=False))
+    assert campaigns == expected.pop('campaigns')
+    assert [campaign['name'] for campaign in campaigns] == ["Stream C", "Stream B", "Stream A"]
+    assert summary == {'summary': expected}
+
+    report = {'characterName': 'Stream ', 'sort': 'level'}
+    expected = client.post('/report/generate_character', json=report).get_json()
+    *characters, summary = read_lines(client.post('/report/generate_character?format=ndjson', json=report, buffered=False))
+    assert characters == expected.pop('characters')
+    assert len(characters) == 5
+    assert summary == {'summary': expected}
+
+def test_streamed_reports_without_rows_or_with_paging(app):
+    flask_app, _ = app
+    client = flask_app.test_client()
+    lines = read_lines(client.post('/report/generate_character?format=ndjson', json={'characterName': 'Nobody at all'}))
+    assert lines == [{'summary': {
+        'num_characters': 0, 'avg_level': -1, 'gender_counts': {}, 'race_counts': {}, 'class_counts': {},
+    }}]
+
+    assert client.post('/report/generate_campaign?format=ndjson', json={'limit': 10}).status_code == 400
+    assert client.post('/report/generate_campaign?format=xml', json={'limit': 10}).status_code == 400
@@ -0,0 +1,59 @@
+# tests/test_response_cache.py
+
+from app import db
+from app.models import Character, ClassType, Race
+from app.response_cache import ResponseCache, responses
+from conftest import make_user, login, make_open_map
+
+def test_lru_cap_ttl_and_counters():
+    cache = ResponseCache(max_entries=2, ttl=10)
+    cache.put('campaigns', 'a', 'A', now=0)
+    cache.put('campaigns', 'b', 'B', now=0)
+    assert cache.get('campaigns', 'a', now=1) == 'A'
+
+    # 'b' is now the least recently used
+    cache.put('campaigns', 'c', 'C', now=1)
+    assert cache.get('campaigns', 'b', now=1) is None
+    assert cache.get('campaigns', 'c', now=1) == 'C'
+    assert cache.get('campaigns', 'c', now=11) is None
+
+    cache.invalidate(['a'], broadcast=False)
+    assert cache.get('campaigns', 'a', now=1) is None
+    assert cache.stats() == {
+        'entries': 1, 'hits': 2, 'misses': 3, 'hit_ratio': 0.4, 'evictions': 1, 'invalidations': 1,
+    }
+
+def test_write_paths_invalidate_affected_users(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, player = make_user(), make_user()
+        campaign, _ = make_open_map(dm)
+        character = Character("Hero", "male", Race.query.first().id, ClassType.query.first().id, 1, player.id, 30, 'medium', '#ff9800')
+        db.session.add(character)
+        db.session.commit()
+        dm_id, player_id, player_name = dm.id, player.id, player.username
+        campaign_id, character_id = str(campaign.id), str(character.id)
+
+    dm_client, player_client = login(flask_app, dm_id), login(flask_app, player_id)
+    def dashboard(client):
+        return [c['char_count'] for c in client.get('/campaign/get_campaigns').get_json()['campaigns']]
+    def invites(client):
+        return [c['id'] for c in client.get('/campaign/get_invites').get_json()['invites']]
+
+    assert dashboard(dm_client) == [0]
+    assert invites(player_client) == []
+    hits = responses.hits
+    assert dashboard(dm_client) == [0]
+    assert responses.hits == hits + 1
+
+    response = dm_client.post('/campaign/invite', json={'campaign_id': campaign_id, 'username': player_name})
+    assert response.status_code == 200
+    assert invites(player_client) == [campaign_id]
+    # The DM's dashboard doesn't show invites, so it stays cached
+    assert ('campaigns', dm_id) in responses.entries
+
+    response = player_client.post('/campaign/accept_invite', json={'campaign_id': campaign_id, 'character_id': character_id})
+    assert response.status_code == 200
+    assert invites(player_client) == []
+    assert dashboard(player_client) == [1]
+    assert dashboard(dm_client) == [1]
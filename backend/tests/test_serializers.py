@@ -0,0 +1,56 @@
+# tests/test_serializers.py
+
+from app import db
+from app.models import Character, ClassType, Race, campaign_users
+from conftest import make_user, login, make_open_map, count_queries
+
+def test_list_endpoints_keep_their_shape(app):
+    flask_app, _ = app
+    with flask_app.app_context():
+        dm, player = make_user(), make_user()
+        campaign, map = make_open_map(dm)
+        race, class_type = Race.query.first(), ClassType.query.first()
+        character = Character("Vesper Quill", "female", race.id, class_type.id, 3, player.id, 30, 'small', '#123456')
+        db.session.add(character)
+        db.session.flush()
+        db.session.execute(campaign_users.insert().values(campaign_id=campaign.id, user_id=player.id, character_id=character.id))
+        db.session.commit()
+        player_id, player_name = player.id, player.username
+        ids = {
+            'campaign': str(campaign.id), 'map': str(map.id), 'character': str(character.id),
+            'race': str(race.id), 'class': str(class_type.id), 'player': str(player.id),
+        }
+        names = {'race': race.name, 'class': class_type.name, 'campaign': campaign.name, 'dm': dm.username}
+    client = login(flask_app, player_id)
+
+    sheet = {
+        'id': ids['character'], 'name': 'Vesper Quill', 'gender': 'female', 'race_id': ids['race'], 'race': names['race'],
+        'class_id': ids['class'], 'classType': names['class'], 'level': 3, 'user_id': ids['player'],
+        'speed': 30, 'size': 'small', 'marker_color': '#123456',
+    }
+    assert client.get('/character/get_characters').get_json() == {'characters': [sheet]}
+    assert client.get(f"/character/get_character/{ids['character']}").get_json() == {'character': sheet}
+
+    with flask_app.app_context():
+        with count_queries() as statements:
+            campaign_body = client.get(f"/campaign/get_campaign/{ids['campaign']}").get_json()['campaign']
+    # Race and class names come joined into the one character query, nothing is lazy-loaded per row
+    assert sum('FROM campaign_users JOIN character' in statement for statement in statements) == 1
+    assert not [statement for statement in statements if statement.startswith(('SELECT race.id AS', 'SELECT class_type.id AS'))]
+    assert campaign_body['name'] == names['campaign']
+    assert campaign_body['dm'] == names['dm']
+    assert campaign_body['meeting_time'] == '18:00'
+    assert campaign_body['characters'] == [{
+        key: sheet[key] for key in ('id', 'name', 'gender', 'race_id', 'race', 'class_id', 'classType', 'level', 'marker_color', 'size')
+    }]
+
+    assert client.get('/map/get_player_maps').get_json() == {
+        'maps': [{'id': ids['map'], 'name': f"Map {ids['campaign']}", 'campaign_id': ids['campaign']}]
+    }
+
+    report = client.post('/report/generate_character', json={'characterName': 'Vesper Quill'}).get_json()
+    assert report['characters'] == [{
+        'id': report['characters'][0]['id'], 'name': 'Vesper Quill', 'gender': 'female', 'level': 3,
+        'race': names['race'], 'classType': names['class'], 'username': player_name,
+    }]
+    assert report['race_counts'] == {names['race']: 1}
@@ -0,0 +1,89 @@
+# tests/test_socket_context.py
+
+from sqlalchemy import event
+from app import db
+from app.socket_context import ConnectionRegistry
+from conftest import make_user, login, make_open_map, add_player
+
+class FakeUser:
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+class FakeMap:
+    def __init__(self, id, owner_id):
+        self.id = id
+        self.name = f"Map {id}"
+        self.campaign_id = "campaign"
+        self.owner_id = owner_id
+
+def test_invalidate_map_players_only():
+    registry = ConnectionRegistry()
+    registry.connect("dm_sid", FakeUser("dm", "dm"))
+    registry.connect("player_sid", FakeUser("player", "player"))
+    map = FakeMap("map", owner_id="dm")
+    registry.join("dm_sid", map, is_dm=True)
+    registry.join("player_sid", map, is_dm=False)
+
+    assert registry.invalidate_map("map", players_only=True) == ["player_sid"]
+    assert registry.room("dm_sid", "map").is_dm
+    assert registry.room("player_sid", "map") is None
+
+    assert registry.invalidate_map("map") == ["dm_sid"]
+    assert registry.sids_in_map("map") == []
+
+def test_hot_events_skip_the_database(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        _, map = make_open_map(dm)
+        dm_id, map_id = dm.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    marker_id = '7d1d6a0e-0a43-4c6b-9d0f-2f0b4b4d9a11'
+    dm_socket.emit('add_marker', {'map_id': map_id, 'marker': {'id': marker_id, 'pos': {'x': 0, 'y': 0}}})
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+
+    with flask_app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        for x in range(0, 500, 50):
+            dm_socket.emit('move_marker', {'map_id': map_id, 'marker_id': marker_id, 'new_position': {'x': x, 'y': 0}})
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    # The only remaining per-event read is Flask-Session loading the cookie session
+    assert all('FROM sessions' in s for s in statements)
+    dm_socket.disconnect()
+
+def test_closing_map_invalidates_players(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_client = login(flask_app, dm_id)
+    dm_socket = sio.test_client(flask_app, flask_test_client=dm_client)
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    player_socket.emit('join_map_room', {'map_id': map_id})
+    player_socket.get_received()
+
+    resp = dm_client.post(f'/map/set_visibility/{map_id}', json={'map_visibility': False})
+    assert resp.status_code == 200
+
+    player_socket.emit('add_marker', {'map_id': map_id, 'marker': {'id': 'm1', 'pos': {'x': 0, 'y': 0}}})
+    names = [r['name'] for r in player_socket.get_received()]
+    assert 'map_force_closed' in names
+    assert names[-1] == 'error'
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
@@ -0,0 +1,62 @@
+# tests/test_spatial_index.py
+
+from app.spatial_index import GridIndex, marker_bbox, line_bbox
+from conftest import make_user, login, make_open_map, add_player
+
+def test_grid_index_rect_and_radius_queries():
+    index = GridIndex(cell_size=100)
+    index.insert('near', (10, 10, 60, 60))
+    index.insert('far', (5000, 5000, 5050, 5050))
+    index.insert('wall', line_bbox({'start': {'x': -20000, 'y': 0}, 'end': {'x': 20000, 'y': 0}}))
+
+    assert index.query_rect((0, 0, 200, 200)) == {'near', 'wall'}
+    assert index.query_rect((4900, 4900, 5100, 5100)) == {'far'}
+    assert index.query_radius(100, 100, 30) == set()
+    assert index.query_radius(100, 100, 60) == {'near'}
+
+    index.insert('near', (4950, 4950, 5000, 5000))
+    assert index.query_rect((0, 0, 200, 200)) == {'wall'}
+    index.remove('wall')
+    assert index.query_rect((-100, -100, 100, 100)) == set()
+    assert len(index) == 2
+
+def test_marker_bbox_uses_marker_size():
+    assert marker_bbox({'pos': {'x': 100, 'y': 50}, 'size': 'medium'}) == (100, 50, 150, 100)
+    assert marker_bbox({'pos': {'x': 100, 'y': 50}, 'size': 'huge'}) == (100, 50, 250, 200)
+
+def test_broadcasts_respect_viewports(app):
+    flask_app, sio = app
+    with flask_app.app_context():
+        dm = make_user()
+        player = make_user()
+        campaign, map = make_open_map(dm)
+        add_player(campaign, player)
+        dm_id, player_id, map_id = dm.id, player.id, str(map.id)
+
+    dm_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, dm_id))
+    player_socket = sio.test_client(flask_app, flask_test_client=login(flask_app, player_id))
+    dm_socket.emit('join_map_room', {'map_id': map_id})
+    player_socket.emit('join_map_room', {'map_id': map_id})
+
+    far = {'id': 'd0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b64', 'pos': {'x': 10000, 'y': 10000}, 'size': 'medium'}
+    dm_socket.emit('add_marker', {'map_id': map_id, 'marker': far})
+    player_socket.get_received()
+
+    player_socket.emit('set_viewport', {'map_id': map_id, 'viewport': {'x': 0, 'y': 0, 'width': 1000, 'height': 800}})
+    state = player_socket.get_received()[-1]
+    assert state['name'] == 'viewport_state'
+    assert state['args'][0]['markers'] == []
+
+    near = {'id': 'e0f1a6a4-3c55-4d8e-9a4c-1d2e3f4a5b65', 'pos': {'x': 100, 'y': 100}, 'size': 'medium'}
+    dm_socket.emit('add_marker', {'map_id': map_id, 'marker': near})
+    dm_socket.emit('add_line', {'map_id': map_id, 'line': {'id': 'l1', 'start': {'x': 9000, 'y': 9000}, 'end': {'x': 9500, 'y': 9000}}})
+    assert [r['args'][0].get('marker', {}).get('id') for r in player_socket.get_received()] == [near['id']]
+
+    # Panning over to the far corner sends only what just came into view
+    player_socket.emit('set_viewport', {'map_id': map_id, 'viewport': {'x': 9000, 'y': 9000, 'width': 1000, 'height': 800}})
+    state = player_socket.get_received()[-1]['args'][0]
+    assert [m['id'] for m in state['markers']] == [far['id']]
+    assert [l['id'] for l in state['lines']] == ['l1']
+
+    dm_socket.disconnect()
+    player_socket.disconnect()
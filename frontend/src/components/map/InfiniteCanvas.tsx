@@ -129,6 +129,9 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
   const highlightedVertex = useRef<Point | null>(null);
   const lastMousePos = useRef<Point | null>(null);
   const lines = useRef<Line[]>([]);
+  // Last op sequence applied from the server, used to resume after a reconnect
+  const lastSeq = useRef<number | null>(null);
+  const mapEpoch = useRef<string | null>(null);
   const lineDrawingStart = useRef<Point | null>(null);
   const history = useRef<HistoryEntry[]>([]);
   const MAX_HISTORY_LENGTH = 100;
@@ -147,6 +150,31 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
 
   const selectedObject = useRef<Selection | null>(null);
 
+  // Tell the server which part of the map we can see so it only sends us nearby changes
+  const mapIdRef = useRef(mapId);
+  mapIdRef.current = mapId;
+  const lastViewport = useRef<string | null>(null);
+  const viewportTimer = useRef<number | null>(null);
+  const reportViewport = () => {
+    if (viewportTimer.current !== null) return;
+    viewportTimer.current = window.setTimeout(() => {
+      viewportTimer.current = null;
+      const canvas = canvasRef.current;
+      if (!canvas || !mapIdRef.current) return;
+      const { scale, offsetX, offsetY } = state.current;
+      const viewport = {
+        x: Math.round(-offsetX / scale),
+        y: Math.round(-offsetY / scale),
+        width: Math.round(canvas.width / scale),
+        height: Math.round(canvas.height / scale),
+      };
+      const key = JSON.stringify(viewport);
+      if (key === lastViewport.current) return;
+      lastViewport.current = key;
+      socket.emit("set_viewport", { map_id: mapIdRef.current, viewport });
+    }, 200);
+  };
+
   const draw = () => {
     const canvas = canvasRef.current;
     if (!canvas) return;
@@ -155,6 +183,7 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
 
     const { scale, offsetX, offsetY } = state.current;
     const { width, height } = ctx.canvas;
+    reportViewport();
     ctx.save();
     ctx.clearRect(0, 0, width, height);
     ctx.translate(offsetX, offsetY);
@@ -1261,15 +1290,20 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
       }
     };
 
-    const handleMarkerMoved = (data: {
-      marker_id: string;
-      new_position: Point;
+    const handleMarkersMoved = (data: {
+      moves: { marker_id: string; new_position: Point }[];
     }) => {
-      const marker = markers.current.find((m) => m.id === data.marker_id);
-      if (marker) {
-        marker.pos = data.new_position;
-        draw();
-      }
+      let changed = false;
+      data.moves.forEach((move) => {
+        // Skip the marker we are dragging ourselves, our local position is newer
+        if (draggingMarker.current?.id === move.marker_id) return;
+        const marker = markers.current.find((m) => m.id === move.marker_id);
+        if (marker) {
+          marker.pos = move.new_position;
+          changed = true;
+        }
+      });
+      if (changed) draw();
     };
 
     const handleLineAdded = (data: { line: Line }) => {
@@ -1290,31 +1324,101 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
     const handleMapDisconnected = () => {
       markers.current = [];
       lines.current = [];
+      lastSeq.current = null;
       draw();
     };
 
     const handleMapDeleted = () => {
       markers.current = [];
       lines.current = [];
+      lastSeq.current = null;
+      draw();
+    };
+
+    // Every map op carries a sequence number, skip anything we already applied
+    const sequenced =
+      <T extends { seq?: number }>(handler: (data: T) => void) =>
+      (data: T) => {
+        if (data.seq !== undefined) {
+          if (lastSeq.current !== null && data.seq <= lastSeq.current) return;
+          lastSeq.current = data.seq;
+        }
+        handler(data);
+      };
+
+    const opHandlers: Record<string, (data: any) => void> = {
+      marker_added: sequenced(handleMarkerAdded),
+      marker_removed: sequenced(handleMarkerRemoved),
+      markers_moved: sequenced(handleMarkersMoved),
+      line_added: sequenced(handleLineAdded),
+      line_removed: sequenced(handleLineRemoved),
+    };
+
+    const handleOpsReplay = (data: {
+      epoch: string;
+      ops: { seq: number; event: string; data: any }[];
+    }) => {
+      mapEpoch.current = data.epoch;
+      lastViewport.current = null;
+      data.ops.forEach((op) => opHandlers[op.event]?.(op.data));
+      draw();
+    };
+
+    // Objects that just scrolled into view, replacing whatever we had there
+    const handleViewportState = (data: {
+      viewport: number[];
+      previous: number[] | null;
+      markers: Marker[];
+      lines: Line[];
+    }) => {
+      const inRect = (p: Point, r: number[] | null) =>
+        r !== null && p.x >= r[0] && p.y >= r[1] && p.x <= r[2] && p.y <= r[3];
+      const newlyVisible = (p: Point) =>
+        inRect(p, data.viewport) && !inRect(p, data.previous);
+
+      const markerIds = new Set(data.markers.map((m) => m.id));
+      const lineIds = new Set(data.lines.map((l) => l.id));
+      markers.current = markers.current.filter(
+        (m) =>
+          !newlyVisible(m.pos) ||
+          markerIds.has(m.id) ||
+          draggingMarker.current?.id === m.id
+      );
+      lines.current = lines.current.filter(
+        (l) =>
+          !(newlyVisible(l.start) && newlyVisible(l.end)) || lineIds.has(l.id)
+      );
+
+      data.markers.forEach((marker) => {
+        const index = markers.current.findIndex((m) => m.id === marker.id);
+        if (index === -1) markers.current.push(marker);
+        else if (draggingMarker.current?.id !== marker.id)
+          markers.current[index] = marker;
+      });
+      data.lines.forEach((line) => {
+        const index = lines.current.findIndex((l) => l.id === line.id);
+        if (index === -1) lines.current.push(line);
+        else lines.current[index] = line;
+      });
       draw();
     };
 
     socket.on("map_deleted", handleMapDeleted);
     socket.on("map_disconnected", handleMapDisconnected);
-    socket.on("marker_added", handleMarkerAdded);
-    socket.on("marker_removed", handleMarkerRemoved);
-    socket.on("marker_moved", handleMarkerMoved);
-    socket.on("line_added", handleLineAdded);
-    socket.on("line_removed", handleLineRemoved);
+    socket.on("map_ops_replay", handleOpsReplay);
+    socket.on("viewport_state", handleViewportState);
+    Object.entries(opHandlers).forEach(([event, handler]) =>
+      socket.on(event, handler)
+    );
 
     return () => {
       socket.off("map_deleted", handleMapDeleted);
       socket.off("map_disconnected", handleMapDisconnected);
-      socket.off("marker_added", handleMarkerAdded);
-      socket.off("marker_removed", handleMarkerRemoved);
-      socket.off("marker_moved", handleMarkerMoved);
-      socket.off("line_added", handleLineAdded);
-      socket.off("line_removed", handleLineRemoved);
+      socket.off("map_ops_replay", handleOpsReplay);
+      socket.off("viewport_state", handleViewportState);
+      Object.entries(opHandlers).forEach(([event, handler]) =>
+        socket.off(event, handler)
+      );
     };
   }, [socket]);
 
@@ -1323,31 +1427,33 @@ const InfiniteCanvas = forwardRef<ChildHandle, MapPageProps>((props, ref) => {
       map_id: string;
       markers: Marker[];
       lines: Line[];
+      epoch: string;
+      seq: number;
     }) => {
       markers.current = data.markers;
       lines.current = data.lines;
+      mapEpoch.current = data.epoch;
+      lastSeq.current = data.seq;
+      // A fresh join starts without a viewport on the server side
+      lastViewport.current = null;
       draw();
     };
 
-    const handleRequestMapState = (data: {
-      map_id: string;
-      target_sid: string;
-    }) => {
-      if (mapId !== data.map_id) return;
-
-      socket.emit("send_map_state", {
-        target_sid: data.target_sid,
-        map_id: data.map_id,
-        markers: markers.current,
-        lines: lines.current,
+    // Rejoin after a dropped connection, asking only for the ops we missed
+    const handleReconnect = () => {
+      if (!mapId || lastSeq.current === null) return;
+      socket.emit("join_map_room", {
+        map_id: mapId,
+        last_seq: lastSeq.current,
+        epoch: mapEpoch.current,
       });
     };
 
     socket.on("initialize_map_state", handleInitializeMapState);
-    socket.on("request_map_state", handleRequestMapState);
+    socket.io.on("reconnect", handleReconnect);
     return () => {
       socket.off("initialize_map_state", handleInitializeMapState);
-      socket.off("request_map_state", handleRequestMapState);
+      socket.io.off("reconnect", handleReconnect);
     };
   }, [socket, mapId]);
 